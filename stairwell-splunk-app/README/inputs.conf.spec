@@ -0,0 +1,55 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# This file documents the stairwell_enrichment modular input, which enriches the indicators found
+# by a search and keeps the enrichments in a KV store collection (see collections.conf). Searches
+# can then use them with `| lookup stairwell_enrichments indicator AS <field>`, without calling
+# the Stairwell API.
+#
+
+[stairwell_enrichment://<name>]
+search = <string>
+* Search returning the indicators to enrich, such as
+  `index=edr earliest=-1h | stats count by sha256` or `| savedsearch <name>`.
+* Required.
+
+earliest = <string>
+* Earliest time of the search.
+* Default: -24h
+
+object_fields = <comma-separated list>
+hostname_fields = <comma-separated list>
+ip_fields = <comma-separated list>
+* Result fields holding file hashes, hostnames and IP addresses. At least one
+  is required.
+
+collection = <string>
+* KV store collection the enrichments are kept in.
+* Default: stairwell_enrichments
+
+max_age = <integer>
+* Seconds after which an indicator's enrichment is refreshed. Indicators with a
+  more recent entry are not looked up again.
+* Default: 86400
+
+concurrency = <integer>
+* Lookups made at the same time, between 1 and 1024.
+* Default: 8
+
+[stairwell_sidecar://<name>]
+* Runs the local enrichment service, which makes the Stairwell lookups of all
+  searches on the search head over a Unix socket, sharing connections and
+  cached enrichments between them. Only one instance runs at a time. It is
+  configured by the [sidecar] stanza of stairwell.conf.
@@ -0,0 +1,105 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# This file documents the settings of stairwell.conf. Place overrides in
+# $SPLUNK_HOME/etc/apps/stairwell-splunk-app/local/stairwell.conf.
+#
+
+[connection]
+pool_size = <integer>
+* Maximum number of connections to the Stairwell API kept open for reuse. With
+  engine=threads, at least one connection per worker thread is kept.
+* Default: 16
+
+connect_timeout = <decimal>
+* Seconds to wait for a connection to the Stairwell API to be established.
+* Default: 10
+
+read_timeout = <decimal>
+* Seconds to wait for the Stairwell API to respond once connected.
+* Default: 30
+
+keep_alive = <boolean>
+* Whether connections are reused between requests, with TCP keep-alive probes
+  while they are idle. When false, a new connection is opened for every request.
+* Default: true
+
+gzip = <boolean>
+* Whether responses are requested gzip-compressed, which mostly benefits object
+  enrichments with many variants.
+* Default: true
+
+measure = <boolean>
+* Whether to log, for every chunk of events, the number of requests made, the
+  number of connections opened and the share of requests that reused a
+  connection, to stairwell.log.
+* Default: false
+
+[telemetry]
+log = <boolean>
+* Whether to log a summary of every search that made lookups to stairwell.log:
+  lookups and requests by indicator type, cache hits and misses, errors by
+  status, bytes received, latency percentiles and time spent in each stage.
+* Default: true
+
+metrics_index = <string>
+* Name of a metrics index to also send each search's summary to, as metrics
+  named stairwell.<name>. Leave empty to only log it.
+* Default: (empty)
+
+[sidecar]
+enabled = <boolean>
+* Whether searches, and automatic lookups, make their lookups through the
+  local enrichment service (the stairwell_sidecar input) while it is running.
+  The service shares its connections and caches between all searches, and
+  makes identical lookups from concurrent searches only once. Searches make
+  their own lookups when it isn't running.
+* Default: false
+
+socket_path = <string>
+* Unix socket the enrichment service listens on.
+* Default: $SPLUNK_HOME/var/run/stairwell/enrichment.sock
+
+timeout = <decimal>
+* Seconds a search waits on each lookup made through the service before
+  deferring it.
+* Default: 120
+
+[not_found]
+enabled = <boolean>
+* Whether searches remember the indicators the Stairwell API answered with
+  "not found" (or an empty enrichment), and answer later lookups of them the
+  same way without a request. They are kept in Bloom filters under
+  $SPLUNK_HOME/var/lib/stairwell/not_found, shared by all searches, which may
+  report some indicators Stairwell knows as not found (see fp_rate). Searches
+  with cache=read use the filters without adding to them, and searches with
+  cache=none ignore them.
+* Default: false
+
+capacity = <integer>
+* Number of unknown indicators of each type that can be added per max_age / 2
+  seconds before the rate of false positives exceeds fp_rate. Each filter takes
+  about 1.44 * log2(1 / fp_rate) bits per indicator.
+* Default: 1000000
+
+fp_rate = <decimal>
+* Share of the indicators Stairwell knows that may be reported as not found,
+  between 0 and 1.
+* Default: 0.001
+
+max_age = <integer>
+* Seconds an unknown indicator is remembered for at most; it is looked up again
+  after between max_age / 2 and max_age seconds.
+* Default: 86400
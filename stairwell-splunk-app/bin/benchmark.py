@@ -0,0 +1,276 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Throughput benchmark of the stairwell command, run end to end against the mock API.
+
+Events from samples/ are scaled up to the requested number, and fed to Stairwell.stream() in
+chunks, as Splunk would. The mock API (mockapi.py) runs in its own process, so that it doesn't
+share the command's CPU or memory. For example:
+
+    python benchmark.py --records 20000 --distinct 2000 --latency 0.02 --set engine=async
+
+reports records/sec, per-record latency percentiles and peak RSS; --json prints them as a single
+JSON object instead, for comparing runs."""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from stairwell import Stairwell
+from stairwelllib.client import ConnectionSettings
+from stairwelllib.notfound import NotFoundSettings
+from stairwelllib.sidecar import SidecarSettings
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+MOCK_API = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mockapi.py")
+
+# Indicator fields of the sample events, per command option. Nested JSON fields are flattened to
+# dotted names, as Splunk extracts them.
+INDICATOR_FIELDS = {
+    "object": ["hash_sha256", "hash_md5", "event.Process.SHA256"],
+    "hostname": ["hostname", "event.HostInfo.ComputerName"],
+    "ip": ["event.HostInfo.ExternalIp", "event.HostInfo.LocalIp"],
+}
+
+# Options the command is run with, unless overridden with --set. The rate limit is off so that
+# the benchmark measures the command rather than the limit. The sample and made-up IP addresses
+# are mostly private, and are looked up anyway so that runs measure the same workload whatever
+# the default skip policy.
+DEFAULT_OPTIONS = {"ratelimit": "0", "skip": "none"}
+
+PLAIN_TEXT_FIELD = re.compile(r"(\w+): ([^,\s]+)")
+
+
+class BenchmarkResult(NamedTuple):
+    records: int
+    seconds: float
+    records_per_second: float
+    # Per-record latency, from the record being read by the command to it being written, in
+    # milliseconds.
+    p50_ms: float
+    p99_ms: float
+    peak_rss_mb: float
+    # Requests received by the mock API, by status.
+    requests: Dict[str, int]
+
+
+def flatten(event: dict, prefix: str = "") -> dict:
+    """Flattens nested JSON objects into dotted field names."""
+    fields = {}
+    for key, value in event.items():
+        if isinstance(value, dict):
+            fields.update(flatten(value, f"{prefix}{key}."))
+        else:
+            fields[prefix + key] = value
+    return fields
+
+
+def load_samples(directory: str = SAMPLES_DIR) -> List[dict]:
+    """Reads the sample events: JSON lines or `key: value` text from *.log files, and JSON
+    objects from *.json files. Each event keeps its original text as _raw."""
+    events = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8") as f:
+            if name.endswith(".json"):
+                text = f.read()
+                events.append(dict(flatten(json.loads(text)), _raw=text))
+                continue
+            if not name.endswith(".log"):
+                continue
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    fields = flatten(json.loads(line))
+                except ValueError:
+                    fields = dict(PLAIN_TEXT_FIELD.findall(line))
+                events.append(dict(fields, _raw=line))
+    return events
+
+
+def _variant(kind: str, value: str, n: int) -> str:
+    """Returns the n-th made-up indicator of the same kind and shape as value."""
+    if n == 0:
+        return value
+    digest = hashlib.sha256(f"{value}:{n}".encode()).hexdigest()
+    if kind == "object":
+        return digest[: len(value)]
+    if kind == "ip":
+        return f"10.{int(digest[:2], 16)}.{int(digest[2:4], 16)}.{int(digest[4:6], 16)}"
+    return f"h{n}.{value}"
+
+
+def scale_events(
+    samples: List[dict], count: int, distinct: Optional[int] = None
+) -> List[dict]:
+    """Builds count events by cycling through the samples. Indicators are replaced by made-up
+    ones of the same kind, so that the events hold about `distinct` distinct indicators (by
+    default, as many as there are events)."""
+    distinct = distinct or count
+    variants = max(1, distinct // max(1, len(samples)))
+    events = []
+    for i in range(count):
+        n = (i // len(samples)) % variants
+        event = dict(samples[i % len(samples)])
+        for kind, fields in INDICATOR_FIELDS.items():
+            for field in fields:
+                if field in event:
+                    event[field] = _variant(kind, str(event[field]), n)
+        events.append(event)
+    return events
+
+
+def start_mock_api(args: Iterable[str] = ()) -> Tuple[subprocess.Popen, str]:
+    """Runs mockapi.py in a separate process, returning it and its base URL."""
+    process = subprocess.Popen(
+        [sys.executable, MOCK_API, *args], stdout=subprocess.PIPE, text=True
+    )
+    return process, process.stdout.readline().strip()
+
+
+def mock_api_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url + "stats") as response:
+        return json.load(response)
+
+
+class BenchmarkStairwell(Stairwell):
+    """The command, with its credentials and settings provided rather than read from Splunk."""
+
+    def load_credentials(self) -> Tuple[str, str, str]:
+        return "token", "organization", "user"
+
+    def load_connection_settings(self) -> ConnectionSettings:
+        return ConnectionSettings()
+
+    def load_sidecar_settings(self) -> SidecarSettings:
+        return SidecarSettings()
+
+    def load_not_found_settings(self) -> NotFoundSettings:
+        return NotFoundSettings()
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(
+    base_url: str,
+    events: List[dict],
+    options: Optional[Dict[str, str]] = None,
+    chunk_size: int = 10000,
+) -> Tuple[BenchmarkResult, List[dict]]:
+    """Enriches events through the command, against the API at base_url, returning the
+    measurements and the enriched records."""
+    logger = logging.getLogger("splunk.stairwell.benchmark")
+    command = BenchmarkStairwell(custom_logger=logger)
+    command.base_url = base_url
+    with tempfile.TemporaryDirectory() as directory:
+        command.cache_path = os.path.join(directory, "cache.sqlite")
+        command.ratelimit_path = os.path.join(directory, "ratelimit")
+        present = {field for event in events for field in event}
+        for kind, fields in INDICATOR_FIELDS.items():
+            setattr(command, kind, [field for field in fields if field in present])
+        for name, value in dict(DEFAULT_OPTIONS, **(options or {})).items():
+            setattr(command, name, value)
+
+        started = time.perf_counter()
+        read_at = []
+        latencies = []
+        output = []
+
+        def timed(chunk: List[dict]):
+            for event in chunk:
+                read_at.append(time.perf_counter())
+                yield dict(event)
+
+        for i in range(0, len(events), chunk_size):
+            for record in command.stream(timed(events[i : i + chunk_size])):
+                latencies.append(time.perf_counter() - read_at[len(output)])
+                output.append(record)
+        seconds = time.perf_counter() - started
+
+    result = BenchmarkResult(
+        records=len(output),
+        seconds=seconds,
+        records_per_second=len(output) / seconds if seconds > 0 else 0.0,
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        peak_rss_mb=_peak_rss_mb(),
+        requests=mock_api_stats(base_url)["statuses"],
+    )
+    return result, output
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="Other arguments (such as --latency) are passed on to mockapi.py.",
+    )
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument(
+        "--distinct", type=int, help="distinct indicators in the events"
+    )
+    parser.add_argument("--chunk", type=int, default=10000, help="records per chunk")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="OPTION=VALUE",
+        help="command option, such as engine=async (may be repeated)",
+    )
+    parser.add_argument("--json", action="store_true")
+    args, mock_args = parser.parse_known_args()
+    options = dict(option.split("=", 1) for option in args.set)
+
+    events = scale_events(load_samples(), args.records, args.distinct)
+    process, base_url = start_mock_api(mock_args)
+    try:
+        result, _ = run_benchmark(base_url, events, options, args.chunk)
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.json:
+        print(json.dumps(result._asdict()))
+        return
+    print(f"records:     {result.records} in {result.seconds:.2f}s")
+    print(f"throughput:  {result.records_per_second:.0f} records/s")
+    print(f"latency:     p50 {result.p50_ms:.2f}ms, p99 {result.p99_ms:.2f}ms")
+    print(f"peak RSS:    {result.peak_rss_mb:.1f} MB")
+    print(f"requests:    {json.dumps(result.requests, sort_keys=True)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local stand-in for the Stairwell enrichment API, for testing and benchmarking the command over
+real HTTP. It serves the three enrichmentv1 endpoints with made-up (but well-formed) enrichments,
+and can be made slow, flaky or throttling.
+
+    python mockapi.py --port 8080 --latency 0.05 --error-rate 0.01 --throttle-rate 0.01
+
+The first line written to stdout is the server's base URL. GET /stats returns request counts.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple, Optional
+from urllib.parse import unquote
+
+ENRICHMENT_PATH = "/appapi/enrichment/v1/"
+STATS_PATH = "/stats"
+
+# Enrichment API resource of each kind of lookup, as in asyncclient.RESOURCES.
+OBJECT_RESOURCE = "object_event"
+HOSTNAME_RESOURCE = "hostname_event"
+IP_RESOURCE = "ip_event"
+
+
+class MockSettings(NamedTuple):
+    """How the mock API behaves. Rates are the share of requests (or, for not_found_rate, of
+    indicators) answered with that outcome."""
+
+    # Seconds each response is delayed by, plus up to `jitter` more.
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Share of requests failing with 503 Service Unavailable.
+    error_rate: float = 0.0
+    # Share of requests throttled with 429 Too Many Requests, asking to retry after `retry_after`
+    # (whole) seconds.
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    # Share of indicators the API knows nothing about (404 Not Found, for every request).
+    not_found_rate: float = 0.0
+    # Approximate size of enrichment bodies, in bytes, before compression.
+    payload_size: int = 2048
+    # Seed of the random outcomes, for repeatable runs.
+    seed: Optional[int] = None
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _opinions(value: str) -> list:
+    verdict = ("MALICIOUS", "BENIGN", "GRAYWARE", "NO_OPINION")[
+        int(_digest(value)[0], 16) % 4
+    ]
+    return [
+        {
+            "verdict": verdict,
+            "email": "analyst@example.com",
+            "createTime": "2025-01-07T10:00:00.123456789Z",
+            "environment": "MOCK_ENV_ID",
+        }
+    ]
+
+
+def _padding(size: int) -> list:
+    """Comments adding up to about `size` bytes of JSON."""
+    comments = []
+    while size > 0:
+        body = "x" * max(1, min(size, 200))
+        comments.append({"body": body, "environment": "MOCK_ENV_ID"})
+        size -= len(body) + 40
+    return comments
+
+
+def object_enrichment(name: str) -> dict:
+    digest = _digest(name)
+    return {
+        "opinionsMostRecent": _opinions(name),
+        "fileHashMd5": digest[:32],
+        "fileHashSha1": digest[:40],
+        "fileHashSha256": name if len(name) == 64 else digest,
+        "fileSize": str(int(digest[:6], 16)),
+        "fileEntropy": int(digest[6:8], 16) / 32,
+        "fileMagic": "PE32+ executable (GUI) x86-64, for MS Windows",
+        "fileMimeType": "application/x-dosexec",
+        "fileHashImphash": digest[8:40],
+        "fileHashTlsh": "T1" + digest[:70].upper(),
+        "sightingsFirst": "2025-01-01T10:00:00.123456789Z",
+        "sightingsPrevalence": [
+            {"assetCount": "3", "prevalence": 0.25, "environmentId": "MOCK_ENV_ID"}
+        ],
+        "signature": {
+            "x509Certificates": [
+                {
+                    "signature": digest[:16],
+                    "issuer": "CN=Mock CA",
+                    "subject": "CN=Mock Software",
+                    "earliestValidTime": "2024-01-01T00:00:00Z",
+                    "latestValidTime": "2026-01-01T00:00:00Z",
+                }
+            ],
+            "pkcs7VerificationResult": "VALID",
+        },
+        "verdictIsWellKnown": digest[0] in "01",
+        "verdictMalevalMaliciousProbability": "MALICIOUS_PROBABILITY_LOW",
+        "verdictMalevalLabels": ["mock_label"],
+        "verdictYaraRuleMatches": ["mock_rule"],
+        "indicatorsIpsLikely": [f"10.{int(digest[:2], 16)}.0.1"],
+        "indicatorsHostnamesLikely": [f"{digest[:8]}.example.com"],
+        "variants": [_digest(digest)],
+        "summaryAi": "Mock AI assessment.",
+    }
+
+
+def hostname_enrichment(name: str) -> dict:
+    digest = _digest(name)
+    records = [
+        {
+            "state": "NOERROR",
+            "address": f"10.{int(digest[:2], 16)}.{int(digest[2:4], 16)}.1",
+            "lookupTime": "2025-01-01T10:00:00Z",
+        }
+    ]
+    return {
+        "opinionsMostRecent": _opinions(name),
+        "lookupARecords": records,
+        "lookupAaaaRecords": [],
+        "lookupMxRecords": [],
+    }
+
+
+def ip_enrichment(name: str) -> dict:
+    return {
+        "opinionsMostRecent": _opinions(name),
+        "uninterestingAddr": name.startswith(("10.", "192.168.", "127.")),
+    }
+
+
+ENRICHMENTS = {
+    OBJECT_RESOURCE: object_enrichment,
+    HOSTNAME_RESOURCE: hostname_enrichment,
+    IP_RESOURCE: ip_enrichment,
+}
+
+
+class MockServer(ThreadingHTTPServer):
+    """MockServer serves the mock API on a local port (0 picks a free one)."""
+
+    daemon_threads = True
+
+    def __init__(self, settings: MockSettings = MockSettings(), port: int = 0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "bytes": 0, "statuses": {}}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def start(self) -> "MockServer":
+        """Serves requests from a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def outcome(self, name: str) -> Optional[int]:
+        """Draws the error status of a request for the given indicator, if it fails."""
+        settings = self.settings
+        if int(_digest(name)[:8], 16) / 0xFFFFFFFF < settings.not_found_rate:
+            return 404
+        with self.lock:
+            draw = self.random.random()
+        if draw < settings.throttle_rate:
+            return 429
+        if draw < settings.throttle_rate + settings.error_rate:
+            return 503
+        return None
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.settings.latency + self.random.random() * self.settings.jitter
+
+    def count(self, status: int, size: int):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            statuses = self.stats["statuses"]
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        # Clients may join the base URL and the API path with a double slash.
+        path = "/" + self.path.split("?")[0].lstrip("/")
+        if path == STATS_PATH:
+            with self.server.lock:
+                self._send(200, json.dumps(self.server.stats).encode())
+            return
+        resource, _, name = path[len(ENRICHMENT_PATH) :].partition("/")
+        enrichment = ENRICHMENTS.get(resource)
+        if not path.startswith(ENRICHMENT_PATH) or enrichment is None or not name:
+            self._send(404, b'{"code": 5, "message": "Not Found"}')
+            return
+        name = unquote(name)
+
+        time.sleep(self.server.delay())
+        status = self.server.outcome(name)
+        if status == 404:
+            body = b'{"code": 5, "message": "not found"}'
+        elif status == 429:
+            body = b'{"code": 8, "message": "rate limit exceeded"}'
+        elif status == 503:
+            body = b'{"code": 14, "message": "unavailable"}'
+        else:
+            status = 200
+            data = enrichment(name)
+            size = len(json.dumps(data))
+            if size < self.server.settings.payload_size:
+                data["commentsMostRecent"] = _padding(
+                    self.server.settings.payload_size - size
+                )
+            body = json.dumps(data).encode()
+        self._send(status, body)
+        self.server.count(status, len(body))
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if status == 429:
+            self.send_header("Retry-After", str(self.server.settings.retry_after))
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=0)
+    for field, default in MockSettings._field_defaults.items():
+        parser.add_argument(
+            "--" + field.replace("_", "-"),
+            type=type(default) if default is not None else int,
+            default=default,
+        )
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    server = MockServer(MockSettings(**args), port)
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@
 import os
 import sys
 import json
+import sqlite3
 
 # Since we need to bundle Python dependencies with the Splunk app to ensure it's portable, we need
 # to work around some packages that do not use relative imports by explicitly adding their locations
@@ -28,14 +29,113 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), "lib"))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "stairwelllib"))
 
 
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Optional
-from stairwelllib.stairwellapi import search_stairwell_ip_addresses_api
-from stairwelllib.stairwellapi import search_stairwell_object_api
-from stairwelllib.stairwellapi import search_stairwell_hostname_api
-from stairwelllib.client import StairwellAPI, StairwellEnrichmentClient
-from stairwelllib.swlogging import setup_logging
-from splunklib.searchcommands import dispatch, StreamingCommand, Configuration, Option
+from typing import List, Optional, Tuple
+from stairwelllib.stairwellapi import search_stairwell_ip_addresses_data
+from stairwelllib.stairwellapi import search_stairwell_object_data
+from stairwelllib.stairwellapi import search_stairwell_hostname_data
+from stairwelllib.stairwellapi import FieldSelection
+from stairwelllib.client import (
+    ConnectionSettings,
+    StairwellAPI,
+    StairwellEnrichmentClient,
+    CONNECTION_STANZA,
+    SETTINGS_CONF,
+    OBJECT_INDICATOR,
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+)
+from stairwelllib.budget import OutputBudget
+from stairwelllib.cache import (
+    CachingStairwellAPI,
+    LookupCache,
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_MAX_BYTES,
+)
+from stairwelllib.persistentcache import (
+    PersistentCachingStairwellAPI,
+    PersistentLookupCache,
+    CACHE_MODES,
+    CACHE_MODE_NONE,
+    CACHE_MODE_READWRITE,
+    default_cache_path,
+)
+from stairwelllib.asyncclient import (
+    AsyncStairwellAPIAdapter,
+    AsyncStairwellEnrichmentClient,
+)
+from stairwelllib.breaker import (
+    CircuitBreaker,
+    CircuitBreakingAsyncStairwellAPI,
+    CircuitBreakingStairwellAPI,
+    Deadline,
+)
+from stairwelllib.ratelimit import (
+    AdaptiveConcurrency,
+    RateGovernor,
+    RateLimitedAsyncStairwellAPI,
+    RateLimitedStairwellAPI,
+    TokenBucket,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RATE,
+    BURST_SECONDS,
+    default_ratelimit_path,
+)
+from stairwelllib.indicators import (
+    AUTO_INDICATOR,
+    IndicatorNormalizer,
+    LOCAL_CATEGORIES,
+    SKIP_NONE,
+)
+from stairwelllib.concurrency import (
+    DEFAULT_CONCURRENCY,
+    ENGINE_ASYNC,
+    ENGINE_THREADS,
+    ENGINES,
+    MAX_CONCURRENCY,
+    MAX_THREADS,
+)
+from stairwelllib.pipeline import (
+    BatchEnricher,
+    Lookup,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MAX_DISTINCT,
+)
+from stairwelllib.telemetry import (
+    MeasuringAsyncStairwellAPI,
+    MeasuringStairwellAPI,
+    Telemetry,
+    TelemetrySettings,
+    format_summary,
+    metrics_csv,
+    METRICS_SOURCETYPE,
+    TELEMETRY_STANZA,
+)
+from stairwelllib.notfound import (
+    NotFoundFilter,
+    NotFoundFilteringStairwellAPI,
+    NotFoundSettings,
+    NOT_FOUND_STANZA,
+    default_filter_path,
+)
+from stairwelllib.related import RelatedPrefetcher, RelatedPrefetchingStairwellAPI
+from stairwelllib.sidecar import (
+    SidecarSettings,
+    SidecarStairwellAPI,
+    SIDECAR_STANZA,
+    default_socket_path,
+    is_serving,
+)
+from stairwelllib.swlogging import LogSampler, setup_logging
+from splunklib.binding import HTTPError
+from splunklib.searchcommands import (
+    dispatch,
+    StreamingCommand,
+    Configuration,
+    Option,
+    validators,
+)
 
 BASE_URL = "https://app.stairwell.com/"
 
@@ -57,28 +157,451 @@ def get_encrypted_token(search_command):
 class Stairwell(StreamingCommand):
     """Class providing a streaming search command for Stairwell"""
 
-    ip = Option(require=False)
-    object = Option(require=False)
-    hostname = Option(require=False)
+    # Comma-separated names of the fields to enrich, per indicator type.
+    ip = Option(require=False, validate=validators.List())
+    object = Option(require=False, validate=validators.List())
+    hostname = Option(require=False, validate=validators.List())
+    # Fields whose values are each looked up as whichever kind of indicator (hash, IP address or
+    # hostname) they look like. Values that look like none of them are left alone.
+    auto = Option(require=False, validate=validators.List())
+    # Each of these may also be a path into the event's JSON (for example `event.Process.SHA256`,
+    # or `hashes{}.sha256` through an array), read from the named field or from `_raw`.
 
+    # Comma-separated names, or wildcard patterns, of the enrichment fields to add (for example
+    # `stairwell_object_mal_eval*`); by default all of them are. Fields that aren't selected aren't
+    # converted at all. Names are matched before fields are prefixed with the input field's name.
+    fields = Option(require=False, validate=validators.List())
+
+    # Indicators are looked up in a canonical form (hashes and hostnames in lower case, hostnames
+    # without a trailing dot and in IDNA form, IP addresses compressed) unless normalize is false.
+    # Normalized indicators in the categories listed by `skip` are answered with that
+    # stairwell_status instead of being looked up: `invalid` (malformed hashes, IP addresses and
+    # hostnames) and `private` (non-public IP addresses, and hostnames such as localhost or
+    # *.local). `skip=none` looks every indicator up.
+    normalize = Option(require=False, default=True, validate=validators.Boolean())
+    skip = Option(
+        require=False,
+        default=",".join(LOCAL_CATEGORIES),
+        validate=validators.List(validators.Set(*LOCAL_CATEGORIES, SKIP_NONE)),
+    )
+
+    # Bounds on the lookup cache kept for the lifetime of the command process. A cachesize of 0
+    # disables caching.
+    cachesize = Option(
+        require=False, default=DEFAULT_MAX_ENTRIES, validate=validators.Integer(0)
+    )
+    cachebytes = Option(
+        require=False, default=DEFAULT_MAX_BYTES, validate=validators.Integer(0)
+    )
+
+    # Use of the cache shared between searches: `none` skips it, `read` uses stored responses
+    # without adding new ones and `readwrite` does both. `maxage` ignores stored responses older
+    # than the given number of seconds.
+    cache = Option(
+        require=False,
+        default=CACHE_MODE_READWRITE,
+        validate=validators.Set(*CACHE_MODES),
+    )
+    maxage = Option(require=False, validate=validators.Integer(0))
+
+    # Maximum number of lookups made at the same time. 1 makes lookups one record at a time. The
+    # `threads` engine makes lookups from a pool of (at most 64) threads; the `async` engine makes
+    # them from a single event loop, which makes high concurrency much cheaper.
+    concurrency = Option(
+        require=False,
+        default=DEFAULT_CONCURRENCY,
+        validate=validators.Integer(1, MAX_CONCURRENCY),
+    )
+    engine = Option(
+        require=False, default=ENGINE_THREADS, validate=validators.Set(*ENGINES)
+    )
+
+    # Records are enriched in batches, each distinct indicator of a batch being looked up once. A
+    # batch ends after `batchsize` records (0 for the whole chunk Splunk sends at once), or once
+    # it holds `maxdistinct` distinct indicators (0 for no limit), whichever comes first.
+    batchsize = Option(
+        require=False, default=DEFAULT_BATCH_SIZE, validate=validators.Integer(0)
+    )
+    maxdistinct = Option(
+        require=False, default=DEFAULT_MAX_DISTINCT, validate=validators.Integer(0)
+    )
+
+    # Requests per second allowed to the Stairwell API, shared by all searches running on the
+    # search head (0 for no limit), and the number of times a throttled or failed request is
+    # retried. The number of concurrent requests is also lowered while the API is throttling.
+    ratelimit = Option(
+        require=False, default=DEFAULT_RATE, validate=validators.Float(0)
+    )
+    retries = Option(
+        require=False, default=DEFAULT_MAX_RETRIES, validate=validators.Integer(0)
+    )
+
+    # Bounds on the size of the enrichment fields added to events: lists (such as variants or
+    # prevalence) are cut to `maxitems` items, and the largest fields are left out until the
+    # rest fit in `maxbytes` bytes per event; fields shortened this way are listed in
+    # stairwell_truncated. `compact` spreads objects and lists of objects over a multivalue field
+    # per key (for example stairwell_object_variants_sha256) instead of nested JSON. 0 is no
+    # bound.
+    maxitems = Option(require=False, default=0, validate=validators.Integer(0))
+    maxbytes = Option(require=False, default=0, validate=validators.Integer(0))
+    compact = Option(require=False, default=False, validate=validators.Boolean())
+
+    # Maximum number of IP addresses and hostnames related to the enriched objects to look up in
+    # the background (0 for none), while the search's own lookups leave the API idle. They aren't
+    # added to events, but cached for the searches pivoting to them. Requires engine=threads.
+    related = Option(require=False, default=0, validate=validators.Integer(0))
+
+    # Total time, in seconds, the search may spend on lookups. Once it's spent, or while the
+    # Stairwell API keeps failing, events are passed through with stairwell_status=deferred.
+    timeout = Option(require=False, validate=validators.Float(0))
+
+    # The Stairwell API the client makes requests to.
+    base_url: str = BASE_URL
     client: Optional[StairwellAPI] = (
         None  # If None, will be intialized when the command is run
     )
+    # The client, wrapped in whichever caching layers are enabled.
+    api: Optional[StairwellAPI] = None
+    lookup_cache: Optional[LookupCache] = None
+    # Canonicalizes indicators, shared by all chunks of the search.
+    normalizer: Optional[IndicatorNormalizer] = None
+    persistent_cache: Optional[PersistentCachingStairwellAPI] = None
+    # Answers lookups of the indicators Stairwell recently didn't know, if it's enabled.
+    not_found_filter: Optional[NotFoundFilteringStairwellAPI] = None
+    # Worker threads for concurrent lookups, shared by all chunks of the search.
+    executor: Optional[ThreadPoolExecutor] = None
+    # Location of the cache shared between searches. If None, the default location is used.
+    cache_path: Optional[str] = None
+    # Location of the not-found filters shared between searches. If None, the default location
+    # is used.
+    not_found_path: Optional[str] = None
+    # Location of the rate limit shared between searches. If None, the default location is used.
+    ratelimit_path: Optional[str] = None
+    # Location of the enrichment service's socket. If set, the service is used whenever it's
+    # running, whatever stairwell.conf says.
+    sidecar_path: Optional[str] = None
+    # The enrichment service lookups are made through, if it's used.
+    sidecar: Optional[SidecarStairwellAPI] = None
+    # HTTP settings from stairwell.conf, and the client making requests with them (which may be
+    # wrapped in `client`), for reporting connection reuse.
+    connection_settings: ConnectionSettings = ConnectionSettings()
+    http_client = None
+    # Time budget of the search, and the circuit breaker guarding the API, set up with the client.
+    deadline: Optional[Deadline] = None
+    breaker: Optional[CircuitBreaker] = None
+    governor: Optional[RateGovernor] = None
+    # Looks up the indicators related to enriched objects, if the related option is set.
+    related_prefetcher: Optional[RelatedPrefetcher] = None
+    # Measurements of the search, reported once it's done.
+    telemetry: Telemetry
+    telemetry_reported: bool = False
+    # Which records are logged at debug level, across all chunks of the search.
+    debug_sampler: LogSampler
     custom_logger: Logger
 
     def init_client(self) -> StairwellAPI:
         """Initializes the Stairwell enrichment API client using values from the secrets store."""
         self.prepare()  # required to initialize `SearchCommand.service`.
-        secrets = get_encrypted_token(self)
-        secrets_json = json.loads(secrets)
-        auth_token = secrets_json["password"]
-        organization_id = secrets_json["organizationId"]
-        user_id = secrets_json["userId"]
-
-        client = StairwellEnrichmentClient(
-            BASE_URL, auth_token, organization_id, user_id, self.custom_logger
+        auth_token, organization_id, user_id = self.load_credentials()
+
+        settings = self.connection_settings = self.load_connection_settings()
+        self.deadline = Deadline(self.timeout)
+        self.breaker = CircuitBreaker(logger=self.custom_logger)
+        governor = self.governor = self.init_governor()
+        if self.engine == ENGINE_ASYNC:
+            async_client = self.http_client = AsyncStairwellEnrichmentClient(
+                self.base_url,
+                auth_token,
+                organization_id,
+                user_id,
+                self.custom_logger,
+                max_connections=self.concurrency,
+                timeout=settings.connect_timeout + settings.read_timeout,
+                keep_alive=settings.keep_alive,
+                compression=settings.gzip,
+            )
+            # Requests are measured and broken below the retries, so that each attempt counts.
+            measured = MeasuringAsyncStairwellAPI(
+                async_client, self.telemetry, "request"
+            )
+            return AsyncStairwellAPIAdapter(
+                RateLimitedAsyncStairwellAPI(
+                    CircuitBreakingAsyncStairwellAPI(
+                        measured, self.breaker, self.deadline
+                    ),
+                    governor,
+                ),
+                concurrency=self.concurrency,
+            )
+
+        # Keep a pooled connection for each worker thread, so none of them has to open its own.
+        settings = settings._replace(
+            pool_size=max(settings.pool_size, min(self.concurrency, MAX_THREADS))
+        )
+        client = self.http_client = StairwellEnrichmentClient(
+            self.base_url,
+            auth_token,
+            organization_id,
+            user_id,
+            self.custom_logger,
+            settings=settings,
+        )
+        measured = MeasuringStairwellAPI(client, self.telemetry, "request")
+        return RateLimitedStairwellAPI(
+            CircuitBreakingStairwellAPI(measured, self.breaker, self.deadline), governor
+        )
+
+    def connect_sidecar(self) -> Optional[StairwellAPI]:
+        """Returns a client of the enrichment service, if it's enabled and running."""
+        if self.sidecar_path:
+            settings = SidecarSettings(enabled=True, socket_path=self.sidecar_path)
+        else:
+            self.prepare()
+            settings = self.load_sidecar_settings()
+        path = settings.socket_path or default_socket_path()
+        if not settings.enabled or not path:
+            return None
+        if not is_serving(path):
+            self.custom_logger.info(
+                "Enrichment service not running at %s, making lookups directly", path
+            )
+            return None
+        self.custom_logger.info(
+            "Making lookups through the enrichment service at %s", path
+        )
+        # The service applies its own rate limit and retries, but the search's time budget and
+        # breaker still bound how long the search waits on it.
+        self.deadline = Deadline(self.timeout)
+        self.breaker = CircuitBreaker(logger=self.custom_logger)
+        self.sidecar = SidecarStairwellAPI(
+            path, timeout=settings.timeout, time_left=self.deadline.remaining
+        )
+        return CircuitBreakingStairwellAPI(self.sidecar, self.breaker, self.deadline)
+
+    def load_credentials(self) -> Tuple[str, str, str]:
+        """Reads the API token, organization ID and user ID from the secrets store."""
+        secrets_json = json.loads(get_encrypted_token(self))
+        return (
+            secrets_json["password"],
+            secrets_json["organizationId"],
+            secrets_json["userId"],
+        )
+
+    def load_connection_settings(self) -> ConnectionSettings:
+        """Reads the HTTP settings from the [connection] stanza of stairwell.conf."""
+        try:
+            stanza = self.service.confs[SETTINGS_CONF][CONNECTION_STANZA]
+            return ConnectionSettings.from_conf(stanza.content)
+        except (KeyError, ValueError, HTTPError) as e:
+            self.custom_logger.warning(
+                "Using default connection settings, as %s.conf [%s] could not be read: %s",
+                SETTINGS_CONF,
+                CONNECTION_STANZA,
+                e,
+            )
+            return ConnectionSettings()
+
+    def load_sidecar_settings(self) -> SidecarSettings:
+        """Reads the enrichment service settings from the [sidecar] stanza of stairwell.conf."""
+        try:
+            stanza = self.service.confs[SETTINGS_CONF][SIDECAR_STANZA]
+            return SidecarSettings.from_conf(stanza.content)
+        except (KeyError, ValueError, HTTPError) as e:
+            self.custom_logger.warning(
+                "Not using the enrichment service, as %s.conf [%s] could not be read: %s",
+                SETTINGS_CONF,
+                SIDECAR_STANZA,
+                e,
+            )
+            return SidecarSettings()
+
+    def load_not_found_settings(self) -> NotFoundSettings:
+        """Reads the not-found filter settings from the [not_found] stanza of stairwell.conf."""
+        try:
+            stanza = self.service.confs[SETTINGS_CONF][NOT_FOUND_STANZA]
+            return NotFoundSettings.from_conf(stanza.content)
+        except (KeyError, ValueError, HTTPError) as e:
+            self.custom_logger.warning(
+                "Not skipping unknown indicators, as %s.conf [%s] could not be read: %s",
+                SETTINGS_CONF,
+                NOT_FOUND_STANZA,
+                e,
+            )
+            return NotFoundSettings()
+
+    def load_telemetry_settings(self) -> TelemetrySettings:
+        """Reads the telemetry settings from the [telemetry] stanza of stairwell.conf."""
+        try:
+            stanza = self.service.confs[SETTINGS_CONF][TELEMETRY_STANZA]
+            return TelemetrySettings.from_conf(stanza.content)
+        except (KeyError, ValueError, HTTPError) as e:
+            self.custom_logger.warning(
+                "Using default telemetry settings, as %s.conf [%s] could not be read: %s",
+                SETTINGS_CONF,
+                TELEMETRY_STANZA,
+                e,
+            )
+            return TelemetrySettings()
+
+    def init_governor(self) -> RateGovernor:
+        """Sets up the rate limit and retries applied to requests to the Stairwell API."""
+        bucket = None
+        if self.ratelimit > 0:
+            path = self.ratelimit_path or default_ratelimit_path()
+            try:
+                bucket = TokenBucket(
+                    self.ratelimit, self.ratelimit * BURST_SECONDS, path=path
+                )
+            except OSError as e:
+                self.custom_logger.warning("Shared rate limit unavailable: %s", e)
+                bucket = TokenBucket(self.ratelimit, self.ratelimit * BURST_SECONDS)
+        return RateGovernor(
+            bucket,
+            AdaptiveConcurrency(self.concurrency),
+            max_retries=self.retries,
+            logger=self.custom_logger,
+            time_left=self.deadline.remaining if self.deadline else None,
+            circuit_open=self.breaker.rejecting if self.breaker else None,
         )
-        return client
+
+    def init_api(self, client: StairwellAPI) -> StairwellAPI:
+        """Wraps the client in the caching layers enabled by the command's options: the filters
+        of unknown indicators and the shared on-disk cache first, then the in-process cache in
+        front of them. The enrichment service keeps the shared ones itself, so they're skipped
+        when lookups go through the service.
+        """
+        api = client
+
+        if self.cache != CACHE_MODE_NONE and self.sidecar is None:
+            api = self.init_not_found_filter(api)
+
+        path = self.cache_path or default_cache_path()
+        if self.cache != CACHE_MODE_NONE and path and self.sidecar is None:
+            try:
+                store = PersistentLookupCache(path, logger=self.custom_logger)
+                api = self.persistent_cache = PersistentCachingStairwellAPI(
+                    api, store, mode=self.cache, max_age=self.maxage
+                )
+            except (OSError, sqlite3.Error) as e:
+                self.custom_logger.warning("Persistent cache unavailable: %s", e)
+
+        if self.cachesize > 0:
+            self.lookup_cache = LookupCache(
+                max_entries=self.cachesize, max_bytes=self.cachebytes
+            )
+            api = CachingStairwellAPI(api, self.lookup_cache)
+
+        if self.related > 0:
+            if isinstance(client, AsyncStairwellAPIAdapter):
+                # The adapter's event loop can only be driven from the search's own thread.
+                self.custom_logger.warning(
+                    "Related indicators are only looked up with engine=threads"
+                )
+            else:
+                self.related_prefetcher = RelatedPrefetcher(
+                    api, self.related, busy=self.api_busy, logger=self.custom_logger
+                )
+                api = RelatedPrefetchingStairwellAPI(api, self.related_prefetcher)
+
+        return MeasuringStairwellAPI(api, self.telemetry, "lookup")
+
+    def init_not_found_filter(self, api: StairwellAPI) -> StairwellAPI:
+        """Wraps api in the filters of unknown indicators, if they're enabled in stairwell.conf."""
+        path = self.not_found_path or default_filter_path()
+        if not path or self.service is None:
+            # Without a connection to Splunk (when the client was given), there are no settings.
+            return api
+        settings = self.load_not_found_settings()
+        if not settings.enabled:
+            return api
+        try:
+            store = NotFoundFilter(
+                path,
+                capacity=settings.capacity,
+                fp_rate=settings.fp_rate,
+                max_age=settings.max_age,
+                logger=self.custom_logger,
+            )
+        except (OSError, ValueError) as e:
+            self.custom_logger.warning("Not-found filter unavailable: %s", e)
+            return api
+        self.not_found_filter = NotFoundFilteringStairwellAPI(
+            api, store, mode=self.cache
+        )
+        return self.not_found_filter
+
+    def api_busy(self) -> bool:
+        """Reports whether requests to the Stairwell API are in flight."""
+        return self.governor is not None and self.governor.concurrency.in_flight > 0
+
+    def init_lookups(self) -> List[Lookup]:
+        """Builds the lookups requested by the ip, object and hostname options. When more than one
+        field is enriched, each field's output fields are namespaced by the field's name.
+        """
+        requested = []
+        for fields, kind, search in (
+            (self.ip, IP_INDICATOR, search_stairwell_ip_addresses_data),
+            (self.object, OBJECT_INDICATOR, search_stairwell_object_data),
+            (self.hostname, HOSTNAME_INDICATOR, search_stairwell_hostname_data),
+            (self.auto, AUTO_INDICATOR, None),
+        ):
+            for field in fields or []:
+                if field != "":
+                    requested.append((kind, field, search))
+        if len(requested) == 0:
+            self.custom_logger.error("No input field specified")
+            raise ValueError("No input field specified")
+
+        namespace = len(requested) > 1
+        return [
+            Lookup(kind, field, search, field if namespace else None)
+            for kind, field, search in requested
+        ]
+
+    def telemetry_summary(self) -> dict:
+        """Summarizes the search's telemetry, along with the caches' and connections' counts."""
+        summary = self.telemetry.summary()
+        if self.lookup_cache is not None:
+            summary["cache.hits"] = self.lookup_cache.hits
+            summary["cache.misses"] = self.lookup_cache.misses
+            summary["cache.evictions"] = self.lookup_cache.evictions
+        if self.persistent_cache is not None:
+            summary["persistent_cache.hits"] = self.persistent_cache.hits
+            summary["persistent_cache.misses"] = self.persistent_cache.misses
+        if self.not_found_filter is not None:
+            summary["not_found.skipped"] = self.not_found_filter.skipped
+            summary["not_found.added"] = self.not_found_filter.added
+        if self.related_prefetcher is not None:
+            summary["related.queued"] = self.related_prefetcher.queued
+            summary["related.looked_up"] = self.related_prefetcher.looked_up
+            summary["related.dropped"] = self.related_prefetcher.dropped
+        if self.http_client is not None:
+            stats = self.http_client.connection_stats()
+            summary["connections"] = stats.connections
+            summary["bytes_received"] = stats.response_bytes
+        return {name: summary[name] for name in sorted(summary)}
+
+    def report_telemetry(self):
+        """Logs the search's telemetry and, if a metrics index is configured, sends it there. Only
+        searches that made lookups are reported, and only once."""
+        if self.telemetry_reported or self.api is None:
+            return
+        self.telemetry_reported = True
+        logger = self.custom_logger
+        try:
+            settings = self.load_telemetry_settings()
+            summary = self.telemetry_summary()
+            if settings.log:
+                logger.info("Stairwell - telemetry %s", format_summary(summary))
+            if settings.metrics_index:
+                self.service.indexes[settings.metrics_index].submit(
+                    metrics_csv(summary),
+                    sourcetype=METRICS_SOURCETYPE,
+                    source="stairwell",
+                )
+        except Exception as e:
+            # Telemetry is best effort, and must not fail a search that has otherwise succeeded.
+            logger.warning("Stairwell - telemetry could not be reported: %s", e)
 
     def __init__(
         self,
@@ -90,6 +613,20 @@ class Stairwell(StreamingCommand):
             custom_logger = setup_logging()
         self.custom_logger = custom_logger
         self.client = client
+        self.telemetry = Telemetry()
+        self.debug_sampler = LogSampler()
+        # Apply option defaults, in case the command is driven without parsing arguments.
+        self.options.reset()
+
+    def _execute(self, ifile, process):
+        # stream() is called once per chunk, so the telemetry of the whole search is reported once
+        # the last chunk has been processed.
+        try:
+            super()._execute(ifile, process)
+        finally:
+            if self.related_prefetcher is not None:
+                self.related_prefetcher.close()
+            self.report_telemetry()
 
     def stream(self, records):
         logger = self.custom_logger
@@ -97,68 +634,68 @@ class Stairwell(StreamingCommand):
 
         # Unless we're injecting a double, we want to initialize the client here as doing so earlier
         # does not give us access to credentials stored via Splunk's secret storage.
+        if self.client == None:
+            self.client = self.connect_sidecar()
         if self.client == None:
             logger.info("Initializing Stairwell API client...")
             self.client = self.init_client()
 
-        arg_counter = 0
-        if self.ip and len(self.ip) != 0:
-            arg_counter += 1
-            ip_field = self.ip
-        if self.object and len(self.object) != 0:
-            arg_counter += 1
-            object_field = self.object
-        if self.hostname and len(self.hostname) != 0:
-            arg_counter += 1
-            hostname_field = self.hostname
-        if arg_counter == 0:
-            logger.error("No input field specified")
-            raise ValueError("No input field specified")
-        elif arg_counter > 1:
-            logger.error("Multiple inputs received")
-            raise ValueError("Multiple inputs received")
-
-        for record in records:
-            logger.debug("record before = %s", record)
-            if "ip_field" in locals() and ip_field in record and record[ip_field] != "":
-                # Send request to Stairwell API
-                response_dictionary = search_stairwell_ip_addresses_api(
-                    self.client, logger, record[ip_field]
-                )
-                for key, value in response_dictionary.items():
-                    record[key] = value
-
-            elif (
-                "object_field" in locals()
-                and object_field in record
-                and record[object_field] != ""
-            ):
-                # Send request to Stairwell API
-                response_dictionary = search_stairwell_object_api(
-                    self.client, logger, record[object_field]
-                )
-                for key, value in response_dictionary.items():
-                    record[key] = value
-
-            elif (
-                "hostname_field" in locals()
-                and hostname_field in record
-                and record[hostname_field] != ""
-            ):
-                # Send request to Stairwell API
-                response_dictionary = search_stairwell_hostname_api(
-                    self.client, logger, record[hostname_field]
-                )
-                for key, value in response_dictionary.items():
-                    record[key] = value
+        # stream() is called once per chunk, so the caches are only set up on the first one and
+        # then reused for the rest of the search.
+        if self.api == None:
+            self.api = self.init_api(self.client)
+
+        lookups = self.init_lookups()
+        if self.normalize and self.normalizer == None:
+            self.normalizer = IndicatorNormalizer(self.skip or ())
 
-            logger.debug("record after = %s", record)
+        # The async engine's adapter already fans lookups out on its event loop, so worker threads
+        # are only needed for the thread engine, or when lookups go through the service.
+        workers = min(self.concurrency, MAX_THREADS)
+        threaded = self.engine == ENGINE_THREADS or self.sidecar is not None
+        if threaded and workers > 1 and self.executor == None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="stairwell"
+            )
+        enricher = BatchEnricher(
+            self.api,
+            logger,
+            lookups,
+            executor=self.executor,
+            workers=workers,
+            batch_size=self.batchsize,
+            max_distinct=self.maxdistinct,
+            fields=FieldSelection(self.fields) if self.fields else None,
+            telemetry=self.telemetry,
+            debug_sampler=self.debug_sampler,
+            normalizer=self.normalizer,
+            budget=OutputBudget(self.maxitems, self.maxbytes, self.compact),
+        )
 
+        # Time spent suspended at `yield` is time Splunk's library spends writing the record.
+        telemetry = self.telemetry
+        clock = telemetry.clock
+        started = clock()
+        writing = 0.0
+        for record in enricher.enrich(records):
+            suspended = clock()
             try:
                 yield record
             except StopIteration:
                 logger.error("Stairwell - stream - received StopIteration")
                 return
+            writing += clock() - suspended
+        telemetry.count("stage.write", writing)
+        telemetry.count("stage.stream", clock() - started)
+
+        if self.connection_settings.measure and self.http_client is not None:
+            stats = self.http_client.connection_stats()
+            logger.info(
+                "Stairwell - connections: requests=%d connections=%d reuse_rate=%.3f",
+                stats.requests,
+                stats.connections,
+                stats.reuse_rate,
+            )
 
         logger.info("Stairwell - stream - exit")
 
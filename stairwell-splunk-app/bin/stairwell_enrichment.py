@@ -0,0 +1,216 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Modular input keeping Stairwell enrichments of the indicators found by a search in a KV store
+collection. Each run enriches the indicators whose entries are missing or older than max_age, and
+leaves the others alone."""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "lib"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "stairwelllib"))
+
+from logging import Logger
+from typing import Dict, Iterable, List, Set
+from stairwell import Stairwell
+from stairwelllib.client import OBJECT_INDICATOR, HOSTNAME_INDICATOR, IP_INDICATOR
+from stairwelllib.concurrency import DEFAULT_CONCURRENCY, MAX_CONCURRENCY
+from stairwelllib.materialize import (
+    collect_indicators,
+    collection_entry,
+    entry_key,
+    fresh_keys,
+    is_settled,
+    save_entries,
+    DEFAULT_COLLECTION,
+)
+from stairwelllib.swlogging import setup_logging
+from splunklib.modularinput import Argument, Scheme, Script
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+DEFAULT_EARLIEST = "-24h"
+
+# The input's options naming the result fields that hold each kind of indicator.
+FIELD_OPTIONS = {
+    OBJECT_INDICATOR: "object_fields",
+    HOSTNAME_INDICATOR: "hostname_fields",
+    IP_INDICATOR: "ip_fields",
+}
+
+
+class InputStairwell(Stairwell):
+    """The stairwell command's API stack (client, rate limit, circuit breaker and caches), driven
+    by the modular input with its Splunk session rather than by a search."""
+
+    def __init__(self, service, logger: Logger):
+        super().__init__(custom_logger=logger)
+        self._input_service = service
+
+    @property
+    def service(self):
+        return self._input_service
+
+    def enrich(self, kind: str, values: Iterable[str]) -> Iterable[dict]:
+        """Enriches indicators of one kind, yielding a record per indicator."""
+        for option in FIELD_OPTIONS:
+            # The command's ip, object and hostname options.
+            setattr(self, option, ["indicator"] if option == kind else None)
+        return self.stream({"indicator": value} for value in values)
+
+
+def search_query(search: str) -> str:
+    search = search.strip()
+    return search if search.startswith(("|", "search ")) else "search " + search
+
+
+def split_fields(value: str) -> List[str]:
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class StairwellEnrichmentInput(Script):
+    def get_scheme(self) -> Scheme:
+        scheme = Scheme("Stairwell enrichments")
+        scheme.description = (
+            "Keeps Stairwell enrichments of the indicators found by a search in a KV store "
+            "collection."
+        )
+        scheme.use_external_validation = True
+        scheme.use_single_instance = False
+        scheme.add_argument(
+            Argument(
+                "search",
+                description="Search returning the indicators, for example "
+                "`index=edr | stats count by sha256` or `| savedsearch <name>`.",
+                required_on_create=True,
+            )
+        )
+        scheme.add_argument(
+            Argument(
+                "earliest",
+                description=f"Earliest time of the search (default {DEFAULT_EARLIEST}).",
+            )
+        )
+        for kind, option in FIELD_OPTIONS.items():
+            scheme.add_argument(
+                Argument(
+                    option,
+                    description=f"Comma-separated result fields holding {kind} indicators.",
+                )
+            )
+        scheme.add_argument(
+            Argument(
+                "collection",
+                description=f"KV store collection to keep enrichments in (default "
+                f"{DEFAULT_COLLECTION}).",
+            )
+        )
+        scheme.add_argument(
+            Argument(
+                "max_age",
+                description="Seconds after which an indicator's enrichment is refreshed "
+                f"(default {DEFAULT_MAX_AGE}).",
+                data_type=Argument.data_type_number,
+            )
+        )
+        scheme.add_argument(
+            Argument(
+                "concurrency",
+                description=f"Lookups made at the same time (default {DEFAULT_CONCURRENCY}).",
+                data_type=Argument.data_type_number,
+            )
+        )
+        return scheme
+
+    def validate_input(self, definition):
+        parameters = definition.parameters
+        if not any(split_fields(parameters.get(o)) for o in FIELD_OPTIONS.values()):
+            raise ValueError(
+                "At least one of object_fields, hostname_fields or ip_fields is required"
+            )
+        concurrency = int(parameters.get("concurrency") or DEFAULT_CONCURRENCY)
+        if not 1 <= concurrency <= MAX_CONCURRENCY:
+            raise ValueError(f"concurrency must be between 1 and {MAX_CONCURRENCY}")
+        if float(parameters.get("max_age") or DEFAULT_MAX_AGE) < 0:
+            raise ValueError("max_age must not be negative")
+
+    def stream_events(self, inputs, ew):
+        logger = setup_logging()
+        for name, parameters in inputs.inputs.items():
+            try:
+                self.materialize(parameters, logger)
+            except Exception as e:
+                logger.error("Stairwell - input %s failed: %s", name, e)
+                ew.log(ew.ERROR, f"{name}: {e}")
+
+    def init_command(self, logger: Logger) -> InputStairwell:
+        return InputStairwell(self.service, logger)
+
+    def materialize(self, parameters: dict, logger: Logger):
+        """Runs the input's search, and enriches the indicators it finds that aren't fresh in the
+        collection."""
+        fields: Dict[str, List[str]] = {
+            kind: split_fields(parameters.get(option))
+            for kind, option in FIELD_OPTIONS.items()
+        }
+        collection = self.service.kvstore[
+            parameters.get("collection") or DEFAULT_COLLECTION
+        ].data
+        max_age = float(parameters.get("max_age") or DEFAULT_MAX_AGE)
+
+        response = self.service.jobs.oneshot(
+            search_query(parameters["search"]),
+            earliest_time=parameters.get("earliest") or DEFAULT_EARLIEST,
+            latest_time="now",
+            output_mode="json",
+            count=0,
+        )
+        indicators = collect_indicators(json.load(response)["results"], fields)
+
+        started = time.time()
+        fresh: Set[str] = fresh_keys(collection, started - max_age)
+        command = self.init_command(logger)
+        command.concurrency = int(parameters.get("concurrency") or DEFAULT_CONCURRENCY)
+        # Entries are saved as updated now, so they mustn't come from older cached responses.
+        command.maxage = max_age
+        saved = 0
+        looked_up = 0
+        for kind, values in indicators.items():
+            stale = [v for v in sorted(values) if entry_key(kind, v) not in fresh]
+            if not stale:
+                continue
+            looked_up += len(stale)
+            saved += save_entries(
+                collection,
+                (
+                    collection_entry(kind, record["indicator"], record, started)
+                    for record in command.enrich(kind, stale)
+                    if is_settled(record)
+                ),
+            )
+        command.report_telemetry()
+        logger.info(
+            "Stairwell - input: indicators=%d looked_up=%d saved=%d",
+            sum(len(values) for values in indicators.values()),
+            looked_up,
+            saved,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(StairwellEnrichmentInput().run(sys.argv))
@@ -0,0 +1,172 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""External lookup script for Stairwell enrichments, for use in automatic lookups.
+
+Splunk runs it as `stairwell_lookup.py <kind> <field>` (see transforms.conf) with a CSV of the
+events' values on stdin. The whole CSV is read at once, each distinct value of <field> is looked
+up once, and the table is written back with the enrichment columns filled in."""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "lib"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "stairwelllib"))
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from typing import List, Optional, TextIO
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.client import StairwellAPI, StairwellDataAPI
+from stairwelllib.concurrency import DEFAULT_CONCURRENCY, MAX_THREADS
+from stairwelllib.indicators import IndicatorNormalizer
+from stairwelllib.persistentcache import (
+    PersistentCachingStairwellAPI,
+    PersistentLookupCache,
+    CACHE_MODE_READ,
+    default_cache_path,
+)
+from stairwelllib.pipeline import BatchEnricher, Lookup
+from stairwelllib.sidecar import SidecarStairwellAPI, default_socket_path, is_serving
+from stairwelllib.stairwellapi import DATA_SEARCHES, FieldSelection
+from stairwelllib.swlogging import setup_logging
+
+
+class SharedCacheOnlyAPI(StairwellDataAPI):
+    """SharedCacheOnlyAPI stands in for the Stairwell API when the lookup can't reach it: external
+    lookups aren't given a Splunk session, so they can't read the API token, and the enrichment
+    service isn't running. Lookups of indicators that aren't in the shared cache are deferred.
+    """
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        raise LookupDeferred("not in the shared cache")
+
+
+def csv_value(value) -> str:
+    """Formats a record field as a CSV cell: lists and objects as JSON, missing values as empty
+    cells and other values as text."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class StairwellLookup:
+    """StairwellLookup fills in the Stairwell enrichment columns of a lookup table, for the
+    indicators of the given kind held in its `field` column. Only the columns Splunk asks for
+    (the lookup's fields_list) are produced. Lookups are made through `api`, by default the cache
+    shared with the stairwell command. If normalizer is given, indicators are looked up in their
+    canonical form, as the command does."""
+
+    def __init__(
+        self,
+        kind: str,
+        field: str,
+        logger: Logger,
+        api: Optional[StairwellAPI] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        cache_path: Optional[str] = None,
+        normalizer: Optional[IndicatorNormalizer] = None,
+    ):
+        if kind not in DATA_SEARCHES:
+            raise ValueError(f"Unrecognized indicator type: {kind}")
+        self.kind = kind
+        self.field = field
+        self.logger = logger
+        self.api = api
+        self.concurrency = concurrency
+        self.cache_path = cache_path
+        self.normalizer = normalizer
+
+    def init_api(self) -> StairwellAPI:
+        """Reads enrichments from the shared cache, in front of `api` if one was given."""
+        api = self.api or SharedCacheOnlyAPI()
+        path = self.cache_path or default_cache_path()
+        if path:
+            try:
+                store = PersistentLookupCache(path, logger=self.logger)
+                return PersistentCachingStairwellAPI(api, store, mode=CACHE_MODE_READ)
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning("Persistent cache unavailable: %s", e)
+        return api
+
+    def run(self, ifile: TextIO, ofile: TextIO):
+        reader = csv.DictReader(ifile)
+        columns: List[str] = list(reader.fieldnames or [])
+        if self.field not in columns:
+            raise ValueError(f"Lookup input has no {self.field} column")
+        rows = list(reader)
+
+        api = self.init_api()
+        workers = min(self.concurrency, MAX_THREADS)
+        executor = None
+        if self.api is not None and workers > 1:
+            executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="stairwell"
+            )
+        try:
+            # A single batch, so that each distinct value of the table is looked up only once.
+            enricher = BatchEnricher(
+                api,
+                self.logger,
+                [Lookup(self.kind, self.field, DATA_SEARCHES[self.kind], None)],
+                executor=executor,
+                workers=workers,
+                batch_size=0,
+                max_distinct=0,
+                fields=FieldSelection(columns),
+                normalizer=self.normalizer,
+            )
+            writer = csv.DictWriter(
+                ofile, columns, extrasaction="ignore", lineterminator="\n"
+            )
+            writer.writeheader()
+            writer.writerows(
+                {column: csv_value(value) for column, value in record.items()}
+                for record in enricher.enrich(rows)
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+
+def main(argv: List[str] = sys.argv[1:]):
+    if len(argv) != 2:
+        sys.stderr.write("Usage: stairwell_lookup.py <object|hostname|ip> <field>\n")
+        sys.exit(1)
+    kind, field = argv
+    logger = setup_logging()
+    try:
+        # Without a session, the lookup can only reach the API through the enrichment service.
+        api = None
+        path = default_socket_path()
+        if path and is_serving(path):
+            api = SidecarStairwellAPI(path)
+        lookup = StairwellLookup(
+            kind, field, logger, api=api, normalizer=IndicatorNormalizer()
+        )
+        lookup.run(sys.stdin, sys.stdout)
+    except Exception as e:
+        logger.error("Stairwell lookup failed: %s", e)
+        raise
+
+
+if __name__ == "__main__":
+    main()
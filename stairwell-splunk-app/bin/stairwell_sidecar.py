@@ -0,0 +1,91 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Modular input running the local enrichment service (see stairwelllib/sidecar.py). Splunk
+starts it with the search head, and restarts it every interval if it has exited; a run that finds
+the service already running exits straight away."""
+
+import errno
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "lib"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "stairwelllib"))
+
+from logging import Logger
+from stairwell_enrichment import InputStairwell
+from stairwelllib.client import StairwellAPI
+from stairwelllib.concurrency import MAX_THREADS
+from stairwelllib.sidecar import (
+    CoalescingStairwellAPI,
+    SidecarServer,
+    default_socket_path,
+    is_serving,
+)
+from stairwelllib.swlogging import setup_logging
+from splunklib.modularinput import Scheme, Script
+
+
+class StairwellSidecarInput(Script):
+    def get_scheme(self) -> Scheme:
+        scheme = Scheme("Stairwell enrichment service")
+        scheme.description = (
+            "Makes the Stairwell lookups of all searches on this search head, sharing "
+            "connections and cached enrichments between them."
+        )
+        scheme.use_external_validation = False
+        scheme.use_single_instance = True
+        return scheme
+
+    def init_command(self, logger: Logger) -> InputStairwell:
+        command = InputStairwell(self.service, logger)
+        # Each connection to the service is served by its own thread, making its own requests.
+        command.concurrency = MAX_THREADS
+        return command
+
+    def init_api(self, command: InputStairwell) -> StairwellAPI:
+        """The command's API stack, with identical concurrent lookups made once."""
+        command.client = command.init_client()
+        command.api = command.init_api(command.client)
+        return CoalescingStairwellAPI(command.api)
+
+    def stream_events(self, inputs, ew):
+        logger = setup_logging()
+        command = self.init_command(logger)
+        path = command.load_sidecar_settings().socket_path or default_socket_path()
+        if not path:
+            logger.error("Stairwell - enrichment service has no socket path")
+            return
+        if is_serving(path):
+            logger.info("Stairwell - enrichment service already running at %s", path)
+            return
+        try:
+            # Another run may have started the service in the meantime.
+            server = SidecarServer(path, self.init_api(command), logger)
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                logger.info(
+                    "Stairwell - enrichment service already running at %s", path
+                )
+                return
+            raise
+        logger.info("Stairwell - enrichment service listening at %s", path)
+        with server:
+            server.serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(StairwellSidecarInput().run(sys.argv))
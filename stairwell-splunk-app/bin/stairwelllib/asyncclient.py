@@ -0,0 +1,383 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""asyncio client for the Stairwell enrichment API, and an adapter exposing it as a
+StairwellAPI."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import ssl
+from abc import ABC, abstractmethod
+from logging import Logger
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from stairwelllib.client import (
+    ConnectionStats,
+    StairwellDataAPI,
+    OBJECT_INDICATOR,
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+    api_exception,
+    response_from_data,
+)
+from stairwelllib.lazyimport import LazyModule, appapi
+
+# Only the async engine needs asyncio, which is slow to import.
+asyncio = LazyModule("asyncio")
+
+if TYPE_CHECKING:
+    from stairwell_appapi_client import (
+        ObjectEventEnrichment,
+        HostnameEventEnrichment,
+        IPEventEnrichment,
+    )
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_TIMEOUT = 30.0
+
+USER_AGENT = "stairwell-splunk-app"
+
+# Enrichment API resource of each kind of lookup.
+RESOURCES = {
+    OBJECT_INDICATOR: "object_event",
+    HOSTNAME_INDICATOR: "hostname_event",
+    IP_INDICATOR: "ip_event",
+}
+
+
+class AsyncStairwellAPI(ABC):
+    """AsyncStairwellAPI is the asyncio counterpart of StairwellAPI."""
+
+    @abstractmethod
+    async def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        """Makes a request to the object enrichment API with the provided hash. May throw an
+        ApiException if an error is encountered."""
+        pass
+
+    @abstractmethod
+    async def get_hostname_event_enrichment(
+        self, hostname: str
+    ) -> HostnameEventEnrichment:
+        """Makes a request to the hostname enrichment API with the provided hostname. May throw an
+        ApiException if an error is encountered."""
+        pass
+
+    @abstractmethod
+    async def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        """Makes a request to the IP address enrichment API with the provided IP address. May throw
+        an ApiException if an error is encountered."""
+        pass
+
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        """Looks up an indicator of the given kind, returning the response as the API's JSON. The
+        default makes the lookup through the model methods and converts the model back.
+        """
+        if kind == OBJECT_INDICATOR:
+            return (await self.get_object_event_enrichment(value)).to_dict()
+        if kind == HOSTNAME_INDICATOR:
+            return (await self.get_hostname_event_enrichment(value)).to_dict()
+        if kind == IP_INDICATOR:
+            return (await self.get_ip_event_enrichment(value)).to_dict()
+        raise ValueError(f"Unrecognized indicator kind: {kind}")
+
+    async def close(self):
+        """Releases any connections held by the client."""
+        pass
+
+
+class AsyncStairwellDataAPI(AsyncStairwellAPI):
+    """AsyncStairwellDataAPI is the asyncio counterpart of StairwellDataAPI."""
+
+    @abstractmethod
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        pass
+
+    async def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        return response_from_data(
+            OBJECT_INDICATOR, await self.get_enrichment_data(OBJECT_INDICATOR, hash)
+        )
+
+    async def get_hostname_event_enrichment(
+        self, hostname: str
+    ) -> HostnameEventEnrichment:
+        return response_from_data(
+            HOSTNAME_INDICATOR,
+            await self.get_enrichment_data(HOSTNAME_INDICATOR, hostname),
+        )
+
+    async def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        return response_from_data(
+            IP_INDICATOR, await self.get_enrichment_data(IP_INDICATOR, ip)
+        )
+
+
+class _Response:
+    __slots__ = ("status", "reason", "headers", "body", "keep_alive")
+
+    def __init__(self, status, reason, headers, body, keep_alive):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+class AsyncStairwellEnrichmentClient(AsyncStairwellDataAPI):
+    """AsyncStairwellEnrichmentClient interacts with the Stairwell enrichment API over a pool of
+    keep-alive HTTP/1.1 connections, using only the standard library. Requests beyond the number
+    of pooled connections wait for one to become free. The client must only be used from a single
+    event loop."""
+
+    # Logger to output debug messages through (optional).
+    logger: Optional[Logger] = None
+
+    def __init__(
+        self,
+        base_url: str,
+        auth_token: str,
+        organization_id: str,
+        user_id: str = "",
+        logger: Optional[Logger] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        timeout: float = DEFAULT_TIMEOUT,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        keep_alive: bool = True,
+        compression: bool = True,
+    ):
+        url = urlsplit(base_url)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.base_path = url.path.rstrip("/")
+        self.ssl = None
+        if url.scheme == "https":
+            self.ssl = ssl_context or ssl.create_default_context()
+        self.headers = {
+            "Host": url.netloc,
+            "Accept": "application/json",
+            "Authorization": auth_token,
+            "Organization-Id": organization_id,
+            "User-Id": user_id,
+            "User-Agent": USER_AGENT,
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        if compression:
+            self.headers["Accept-Encoding"] = "gzip"
+        self.max_connections = max_connections
+        self.timeout = timeout
+        if logger:
+            self.logger = logger
+
+        # Idle connections, most recently used last. The semaphore (created on first use, so that
+        # it belongs to the running loop) bounds the number of open connections.
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._requests = 0
+        self._connections = 0
+        self._response_bytes = 0
+
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return await self._get_json(RESOURCES[kind], value)
+
+    def connection_stats(self) -> ConnectionStats:
+        """Returns the number of requests made so far and connections opened to make them."""
+        return ConnectionStats(self._requests, self._connections, self._response_bytes)
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _get_json(self, resource: str, name: str) -> dict:
+        if self.logger:
+            self.logger.debug("req: async %s(%s)", resource, name)
+        path = (
+            f"{self.base_path}/appapi/enrichment/v1/{resource}/{quote(name, safe='')}"
+        )
+        try:
+            response = await asyncio.wait_for(self._get(path), self.timeout)
+        except asyncio.TimeoutError:
+            raise appapi.ApiException(status=0, reason=f"request timed out: GET {path}")
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            raise appapi.ApiException(status=0, reason=f"{type(e).__name__}: {e}")
+
+        if not 200 <= response.status <= 299:
+            e = api_exception(response.status, response.reason)
+            e.headers = response.headers
+            e.body = response.body.decode("utf-8", errors="replace")
+            raise e
+        return json.loads(response.body)
+
+    async def _get(self, path: str) -> _Response:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        async with self._slots:
+            while True:
+                # A pooled connection may have been closed by the server since it was last used,
+                # in which case the request moves on to the next idle connection, or a new one.
+                reused = len(self._idle) > 0
+                if reused:
+                    reader, writer = self._idle.pop()
+                else:
+                    reader, writer = await asyncio.open_connection(
+                        self.host,
+                        self.port,
+                        ssl=self.ssl,
+                        server_hostname=self.host if self.ssl else None,
+                    )
+                    self._connections += 1
+                try:
+                    response = await self._send(reader, writer, path)
+                except (OSError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    # Including cancellation on timeout, which leaves the connection mid-response.
+                    writer.close()
+                    raise
+                self._requests += 1
+                self._response_bytes += len(response.body)
+                self._release(reader, writer, response)
+                return response
+
+    def _release(self, reader, writer, response: _Response):
+        if response.keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def _send(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str
+    ) -> _Response:
+        request = f"GET {path} HTTP/1.1\r\n"
+        for name, value in self.headers.items():
+            request += f"{name}: {value}\r\n"
+        writer.write((request + "\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        version, status, reason = (
+            status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""]
+        )[:3]
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        if headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+
+        return _Response(int(status), reason, headers, body, keep_alive)
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        body = bytearray()
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip any trailers.
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+
+class AsyncStairwellAPIAdapter(StairwellDataAPI):
+    """AsyncStairwellAPIAdapter presents an AsyncStairwellAPI as a StairwellAPI, running requests
+    on an event loop owned by the adapter. Indicators passed to prefetch() are queued, and all of
+    them (of every kind) are looked up concurrently on that loop, up to `concurrency` at a time,
+    as soon as one of them is needed; the following synchronous calls for them then return
+    immediately. Outcomes not claimed by then are dropped when the next prefetched lookups run,
+    so that they're only used for the batch they were prefetched for. Lookups that weren't
+    prefetched run one at a time."""
+
+    api: AsyncStairwellAPI
+
+    def __init__(self, api: AsyncStairwellAPI, concurrency: int = 256):
+        self.api = api
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        # Prefetched indicators not looked up yet (a dict is used as an ordered set).
+        self._queued: Dict[Tuple[str, str], None] = {}
+        # Outcomes of the last prefetched lookups, as (response, exception) pairs, until they are
+        # claimed.
+        self._prefetched: Dict[
+            Tuple[str, str], Tuple[Optional[dict], Optional[Exception]]
+        ] = {}
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        for value in values:
+            self._queued[(kind, value)] = None
+
+    def _run_queued(self):
+        queued = list(self._queued)
+        self._queued.clear()
+
+        async def fetch_all():
+            slots = asyncio.Semaphore(self.concurrency)
+
+            async def fetch_one(kind: str, value: str):
+                async with slots:
+                    try:
+                        return await self.api.get_enrichment_data(kind, value), None
+                    except Exception as e:
+                        return None, e
+
+            return await asyncio.gather(
+                *(fetch_one(kind, value) for kind, value in queued)
+            )
+
+        outcomes = self.loop.run_until_complete(fetch_all())
+        self._prefetched = dict(zip(queued, outcomes))
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        if self._queued:
+            self._run_queued()
+        outcome = self._prefetched.pop((kind, value), None)
+        if outcome is None:
+            return self.loop.run_until_complete(
+                self.api.get_enrichment_data(kind, value)
+            )
+        response, error = outcome
+        if error is not None:
+            raise error
+        return response
+
+    def close(self):
+        if not self.loop.is_closed():
+            self.loop.run_until_complete(self.api.close())
+            self.loop.close()
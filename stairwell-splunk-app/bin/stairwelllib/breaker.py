@@ -0,0 +1,254 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Circuit breaking and time budgets for Stairwell enrichment lookups, so that a slow or
+unreachable API can't stall a search."""
+
+import threading
+import time
+from logging import Logger
+from typing import Any, Callable, Iterable, Optional
+from stairwelllib.asyncclient import AsyncStairwellAPI, AsyncStairwellDataAPI
+from stairwelllib.client import StairwellAPI, StairwellDataAPI
+from stairwelllib.ratelimit import is_retryable
+from stairwelllib.lazyimport import LazyModule
+
+# Used by the asyncio counterparts only, so the thread engine never imports it.
+asyncio = LazyModule("asyncio")
+
+# The stairwell_status of records whose lookups were skipped.
+DEFERRED_STATUS = "deferred"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# The breaker opens after this many consecutive failed or slow lookups...
+DEFAULT_FAILURE_THRESHOLD = 5
+# ...where a lookup taking longer than this many seconds counts as slow...
+DEFAULT_SLOW_CALL = 10.0
+# ...and stays open for this many seconds before letting a single lookup through as a probe.
+DEFAULT_RESET_TIMEOUT = 30.0
+
+
+class LookupDeferred(Exception):
+    """Raised instead of making a lookup while the circuit is open or the search's time budget is
+    spent. The record is passed through with stairwell_status=deferred. It carries the same
+    attributes as an ApiException, without needing the generated client to be loaded."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.status = DEFERRED_STATUS
+        self.reason = reason
+        self.body = None
+        self.headers = None
+
+    def __str__(self):
+        return f"({self.status})\nReason: {self.reason}\n"
+
+
+class Deadline:
+    """Deadline tracks a search's total time budget for lookups, from the moment it's created. A
+    budget of None never runs out."""
+
+    def __init__(
+        self,
+        budget: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.budget = budget
+        self.clock = clock
+        self.started = clock()
+
+    def remaining(self) -> float:
+        if self.budget is None:
+            return float("inf")
+        return max(0.0, self.started + self.budget - self.clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """CircuitBreaker stops lookups after `failure_threshold` consecutive failures or slow calls
+    (opening the circuit). Once `reset_timeout` seconds have passed, a single lookup is let through
+    (half-opening it): the circuit closes again if it succeeds, and re-opens if it doesn't. Only
+    errors suggesting an unhealthy API count as failures; "not found" and the like don't, nor does
+    throttling, which the rate limiter deals with.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        slow_call: float = DEFAULT_SLOW_CALL,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        logger: Optional[Logger] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.logger = logger
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Reports whether a lookup may be made now. If it returns True, record() must be called
+        with the lookup's outcome."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def rejecting(self) -> bool:
+        """Reports whether allow() would return False now, without letting a probe through."""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self._opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._probing
+
+    def record(self, duration: float, error: Optional[Exception] = None):
+        failed = duration > self.slow_call or (
+            error is not None and is_retryable(error) and error.status != 429
+        )
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._transition(OPEN if failed else CLOSED)
+            elif not failed:
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == CLOSED and self.failures >= self.failure_threshold:
+                    self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state == OPEN:
+            self._opened_at = self.clock()
+            self.opened += 1
+        if state == CLOSED:
+            self.failures = 0
+        if self.logger:
+            self.logger.warning("circuit breaker %s -> %s", self.state, state)
+        self.state = state
+
+
+def _deferral(breaker: CircuitBreaker, deadline: Deadline) -> Optional[LookupDeferred]:
+    if deadline.expired():
+        return LookupDeferred("search time budget spent")
+    if not breaker.allow():
+        return LookupDeferred("Stairwell API unavailable (circuit open)")
+    return None
+
+
+class CircuitBreakingStairwellAPI(StairwellDataAPI):
+    """CircuitBreakingStairwellAPI makes lookups through another StairwellAPI while its
+    CircuitBreaker allows and the Deadline isn't spent, and raises LookupDeferred otherwise. It
+    goes below the rate limiter, so that each attempt is timed on its own, without the waits for
+    the rate limit and between retries.
+    """
+
+    api: StairwellAPI
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        breaker: CircuitBreaker,
+        deadline: Deadline,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.api = api
+        self.breaker = breaker
+        self.deadline = deadline
+        self.clock = clock
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return self._call(self.api.get_enrichment_data, kind, value)
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        if self.breaker.state == CLOSED and not self.deadline.expired():
+            self.api.prefetch(kind, values)
+
+    def _call(self, fetch: Callable[[str, str], Any], kind: str, value: str) -> Any:
+        deferral = _deferral(self.breaker, self.deadline)
+        if deferral is not None:
+            raise deferral
+        started = self.clock()
+        try:
+            response = fetch(kind, value)
+        except Exception as e:
+            self.breaker.record(self.clock() - started, e)
+            raise
+        self.breaker.record(self.clock() - started)
+        return response
+
+
+class CircuitBreakingAsyncStairwellAPI(AsyncStairwellDataAPI):
+    """CircuitBreakingAsyncStairwellAPI is the asyncio counterpart of CircuitBreakingStairwellAPI.
+    Lookups still in flight when the Deadline runs out are cancelled and deferred."""
+
+    api: AsyncStairwellAPI
+
+    def __init__(
+        self,
+        api: AsyncStairwellAPI,
+        breaker: CircuitBreaker,
+        deadline: Deadline,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.api = api
+        self.breaker = breaker
+        self.deadline = deadline
+        self.clock = clock
+
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return await self._call(self.api.get_enrichment_data, kind, value)
+
+    async def close(self):
+        await self.api.close()
+
+    async def _call(
+        self, fetch: Callable[[str, str], Any], kind: str, value: str
+    ) -> Any:
+        deferral = _deferral(self.breaker, self.deadline)
+        if deferral is not None:
+            raise deferral
+        started = self.clock()
+        remaining = self.deadline.remaining()
+        try:
+            response = await asyncio.wait_for(
+                fetch(kind, value), None if remaining == float("inf") else remaining
+            )
+        except asyncio.TimeoutError:
+            # Out of time rather than a sign of an unhealthy API, unless the call was slow.
+            self.breaker.record(self.clock() - started)
+            raise LookupDeferred("search time budget spent")
+        except Exception as e:
+            self.breaker.record(self.clock() - started, e)
+            raise
+        self.breaker.record(self.clock() - started)
+        return response
@@ -0,0 +1,118 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Bounds on the size of the enrichment fields added to each record."""
+
+import json
+from typing import Any, Dict, List
+
+# Field listing the enrichment fields that were shortened or left out to fit the bounds.
+TRUNCATED_FIELD = "stairwell_truncated"
+
+# Fields that are never left out: those reporting errors, and the ones added by the pipeline.
+PROTECTED_FIELDS = frozenset(
+    ("stairwell_error", "stairwell_status", "stairwell_indicator_type", TRUNCATED_FIELD)
+)
+
+
+def field_size(value: Any) -> int:
+    """Approximates the number of bytes a field's value takes in a search result."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list) and all(not isinstance(v, (list, dict)) for v in value):
+        # A multivalue field.
+        return sum(len(str(item)) + 1 for item in value)
+    if isinstance(value, (list, dict)):
+        return len(json.dumps(value, separators=(",", ":"), default=str))
+    return len(str(value))
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    return "" if value is None else value
+
+
+def compacted(fields: dict) -> dict:
+    """Replaces fields holding objects, or lists of objects, with a multivalue field per key of
+    the objects (`<field>_<key>`), whose n-th values come from the n-th object. Values that are
+    themselves nested are given as JSON."""
+    compact = {}
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            value = [value]
+        elif not (isinstance(value, list) and any(isinstance(v, dict) for v in value)):
+            compact[name] = value
+            continue
+        items = [item if isinstance(item, dict) else {} for item in value]
+        keys = dict.fromkeys(key for item in items for key in item)
+        for key in keys:
+            compact[f"{name}_{key}"] = [_scalar(item.get(key)) for item in items]
+    return compact
+
+
+class OutputBudget:
+    """OutputBudget shortens the enrichment fields of an indicator: lists are cut to max_items
+    items, objects are spread over multivalue fields if compact is set, and the largest fields are
+    then left out until the rest fit within the given number of bytes. The names of the fields
+    shortened or left out are listed in stairwell_truncated. A bound of 0 is no bound; max_bytes
+    bounds each record, and is shared by the indicators enriching it."""
+
+    def __init__(self, max_items: int = 0, max_bytes: int = 0, compact: bool = False):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.compact = compact
+
+    def __bool__(self) -> bool:
+        return bool(self.max_items or self.max_bytes or self.compact)
+
+    def apply(self, fields: dict, shares: int = 1) -> dict:
+        """Returns the fields within the bounds, the record's max_bytes being split evenly between
+        the given number of indicators."""
+        truncated: List[str] = []
+        if self.max_items > 0:
+            shortened = {}
+            for name, value in fields.items():
+                if isinstance(value, list) and len(value) > self.max_items:
+                    value = value[: self.max_items]
+                    truncated.append(name)
+                shortened[name] = value
+            fields = shortened
+        if self.compact:
+            fields = compacted(fields)
+
+        max_bytes = self.max_bytes // max(1, shares)
+        if max_bytes > 0:
+            sizes: Dict[str, int] = {
+                name: field_size(value) for name, value in fields.items()
+            }
+            total = sum(sizes.values())
+            if total > max_bytes:
+                fields = dict(fields)
+                for name in sorted(sizes, key=sizes.get, reverse=True):
+                    if total <= max_bytes:
+                        break
+                    if name in PROTECTED_FIELDS:
+                        continue
+                    del fields[name]
+                    total -= sizes[name]
+                    truncated.append(name)
+
+        if truncated:
+            fields = dict(fields)
+            fields[TRUNCATED_FIELD] = truncated
+        return fields
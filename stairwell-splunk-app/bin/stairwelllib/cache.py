@@ -0,0 +1,301 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""In-process memoization of Stairwell enrichment lookups."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Iterable, List, Optional
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.client import StairwellAPI, StairwellDataAPI, OBJECT_INDICATOR
+from stairwelllib.lazyimport import appapi
+
+if TYPE_CHECKING:
+    from stairwell_appapi_client import ApiException
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Lifetimes, in seconds, of cached lookups. Successful lookups are kept for as long as the cache
+# has room for them, while empty ("not found") and failed lookups expire quickly so that a
+# transient error doesn't stick for the remainder of a long search.
+DEFAULT_TTL = None
+DEFAULT_NEGATIVE_TTL = 300.0
+DEFAULT_ERROR_TTL = 30.0
+
+# JSON fields of an object enrichment holding the object's hashes. Any of them can be looked up,
+# and the enrichment is cached under the last one present (normally the SHA-256).
+OBJECT_HASH_FIELDS = ("fileHashMd5", "fileHashSha1", "fileHashSha256")
+
+# Rough per-entry bookkeeping overhead (key tuple, entry object, OrderedDict node), in bytes.
+ENTRY_OVERHEAD = 256
+
+
+def estimate_size(value: Any) -> int:
+    """Approximates the memory held by a cached response, using the length of its JSON encoding
+    as a proxy."""
+    if isinstance(value, BaseException):
+        return ENTRY_OVERHEAD + len(str(value))
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    try:
+        return ENTRY_OVERHEAD + len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return ENTRY_OVERHEAD
+
+
+def is_negative_response(response: Any) -> bool:
+    """Reports whether an enrichment response carries no data at all, which is what the API
+    returns for indicators Stairwell has never seen."""
+    data = response.to_dict() if hasattr(response, "to_dict") else response
+    if not data:
+        return True
+    return all(value in (None, "", [], {}) for value in data.values())
+
+
+def object_hashes(response: Any) -> List[str]:
+    """Returns the hashes (in lower case) of an object enrichment given as JSON, the one it is
+    cached under last."""
+    if not isinstance(response, dict):
+        return []
+    hashes = []
+    for field in OBJECT_HASH_FIELDS:
+        value = response.get(field)
+        if isinstance(value, str) and value:
+            hashes.append(value.lower())
+    return hashes
+
+
+class HashAliases:
+    """HashAliases maps each hash of the objects looked up to the hash their enrichment is cached
+    under, so that an MD5, SHA-1 or SHA-256 lookup of the same object finds the same entry. It
+    holds at most max_entries aliases, forgetting the least recently added first, and is safe to
+    share between threads."""
+
+    def __init__(self, max_entries: int = 3 * DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def resolve(self, value: str) -> str:
+        return self._aliases.get(value.lower(), value)
+
+    def add(self, hashes: List[str]):
+        """Records that the given hashes (as returned by object_hashes) identify the same
+        object."""
+        if len(hashes) < 2 or self.max_entries <= 0:
+            return
+        key = hashes[-1]
+        with self._lock:
+            for alias in hashes[:-1]:
+                self._aliases[alias] = key
+                self._aliases.move_to_end(alias)
+            while len(self._aliases) > self.max_entries:
+                self._aliases.popitem(last=False)
+
+
+class CacheEntry:
+    """A single cached lookup: either a response or the ApiException raised for it."""
+
+    __slots__ = ("value", "error", "expires", "size")
+
+    def __init__(
+        self,
+        value: Any,
+        error: Optional[ApiException],
+        expires: Optional[float],
+        size: int,
+    ):
+        self.value = value
+        self.error = error
+        self.expires = expires
+        self.size = size
+
+
+class LookupCache:
+    """LookupCache is a bounded least-recently-used cache with per-entry expiry. It is bounded
+    both by number of entries and by the approximate number of bytes held. It is safe to share
+    between threads."""
+
+    max_entries: int
+    max_bytes: int
+
+    # Running totals, mostly useful for logging and tests.
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Returns the live entry for key, or None if there isn't one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires is not None and entry.expires <= self.clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def contains(self, key: Hashable) -> bool:
+        """Reports whether key has a live entry, without counting it as a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (
+                entry.expires is None or entry.expires > self.clock()
+            )
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any = None,
+        error: Optional[ApiException] = None,
+        ttl: Optional[float] = None,
+    ):
+        """Stores a response (or the error raised in place of one) under key, expiring after ttl
+        seconds if given. Least recently used entries are evicted to stay within bounds.
+        """
+        if self.max_entries <= 0:
+            return
+        size = estimate_size(error if error is not None else value)
+        if size > self.max_bytes:
+            return
+        expires = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, error, expires, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+class CachingStairwellAPI(StairwellDataAPI):
+    """CachingStairwellAPI memoizes lookups made through another StairwellAPI, so that repeated
+    indicators within (and across chunks of) a search only cost one request. ApiExceptions are
+    cached and re-raised on later lookups of the same indicator. Responses are cached as JSON.
+    Object enrichments are cached under one of their hashes, and found through `aliases` when
+    looked up by another."""
+
+    api: StairwellAPI
+    cache: LookupCache
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        cache: LookupCache,
+        ttl: Optional[float] = DEFAULT_TTL,
+        negative_ttl: Optional[float] = DEFAULT_NEGATIVE_TTL,
+        error_ttl: Optional[float] = DEFAULT_ERROR_TTL,
+        aliases: Optional[HashAliases] = None,
+    ):
+        self.api = api
+        self.cache = cache
+        self.aliases = aliases or HashAliases(3 * cache.max_entries)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return self._lookup(kind, value)
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        self.api.prefetch(
+            kind,
+            [
+                value
+                for value in values
+                if not self.cache.contains(self._key(kind, value))
+            ],
+        )
+
+    def _key(self, kind: str, value: str) -> tuple:
+        if kind == OBJECT_INDICATOR:
+            return (kind, self.aliases.resolve(value))
+        return (kind, value)
+
+    def _lookup(self, kind: str, value: str) -> dict:
+        key = self._key(kind, value)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.error is not None:
+                # Drop the traceback of the original raise, so it doesn't grow with every hit.
+                raise entry.error.with_traceback(None)
+            return entry.value
+
+        try:
+            response = self.api.get_enrichment_data(kind, value)
+        except LookupDeferred:
+            # Not an answer from the API: the lookup is made again once it's allowed.
+            raise
+        except appapi.ApiException as e:
+            ttl = self.negative_ttl if e.status == 404 else self.error_ttl
+            self.cache.put(key, error=e, ttl=ttl)
+            raise
+
+        if is_negative_response(response):
+            self.cache.put(key, response, ttl=self.negative_ttl)
+            return response
+        if kind == OBJECT_INDICATOR:
+            hashes = object_hashes(response)
+            if hashes:
+                self.aliases.add(hashes)
+                key = (kind, hashes[-1])
+        self.cache.put(key, response, ttl=self.ttl)
+        return response
@@ -1,14 +1,118 @@
+from __future__ import annotations
+
+import json
+import socket
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Iterable, NamedTuple, Optional
 from logging import Logger
-from stairwell_appapi_client import (
-    ApiClient,
-    ObjectEventEnrichment,
-    IPEventEnrichment,
-    HostnameEventEnrichment,
-    Enrichmentv1Api,
-    Configuration,
-)
+from stairwelllib.lazyimport import appapi, urllib3
+
+if TYPE_CHECKING:
+    from stairwell_appapi_client import (
+        ApiException,
+        ObjectEventEnrichment,
+        IPEventEnrichment,
+        HostnameEventEnrichment,
+        Enrichmentv1Api,
+    )
+
+# Indicator kinds, used to key cached and batched lookups.
+OBJECT_INDICATOR = "object"
+HOSTNAME_INDICATOR = "hostname"
+IP_INDICATOR = "ip"
+
+# Names of the response models of each kind of lookup.
+RESPONSE_TYPES = {
+    OBJECT_INDICATOR: "ObjectEventEnrichment",
+    HOSTNAME_INDICATOR: "HostnameEventEnrichment",
+    IP_INDICATOR: "IPEventEnrichment",
+}
+
+
+def response_from_data(kind: str, data: dict) -> Any:
+    """Builds the response model of a kind of lookup from the API's JSON."""
+    return getattr(appapi, RESPONSE_TYPES[kind]).from_dict(data)
+
+
+def api_exception(status: int, reason: str) -> ApiException:
+    """Builds the same ApiException subclass the OpenAPI-generated client raises for a status."""
+    exceptions = appapi.exceptions
+    if status == 400:
+        return exceptions.BadRequestException(status=status, reason=reason)
+    if status == 401:
+        return exceptions.UnauthorizedException(status=status, reason=reason)
+    if status == 403:
+        return exceptions.ForbiddenException(status=status, reason=reason)
+    if status == 404:
+        return exceptions.NotFoundException(status=status, reason=reason)
+    if 500 <= status <= 599:
+        return exceptions.ServiceException(status=status, reason=reason)
+    return exceptions.ApiException(status=status, reason=reason)
+
+
+# Generated client methods returning the raw response to each kind of lookup.
+DATA_REQUESTS = {
+    OBJECT_INDICATOR: "enrichmentv1_get_object_event_enrichment_v1_with_http_info",
+    HOSTNAME_INDICATOR: "enrichmentv1_get_hostname_event_enrichment_v1_with_http_info",
+    IP_INDICATOR: "enrichmentv1_get_ip_event_enrichment_v1_with_http_info",
+}
+
+# Name of the app configuration file and stanza holding the HTTP connection settings.
+SETTINGS_CONF = "stairwell"
+CONNECTION_STANZA = "connection"
+
+
+def conf_bool(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "t", "yes", "y", "on")
+
+
+class ConnectionSettings(NamedTuple):
+    """HTTP settings for requests to the Stairwell API, configured in the [connection] stanza of
+    stairwell.conf."""
+
+    # Maximum number of connections kept open to the API.
+    pool_size: int = 16
+    # Seconds to wait for a connection to be established, and then for a response.
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    # Whether connections are reused between requests (with TCP keep-alive probes while idle).
+    keep_alive: bool = True
+    # Whether responses are requested gzip-compressed.
+    gzip: bool = True
+    # Whether to log how well connections are reused, at the end of each chunk of events.
+    measure: bool = False
+
+    @classmethod
+    def from_conf(cls, stanza: dict) -> "ConnectionSettings":
+        """Reads settings from a conf stanza, falling back to the defaults for missing keys."""
+        defaults = cls()
+        return cls(
+            pool_size=int(stanza.get("pool_size", defaults.pool_size)),
+            connect_timeout=float(
+                stanza.get("connect_timeout", defaults.connect_timeout)
+            ),
+            read_timeout=float(stanza.get("read_timeout", defaults.read_timeout)),
+            keep_alive=conf_bool(stanza.get("keep_alive", defaults.keep_alive)),
+            gzip=conf_bool(stanza.get("gzip", defaults.gzip)),
+            measure=conf_bool(stanza.get("measure", defaults.measure)),
+        )
+
+
+class ConnectionStats(NamedTuple):
+    """Counts of requests made, of connections opened to make them, and of the (uncompressed)
+    bytes of response bodies received."""
+
+    requests: int = 0
+    connections: int = 0
+    response_bytes: int = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        """The share of requests made over an already open connection."""
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
 
 
 class StairwellAPI(ABC):
@@ -32,15 +136,58 @@ class StairwellAPI(ABC):
         an ApiException if an error is encountered."""
         pass
 
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        """Looks up an indicator of the given kind, returning the response as the API's JSON
+        (camelCase field names) rather than as a model. May throw an ApiException if an error is
+        encountered. The default makes the lookup through the model methods and converts the
+        model back; implementations receiving JSON return it without building the model.
+        """
+        if kind == OBJECT_INDICATOR:
+            return self.get_object_event_enrichment(value).to_dict()
+        if kind == HOSTNAME_INDICATOR:
+            return self.get_hostname_event_enrichment(value).to_dict()
+        if kind == IP_INDICATOR:
+            return self.get_ip_event_enrichment(value).to_dict()
+        raise ValueError(f"Unrecognized indicator kind: {kind}")
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        """Announces lookups of the given kind that are about to be made, so that implementations
+        able to make them concurrently can do so ahead of time. The default does nothing.
+        """
+        pass
+
+
+class StairwellDataAPI(StairwellAPI):
+    """StairwellDataAPI is a StairwellAPI implemented in terms of get_enrichment_data, for
+    implementations that handle responses as JSON. The model methods build models from it.
+    """
+
+    @abstractmethod
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        pass
+
+    def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        return response_from_data(
+            OBJECT_INDICATOR, self.get_enrichment_data(OBJECT_INDICATOR, hash)
+        )
+
+    def get_hostname_event_enrichment(self, hostname: str) -> HostnameEventEnrichment:
+        return response_from_data(
+            HOSTNAME_INDICATOR, self.get_enrichment_data(HOSTNAME_INDICATOR, hostname)
+        )
+
+    def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        return response_from_data(
+            IP_INDICATOR, self.get_enrichment_data(IP_INDICATOR, ip)
+        )
+
 
 class StairwellEnrichmentClient(StairwellAPI):
     """StairwellEnrichmentClient interacts with the Stairwell enrichment API, using the configured
-    base URL, retries and timeout values. It also performs optional debug logging.
+    base URL, retries and timeout values. It also performs optional debug logging. The generated
+    REST client is only loaded and set up when the first request is made.
     """
 
-    # OpenAPI-generated REST client for the Enrichment service:
-    client: Enrichmentv1Api
-
     # Logger to output debug messages through (optional).
     logger: Logger
 
@@ -54,35 +201,99 @@ class StairwellEnrichmentClient(StairwellAPI):
         organization_id: str,
         user_id: str = "",
         logger: Optional[Logger] = None,
+        settings: Optional[ConnectionSettings] = None,
     ):
-        client = ApiClient(
-            configuration=Configuration(
-                host=base_url,
-                api_key={"AuthToken": auth_token},
-            ),
+        self.base_url = base_url
+        self.settings = settings or ConnectionSettings()
+        self.timeout = (self.settings.connect_timeout, self.settings.read_timeout)
+        self._credentials = (auth_token, organization_id, user_id)
+        self._client: Optional[Enrichmentv1Api] = None
+        self._response_bytes = 0
+        self._lock = threading.Lock()
+
+        if logger:
+            self.logger = logger
+
+    @property
+    def client(self) -> Enrichmentv1Api:
+        """The OpenAPI-generated REST client for the Enrichment service."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> Enrichmentv1Api:
+        settings = self.settings
+        auth_token, organization_id, user_id = self._credentials
+        configuration = appapi.Configuration(
+            host=self.base_url,
+            api_key={"AuthToken": auth_token},
+        )
+        configuration.connection_pool_maxsize = settings.pool_size
+        if settings.keep_alive:
+            configuration.socket_options = [
+                (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        client = appapi.ApiClient(
+            configuration=configuration,
             header_name="Organization-Id",
             header_value=organization_id,
         )
         client.set_default_header("User-Id", user_id)
-        self.client = Enrichmentv1Api(client)
-
-        if logger:
-            self.logger = logger
+        if settings.gzip:
+            # urllib3 decompresses the response body transparently.
+            client.set_default_header("Accept-Encoding", "gzip")
+        if not settings.keep_alive:
+            client.set_default_header("Connection", "close")
+        return appapi.Enrichmentv1Api(client)
 
     def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
-        self.logger.debug(f"req: get_object_event_enrichment({hash})")
-        return self.client.enrichmentv1_get_object_event_enrichment_v1(
-            name=hash,
+        self.logger.debug("req: get_object_event_enrichment(%s)", hash)
+        return self._request(
+            self.client.enrichmentv1_get_object_event_enrichment_v1, hash
         )
 
     def get_hostname_event_enrichment(self, hostname: str) -> HostnameEventEnrichment:
-        self.logger.debug(f"req: get_hostname_event_enrichment({hostname})")
-        return self.client.enrichmentv1_get_hostname_event_enrichment_v1(
-            name=hostname,
+        self.logger.debug("req: get_hostname_event_enrichment(%s)", hostname)
+        return self._request(
+            self.client.enrichmentv1_get_hostname_event_enrichment_v1, hostname
         )
 
     def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
-        self.logger.debug(f"req: get_ip_event_enrichment({ip})")
-        return self.client.enrichmentv1_get_ip_event_enrichment_v1(
-            name=ip,
+        self.logger.debug("req: get_ip_event_enrichment(%s)", ip)
+        return self._request(self.client.enrichmentv1_get_ip_event_enrichment_v1, ip)
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        self.logger.debug("req: get_enrichment_data(%s, %s)", kind, value)
+        # Without preloading, the body is returned as is instead of being parsed into a model.
+        response = self._request(
+            getattr(self.client, DATA_REQUESTS[kind]), value, _preload_content=False
         )
+        with self._lock:
+            self._response_bytes += len(response.raw_data)
+        return json.loads(response.raw_data)
+
+    def _request(self, request, value: str, **kwargs) -> Any:
+        """Makes a request with a generated client method. Requests that fail without a response
+        (connection refused, timeouts, urllib3's retries exhausted) raise an ApiException with
+        status 0, as the async client's do, so they are retried and count against the circuit
+        breaker like other unavailability."""
+        try:
+            return request(name=value, _request_timeout=self.timeout, **kwargs)
+        except (OSError, urllib3.exceptions.HTTPError) as e:
+            raise appapi.ApiException(status=0, reason=f"{type(e).__name__}: {e}")
+
+    def connection_stats(self) -> ConnectionStats:
+        """Returns the number of requests made so far and connections opened to make them."""
+        if self._client is None:
+            return ConnectionStats()
+        pools = self._client.api_client.rest_client.pool_manager.pools
+        requests = connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+        return ConnectionStats(requests, connections, self._response_bytes)
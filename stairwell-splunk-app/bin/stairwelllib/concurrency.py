@@ -0,0 +1,59 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Helpers for running enrichment lookups concurrently."""
+
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Deque, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Values accepted by the command's `engine` option: lookups are either spread over a pool of
+# worker threads, or made from a single asyncio event loop.
+ENGINE_THREADS = "threads"
+ENGINE_ASYNC = "async"
+ENGINES = (ENGINE_THREADS, ENGINE_ASYNC)
+
+DEFAULT_CONCURRENCY = 8
+MAX_CONCURRENCY = 1024
+# Threads are much more expensive than coroutines, so the thread engine is capped lower.
+MAX_THREADS = 64
+
+
+def ordered_map(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_pending: int,
+) -> Iterator[R]:
+    """Applies fn to each item on the executor, yielding results in the order of items.
+
+    Unlike Executor.map, items are consumed lazily: at most max_pending calls are submitted ahead
+    of the result being yielded, which bounds both memory use and the number of requests in flight.
+    An exception raised by fn is re-raised when its result is reached, after which any calls that
+    haven't started yet are cancelled."""
+    pending: Deque[Future] = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
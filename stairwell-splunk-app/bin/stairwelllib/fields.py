@@ -0,0 +1,116 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Reading the values of record fields given as paths into nested JSON, as spath would extract
+them, without a separate spath stage."""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+# Field holding the event's original text, which paths are read from when no field matches.
+RAW_FIELD = "_raw"
+
+
+def parse_path(path: str) -> Tuple[str, ...]:
+    """Splits a path such as `event.Process.SHA256` or `hashes{}.sha256` into its keys. As in
+    spath, `{}` marks an array, whose elements are all followed."""
+    return tuple(key[:-2] if key.endswith("{}") else key for key in path.split("."))
+
+
+def _parse_json(value: Any) -> Any:
+    """Parses JSON text; other values (including text that isn't JSON) come back as None."""
+    if isinstance(value, str) and value.lstrip()[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return None
+
+
+def walk(value: Any, keys: Tuple[str, ...]) -> Any:
+    """Follows keys into nested dicts, through every element of the lists on the way. Returns a
+    single value, a list of them if a list was crossed, or None if nothing was found."""
+    found: List[Any] = []
+    _walk(value, keys, found)
+    if not found:
+        return None
+    crossed_list = len(found) > 1 or isinstance(found[0], list)
+    values = [item for value in found for item in _items(value)]
+    if crossed_list:
+        return values
+    return values[0] if values else None
+
+
+def _walk(value: Any, keys: Tuple[str, ...], found: List[Any]):
+    if isinstance(value, list):
+        for item in value:
+            _walk(item, keys, found)
+    elif not keys:
+        if value is not None:
+            found.append(value)
+    elif isinstance(value, dict) and keys[0] in value:
+        _walk(value[keys[0]], keys[1:], found)
+
+
+def _items(value: Any) -> List[Any]:
+    """Flattens a found value into field values: lists into their items, and scalars into text.
+    Objects have no value of their own."""
+    if isinstance(value, list):
+        return [item for element in value for item in _items(element)]
+    if isinstance(value, dict):
+        return []
+    if isinstance(value, bool):
+        return [str(value).lower()]
+    return [value if isinstance(value, str) else str(value)]
+
+
+class FieldReader:
+    """FieldReader reads record fields by name or by path. A name that is a field of the record
+    is read as is. Otherwise, a dotted path is looked up in the longest field of the record that
+    its beginning names (either holding nested values, or JSON text), and failing that in the
+    JSON of the record's `_raw` (also reachable explicitly, as `_raw.<path>`). Each record's JSON
+    is parsed at most once, until clear() is called."""
+
+    def __init__(self):
+        # Fields' names split at dots, and the keys of their paths.
+        self._paths: Dict[str, Tuple[List[str], Tuple[str, ...]]] = {}
+        # Parsed JSON fields, by (id of the record, field name). The records must outlive it.
+        self._parsed: Dict[Tuple[int, str], Any] = {}
+
+    def clear(self):
+        self._parsed.clear()
+
+    def get(self, record: dict, field: str) -> Any:
+        value = record.get(field)
+        if value is not None or "." not in field:
+            return value
+        split = self._paths.get(field)
+        if split is None:
+            split = self._paths[field] = (field.split("."), parse_path(field))
+        names, keys = split
+        for i in range(len(keys) - 1, 0, -1):
+            name = ".".join(names[:i])
+            if name in record:
+                return walk(self._container(record, name), keys[i:])
+        return walk(self._container(record, RAW_FIELD), keys)
+
+    def _container(self, record: dict, name: str) -> Any:
+        value = record.get(name)
+        if not isinstance(value, str):
+            return value
+        key = (id(record), name)
+        if key not in self._parsed:
+            self._parsed[key] = _parse_json(value)
+        return self._parsed[key]
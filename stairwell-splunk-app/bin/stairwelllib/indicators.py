@@ -0,0 +1,186 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Normalization and validation of indicators before they are looked up, so that each indicator
+has one canonical form (and cache key), and values the API can't know about are answered without
+a request."""
+
+import ipaddress
+import re
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from stairwelllib.client import OBJECT_INDICATOR, HOSTNAME_INDICATOR, IP_INDICATOR
+
+# Categories of indicators that can be answered locally, as the stairwell_status of the record.
+# `invalid` indicators aren't well-formed (for example, a hash of the wrong length), and
+# `private` ones only make sense within a network: private, loopback or link-local addresses, and
+# hostnames such as localhost or *.local.
+INVALID = "invalid"
+PRIVATE = "private"
+LOCAL_CATEGORIES = (INVALID, PRIVATE)
+# Value of the command's skip option answering nothing locally.
+SKIP_NONE = "none"
+
+# Kind of the lookups (the command's `auto` option) whose values are classified by classify(),
+# and looked up as whichever kind of indicator they turn out to be.
+AUTO_INDICATOR = "auto"
+
+# Lengths of the hex digests of MD5, SHA-1 and SHA-256 hashes.
+HASH_LENGTHS = (32, 40, 64)
+HEX_DIGITS = frozenset("0123456789abcdef")
+HASH_PATTERN = re.compile(r"[0-9a-fA-F]{32}(?:[0-9a-fA-F]{8}(?:[0-9a-fA-F]{24})?)?")
+# Characters that can make up an IP address (IPv6 ones possibly in brackets), checked before the
+# more expensive parse.
+IP_PATTERN = re.compile(r"[0-9a-fA-F:.\[\]]+")
+
+HOSTNAME_LABEL = re.compile(r"[a-z0-9_]([a-z0-9_-]{0,61}[a-z0-9_])?")
+MAX_HOSTNAME_LENGTH = 253
+# Special-use names that never resolve on the internet.
+PRIVATE_HOSTNAMES = ("localhost",)
+PRIVATE_SUFFIXES = (
+    ".localhost",
+    ".local",
+    ".localdomain",
+    ".internal",
+    ".lan",
+    ".home.arpa",
+)
+
+# Normalized indicators are remembered, since each record's values are normalized more than once.
+MAX_MEMO_ENTRIES = 100000
+
+
+class Normalized(NamedTuple):
+    """An indicator in its canonical form, and the category it falls in if it's answered
+    locally."""
+
+    value: str
+    category: Optional[str] = None
+    reason: Optional[str] = None
+
+
+def normalize_hash(value: str) -> Normalized:
+    value = value.strip().lower()
+    if len(value) not in HASH_LENGTHS or not HEX_DIGITS.issuperset(value):
+        return Normalized(value, INVALID, "not an MD5, SHA-1 or SHA-256 hash")
+    return Normalized(value)
+
+
+def normalize_ip(value: str) -> Normalized:
+    value = value.strip()
+    try:
+        address = ipaddress.ip_address(value.strip("[]"))
+    except ValueError:
+        return Normalized(value, INVALID, "not an IP address")
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    canonical = str(address)
+    if (
+        address.is_private
+        or address.is_loopback
+        or address.is_link_local
+        or address.is_multicast
+        or address.is_unspecified
+        or address.is_reserved
+    ):
+        return Normalized(canonical, PRIVATE, "not a public IP address")
+    return Normalized(canonical)
+
+
+def normalize_hostname(value: str) -> Normalized:
+    value = value.strip().rstrip(".").lower()
+    if not value.isascii():
+        try:
+            value = value.encode("idna").decode("ascii")
+        except UnicodeError:
+            return Normalized(value, INVALID, "not a valid hostname")
+    labels = value.split(".")
+    if len(value) > MAX_HOSTNAME_LENGTH or not all(
+        HOSTNAME_LABEL.fullmatch(label) for label in labels
+    ):
+        return Normalized(value, INVALID, "not a valid hostname")
+    if (
+        len(labels) == 1
+        or value in PRIVATE_HOSTNAMES
+        or value.endswith(PRIVATE_SUFFIXES)
+    ):
+        return Normalized(value, PRIVATE, "not a public hostname")
+    return Normalized(value)
+
+
+def classify(value: str) -> Optional[str]:
+    """Returns the kind of indicator a value looks like (a hash, an IP address, or a hostname
+    with at least two labels and a top-level domain that isn't numeric), or None if it looks like
+    none of them."""
+    value = value.strip()
+    if HASH_PATTERN.fullmatch(value):
+        return OBJECT_INDICATOR
+    if IP_PATTERN.fullmatch(value):
+        try:
+            ipaddress.ip_address(value.strip("[]"))
+            return IP_INDICATOR
+        except ValueError:
+            pass
+    labels = value.rstrip(".").split(".")
+    if (
+        len(labels) > 1
+        and not labels[-1].isdigit()
+        and normalize_hostname(value).category != INVALID
+    ):
+        return HOSTNAME_INDICATOR
+    return None
+
+
+NORMALIZERS = {
+    OBJECT_INDICATOR: normalize_hash,
+    IP_INDICATOR: normalize_ip,
+    HOSTNAME_INDICATOR: normalize_hostname,
+}
+
+
+class IndicatorNormalizer:
+    """IndicatorNormalizer canonicalizes indicators (hashes and hostnames in lower case, without
+    surrounding whitespace or trailing dots, internationalized hostnames in IDNA form, IP addresses
+    in their compressed form), and answers those in the `local` categories without a lookup.
+    """
+
+    def __init__(self, local: Iterable[str] = LOCAL_CATEGORIES):
+        self.local = frozenset(local) - {SKIP_NONE}
+        unknown = self.local - set(LOCAL_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unrecognized indicator categories: {sorted(unknown)}")
+        self._memo: Dict[Tuple[str, str], Normalized] = {}
+
+    def normalize(self, kind: str, value: str) -> Normalized:
+        key = (kind, value)
+        normalized = self._memo.get(key)
+        if normalized is None:
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            normalized = self._memo[key] = NORMALIZERS[kind](value)
+        return normalized
+
+    def canonical(self, kind: str, value: str) -> str:
+        return self.normalize(kind, value).value
+
+    def local_answer(self, kind: str, value: str) -> Optional[dict]:
+        """Returns the record answering a (canonical) indicator locally, or None if it is to be
+        looked up."""
+        normalized = self.normalize(kind, value)
+        if normalized.category not in self.local:
+            return None
+        return {
+            "stairwell_error": normalized.reason,
+            "stairwell_status": normalized.category,
+        }
@@ -0,0 +1,46 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Deferred imports of the modules that are slow to load, so that a search command process only
+pays for them once it actually makes a lookup."""
+
+from importlib import import_module
+from types import ModuleType
+from typing import Optional
+
+
+class LazyModule:
+    """LazyModule stands in for a module, importing it when one of its attributes is first used.
+    Imports are thread-safe, so concurrent lookups may trigger it."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str):
+        module = self._module
+        if module is None:
+            module = self._module = import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
+
+
+# The OpenAPI-generated client, which loads its models (and pydantic and urllib3) on import.
+appapi = LazyModule("stairwell_appapi_client")
+
+# The HTTP library the generated client makes requests with, for catching its transport errors.
+urllib3 = LazyModule("urllib3")
@@ -0,0 +1,107 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Enrichments kept in a KV store collection, so that searches can use them through a plain
+lookup without calling the Stairwell API."""
+
+from typing import Dict, Iterable, List, Set
+
+DEFAULT_COLLECTION = "stairwell_enrichments"
+
+# Fields of a collection entry besides its `stairwell_*` enrichment fields.
+INDICATOR_FIELD = "indicator"
+INDICATOR_TYPE_FIELD = "indicator_type"
+UPDATED_FIELD = "stairwell_updated"
+
+# Documents written (and read) per KV store request, within splunkd's default limits.
+KV_BATCH_SIZE = 1000
+
+
+def entry_key(kind: str, value: str) -> str:
+    return f"{kind}:{value}"
+
+
+def collect_indicators(
+    results: Iterable[dict], fields: Dict[str, List[str]]
+) -> Dict[str, Set[str]]:
+    """Gathers the distinct indicators of each kind held in the given fields of search results.
+    Multivalue fields contribute each of their values."""
+    indicators: Dict[str, Set[str]] = {kind: set() for kind in fields}
+    for result in results:
+        for kind, names in fields.items():
+            for name in names:
+                value = result.get(name)
+                values = value if isinstance(value, list) else [value]
+                indicators[kind].update(v for v in values if isinstance(v, str) and v)
+    return indicators
+
+
+def fresh_keys(collection_data, updated_since: float) -> Set[str]:
+    """Returns the keys of collection entries enriched since the given time."""
+    keys: Set[str] = set()
+    skip = 0
+    while True:
+        entries = collection_data.query(
+            query={UPDATED_FIELD: {"$gte": updated_since}},
+            fields="_key",
+            limit=KV_BATCH_SIZE,
+            skip=skip,
+        )
+        keys.update(entry["_key"] for entry in entries)
+        if len(entries) < KV_BATCH_SIZE:
+            return keys
+        skip += len(entries)
+
+
+def is_settled(record: dict) -> bool:
+    """Reports whether an enrichment record is worth keeping: either an enrichment, or the API
+    not knowing the indicator. Deferred and failed lookups are retried on the next run.
+    """
+    status = record.get("stairwell_status")
+    return status is None or status == "404"
+
+
+def collection_entry(kind: str, value: str, record: dict, updated: float) -> dict:
+    """Builds the collection entry of an indicator from its enrichment record."""
+    document = {
+        key: field
+        for key, field in record.items()
+        if key.startswith("stairwell_") and field is not None
+    }
+    document.update(
+        {
+            "_key": entry_key(kind, value),
+            INDICATOR_FIELD: value,
+            INDICATOR_TYPE_FIELD: kind,
+            UPDATED_FIELD: updated,
+        }
+    )
+    return document
+
+
+def save_entries(collection_data, entries: Iterable[dict]) -> int:
+    """Inserts or replaces entries, a batch at a time. Returns the number saved."""
+    saved = 0
+    batch: List[dict] = []
+    for document in entries:
+        batch.append(document)
+        if len(batch) == KV_BATCH_SIZE:
+            collection_data.batch_save(*batch)
+            saved += len(batch)
+            batch = []
+    if batch:
+        collection_data.batch_save(*batch)
+        saved += len(batch)
+    return saved
@@ -0,0 +1,299 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compact on-disk record of the indicators Stairwell recently didn't know, shared by all searches
+on a search head, so that they aren't looked up again and again.
+
+Most indicators in endpoint logs are unknown to Stairwell, and the persistent cache doesn't store
+"not found" answers: keeping millions of them would take far more room than the enrichments worth
+keeping. Instead, they are added to Bloom filters, a few bits per indicator, with a configurable
+false positive rate. A false positive reports an indicator Stairwell knows as not found, so the
+rate should stay low."""
+
+import glob
+import hashlib
+import math
+import mmap
+import os
+import threading
+import time
+from logging import Logger
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+from stairwelllib.cache import is_negative_response
+from stairwelllib.client import StairwellAPI, StairwellDataAPI, api_exception, conf_bool
+from stairwelllib.lazyimport import appapi
+from stairwelllib.persistentcache import (
+    CACHE_MODES,
+    CACHE_MODE_NONE,
+    CACHE_MODE_READWRITE,
+)
+
+# Stanza of stairwell.conf configuring the filters.
+NOT_FOUND_STANZA = "not_found"
+
+# Indicators remembered per kind before the false positive rate exceeds fp_rate, for each of the
+# two generations kept. At the default rate, a filter takes about 1.8MB.
+DEFAULT_CAPACITY = 1000000
+DEFAULT_FP_RATE = 0.001
+
+# Seconds an indicator stays in the filters. Stairwell learns of new objects all the time, so
+# indicators are looked up again once this is up.
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+# Reason given for the lookups answered from the filters.
+NOT_FOUND_REASON = "Not Found (recently looked up)"
+
+# Prefixes telling apart indicators the API answered with 404 from those it answered with an
+# empty enrichment, which both count as unknown.
+_MISSING = "404:"
+_EMPTY = "empty:"
+
+
+def default_filter_path() -> Optional[str]:
+    """Returns the directory holding the filters, or None outside of Splunk."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "var", "lib", "stairwell", "not_found")
+
+
+def filter_size(capacity: int, fp_rate: float) -> Tuple[int, int]:
+    """Returns the number of bits and hash functions of a Bloom filter holding capacity items with
+    the given false positive rate."""
+    if capacity < 1 or not 0 < fp_rate < 1:
+        raise ValueError(f"Invalid filter capacity {capacity} or rate {fp_rate}")
+    bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """BloomFilter is a set of strings that takes `hashes` bits out of `bits` per item, and may
+    report items that were never added (but never misses one that was). Its bits are held in
+    `buffer`, which can be a memory-mapped file."""
+
+    def __init__(self, bits: int, hashes: int, buffer=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.buffer = buffer if buffer is not None else bytearray((bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: k positions from two 64-bit halves of a single digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, item: str):
+        buffer = self.buffer
+        for position in self._positions(item):
+            buffer[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        buffer = self.buffer
+        return all(
+            buffer[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class NotFoundFilter:
+    """NotFoundFilter remembers indicators per kind in Bloom filters stored in `directory`, and
+    mapped into memory so that every search process sees the others' additions. Time is split
+    into generations of max_age / 2 seconds: indicators are added to the current generation's
+    filter and found in it or the previous one, so each is remembered for between max_age / 2 and
+    max_age seconds, and older filters are deleted. Bits set by two processes at the same instant
+    may be lost, which only costs a lookup."""
+
+    def __init__(
+        self,
+        directory: str,
+        capacity: int = DEFAULT_CAPACITY,
+        fp_rate: float = DEFAULT_FP_RATE,
+        max_age: float = DEFAULT_MAX_AGE,
+        logger: Optional[Logger] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_age <= 0:
+            raise ValueError(f"Invalid filter max_age {max_age}")
+        self.directory = directory
+        self.bits, self.hashes = filter_size(capacity, fp_rate)
+        self.period = max_age / 2
+        self.logger = logger
+        self.clock = clock
+        self._filters: Dict[Tuple[str, int], Tuple[BloomFilter, mmap.mmap]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def generation(self) -> int:
+        return int(self.clock() // self.period)
+
+    def add(self, kind: str, item: str):
+        generation = self.generation()
+        with self._lock:
+            bloom = self._open(kind, generation, create=True)
+            if bloom is not None:
+                bloom.add(item)
+
+    def contains(self, kind: str, item: str) -> bool:
+        generation = self.generation()
+        with self._lock:
+            filters = [
+                self._open(kind, g, create=False) for g in (generation, generation - 1)
+            ]
+        return any(bloom is not None and item in bloom for bloom in filters)
+
+    def _path(self, kind: str, generation: int) -> str:
+        # The filter's dimensions are part of its name, so that changing the settings starts new
+        # filters rather than misreading the old ones.
+        return os.path.join(
+            self.directory, f"{kind}.{self.bits}x{self.hashes}.{generation}.bloom"
+        )
+
+    def _open(self, kind: str, generation: int, create: bool) -> Optional[BloomFilter]:
+        opened = self._filters.get((kind, generation))
+        if opened is not None:
+            return opened[0]
+        path = self._path(kind, generation)
+        if not create and not os.path.exists(path):
+            return None
+        size = (self.bits + 7) // 8
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < size:
+                    # Extending a file zero-fills it, but keeps bits another process already set.
+                    os.ftruncate(fd, size)
+                mapped = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.warning("not-found filter %s unavailable: %s", path, e)
+            return None
+        bloom = BloomFilter(self.bits, self.hashes, mapped)
+        self._filters[(kind, generation)] = (bloom, mapped)
+        if create:
+            self._expire(kind, generation)
+        return bloom
+
+    def _expire(self, kind: str, generation: int):
+        """Closes and deletes the filters of the kind older than the previous generation."""
+        for key in [k for k in self._filters if k[0] == kind and k[1] < generation - 1]:
+            self._filters.pop(key)[1].close()
+        for path in glob.glob(os.path.join(self.directory, f"{kind}.*.bloom")):
+            name = os.path.basename(path).split(".")
+            try:
+                stale = int(name[-2]) < generation - 1
+            except (IndexError, ValueError):
+                continue
+            if stale:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            for _, mapped in self._filters.values():
+                mapped.close()
+            self._filters.clear()
+
+
+class NotFoundSettings(NamedTuple):
+    """Settings of the [not_found] stanza of stairwell.conf."""
+
+    # Whether searches skip the indicators recently found unknown.
+    enabled: bool = False
+    # Indicators of each kind remembered per generation before fp_rate is exceeded.
+    capacity: int = DEFAULT_CAPACITY
+    # Share of the indicators Stairwell knows that may be reported as not found.
+    fp_rate: float = DEFAULT_FP_RATE
+    # Seconds an indicator is remembered for at most.
+    max_age: float = DEFAULT_MAX_AGE
+
+    @classmethod
+    def from_conf(cls, stanza: dict) -> "NotFoundSettings":
+        """Reads settings from a conf stanza, falling back to the defaults for missing keys."""
+        defaults = cls()
+        return cls(
+            enabled=conf_bool(stanza.get("enabled", defaults.enabled)),
+            capacity=int(stanza.get("capacity") or defaults.capacity),
+            fp_rate=float(stanza.get("fp_rate") or defaults.fp_rate),
+            max_age=float(stanza.get("max_age") or defaults.max_age),
+        )
+
+
+class NotFoundFilteringStairwellAPI(StairwellDataAPI):
+    """NotFoundFilteringStairwellAPI passes lookups on to another StairwellAPI, and records in a
+    NotFoundFilter the indicators it answers with 404 or an empty enrichment. Later lookups of
+    those indicators are answered the same way without being passed on: with a 404 whose reason
+    is NOT_FOUND_REASON, or an empty enrichment. The mode is that of the persistent cache: `read`
+    uses the filter without adding to it."""
+
+    api: StairwellAPI
+    filter: NotFoundFilter
+
+    # Lookups answered from the filter, and indicators added to it.
+    skipped: int
+    added: int
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        filter: NotFoundFilter,
+        mode: str = CACHE_MODE_READWRITE,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unrecognized cache mode: {mode}")
+        self.api = api
+        self.filter = filter
+        self.read = mode != CACHE_MODE_NONE
+        self.write = mode == CACHE_MODE_READWRITE
+        self.skipped = 0
+        self.added = 0
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        if self.read:
+            if self.filter.contains(kind, _MISSING + value):
+                self.skipped += 1
+                raise api_exception(404, NOT_FOUND_REASON)
+            if self.filter.contains(kind, _EMPTY + value):
+                self.skipped += 1
+                return {}
+        try:
+            response = self.api.get_enrichment_data(kind, value)
+        except appapi.ApiException as e:
+            if e.status == 404:
+                self._add(kind, _MISSING + value)
+            raise
+        if is_negative_response(response):
+            self._add(kind, _EMPTY + value)
+        return response
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        if self.read:
+            values = [
+                value
+                for value in values
+                if not self.filter.contains(kind, _MISSING + value)
+                and not self.filter.contains(kind, _EMPTY + value)
+            ]
+        self.api.prefetch(kind, values)
+
+    def _add(self, kind: str, item: str):
+        if self.write:
+            self.filter.add(kind, item)
+            self.added += 1
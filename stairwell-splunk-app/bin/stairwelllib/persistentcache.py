@@ -0,0 +1,359 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""On-disk cache of Stairwell enrichment responses, shared by all searches on a search head."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from logging import Logger
+from typing import Any, Callable, Dict, Iterable, Optional
+from stairwelllib.cache import is_negative_response, object_hashes
+from stairwelllib.client import (
+    StairwellAPI,
+    StairwellDataAPI,
+    OBJECT_INDICATOR,
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+    response_from_data,
+)
+
+# Values accepted by the command's `cache` option.
+CACHE_MODE_NONE = "none"
+CACHE_MODE_READ = "read"
+CACHE_MODE_READWRITE = "readwrite"
+CACHE_MODES = (CACHE_MODE_NONE, CACHE_MODE_READ, CACHE_MODE_READWRITE)
+
+# How long, in seconds, a stored response stays fresh, per indicator kind. Object enrichments
+# change slowly (new opinions, prevalence), while DNS data for hostnames and IPs goes stale faster.
+DEFAULT_TTLS = {
+    OBJECT_INDICATOR: 24 * 60 * 60,
+    HOSTNAME_INDICATOR: 6 * 60 * 60,
+    IP_INDICATOR: 6 * 60 * 60,
+}
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# How long to wait on another process holding the database lock before giving up, in seconds.
+LOCK_TIMEOUT = 5.0
+
+# The size bound is enforced every this many writes, rather than on every write.
+EVICTION_INTERVAL = 100
+
+# Maximum number of indicators looked up per query, to stay well within SQLite's limit on the
+# number of bound parameters.
+QUERY_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lookups (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    body TEXT NOT NULL,
+    stored REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (kind, value)
+);
+CREATE INDEX IF NOT EXISTS lookups_stored ON lookups (stored);
+CREATE TABLE IF NOT EXISTS aliases (
+    kind TEXT NOT NULL,
+    alias TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (kind, alias)
+);
+"""
+
+
+def default_cache_path() -> Optional[str]:
+    """Returns the location of the shared cache database, or None outside of Splunk."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "var", "lib", "stairwell", "lookup_cache.sqlite")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_response(response: Any) -> str:
+    """Serializes an enrichment response, given as a model or as JSON, using the API's own
+    (aliased) field names."""
+    if hasattr(response, "to_dict"):
+        response = response.to_dict()
+    return json.dumps(response, default=_json_default)
+
+
+def decode_response(kind: str, body: str, raw: bool = False) -> Any:
+    """Deserializes an enrichment response into its model, or just into JSON if raw is set."""
+    data = json.loads(body)
+    return data if raw else response_from_data(kind, data)
+
+
+class PersistentLookupCache:
+    """PersistentLookupCache stores enrichment responses in a SQLite database, so they can be
+    reused by later searches and by other search processes running at the same time. The database
+    runs in WAL mode so readers don't block on writers; write failures (for example, lock
+    timeouts) are logged and otherwise ignored, as the cache must never fail a search.
+
+    Object enrichments are stored once, under the last of their hashes (see object_hashes), with
+    an alias row for each other hash, so they can be read back by any of them.
+    """
+
+    path: str
+    ttls: dict
+    max_bytes: int
+
+    def __init__(
+        self,
+        path: str,
+        ttls: Optional[dict] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        logger: Optional[Logger] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, timeout=LOCK_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(
+        self,
+        kind: str,
+        value: str,
+        max_age: Optional[float] = None,
+        raw: bool = False,
+    ) -> Any:
+        """Returns the stored response for an indicator, or None if there is no response younger
+        than both the kind's TTL and max_age (if given). The response is returned as a model, or
+        as JSON if raw is set."""
+        return self.get_many(kind, [value], max_age, raw).get(value)
+
+    def get_many(
+        self,
+        kind: str,
+        values: Iterable[str],
+        max_age: Optional[float] = None,
+        raw: bool = False,
+    ) -> Dict[str, Any]:
+        """Returns the stored responses for any of the given indicators, keyed by indicator. The
+        same freshness rules as get() apply."""
+        age = self.ttls.get(kind)
+        if max_age is not None:
+            age = max_age if age is None else min(age, max_age)
+        oldest = None if age is None else self.clock() - age
+
+        values = list(values)
+        rows = []
+        try:
+            with self._lock:
+                # Indicators (by stored key) that were asked for under an alias.
+                aliased: Dict[str, list] = {}
+                if kind == OBJECT_INDICATOR:
+                    for alias, value in self._select(
+                        "SELECT alias, value FROM aliases", kind, "alias", values
+                    ):
+                        aliased.setdefault(value, []).append(alias)
+                keys = set(values).union(aliased)
+                rows = self._select(
+                    "SELECT value, body, stored FROM lookups", kind, "value", keys
+                )
+        except sqlite3.Error as e:
+            self._warn("read", e)
+            return {}
+
+        wanted = set(values)
+        responses = {}
+        for value, body, stored in rows:
+            if oldest is not None and stored <= oldest:
+                continue
+            try:
+                response = decode_response(kind, body, raw)
+            except ValueError as e:
+                # Most likely written by a different version of the app; treat it as a miss.
+                self._warn("decode", e)
+                continue
+            if value in wanted:
+                responses[value] = response
+            for alias in aliased.get(value, ()):
+                responses[alias] = response
+        return responses
+
+    def _select(self, query: str, kind: str, column: str, values: Iterable[str]):
+        """Runs query for the rows of the given kind whose column is one of values, in batches."""
+        values = list(values)
+        rows = []
+        for i in range(0, len(values), QUERY_BATCH_SIZE):
+            batch = values[i : i + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows += self._db.execute(
+                f"{query} WHERE kind = ? AND {column} IN ({placeholders})",
+                [kind] + batch,
+            ).fetchall()
+        return rows
+
+    def put(self, kind: str, value: str, response: Any):
+        body = encode_response(response)
+        aliases = []
+        if kind == OBJECT_INDICATOR:
+            hashes = object_hashes(json.loads(body))
+            if hashes:
+                value, aliases = hashes[-1], hashes[:-1]
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO lookups (kind, value, body, stored, size) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (kind, value, body, self.clock(), len(body)),
+                )
+                if aliases:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO aliases (kind, alias, value) "
+                        "VALUES (?, ?, ?)",
+                        [(kind, alias, value) for alias in aliases],
+                    )
+                self._writes += 1
+                if self._writes % EVICTION_INTERVAL == 0:
+                    self._evict()
+        except sqlite3.Error as e:
+            self._warn("write", e)
+
+    def evict(self):
+        """Removes expired responses, then the oldest ones until the database fits max_bytes."""
+        try:
+            with self._lock:
+                self._evict()
+        except sqlite3.Error as e:
+            self._warn("evict", e)
+
+    def _evict(self):
+        now = self.clock()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, ttl in self.ttls.items():
+                self._db.execute(
+                    "DELETE FROM lookups WHERE kind = ? AND stored <= ?",
+                    (kind, now - ttl),
+                )
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM lookups"
+            ).fetchone()
+            if total > self.max_bytes:
+                # Walk the entries from oldest to newest to find the cut-off that brings the
+                # total back under the bound.
+                excess = total - self.max_bytes
+                cutoff = None
+                for stored, size in self._db.execute(
+                    "SELECT stored, size FROM lookups ORDER BY stored"
+                ):
+                    excess -= size
+                    cutoff = stored
+                    if excess <= 0:
+                        break
+                self._db.execute("DELETE FROM lookups WHERE stored <= ?", (cutoff,))
+            self._db.execute(
+                "DELETE FROM aliases WHERE NOT EXISTS (SELECT 1 FROM lookups "
+                "WHERE lookups.kind = aliases.kind AND lookups.value = aliases.value)"
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _warn(self, action: str, error: Exception):
+        if self.logger:
+            self.logger.warning(
+                "persistent cache %s failed (%s): %s", action, self.path, error
+            )
+
+
+class PersistentCachingStairwellAPI(StairwellDataAPI):
+    """PersistentCachingStairwellAPI serves lookups from a PersistentLookupCache where it can,
+    falling back to another StairwellAPI. Only responses with data are stored; errors and "not
+    found" responses are left to the in-process cache."""
+
+    api: StairwellAPI
+    store: PersistentLookupCache
+
+    # Lookups served from the store, and lookups passed on to `api`.
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        store: PersistentLookupCache,
+        mode: str = CACHE_MODE_READWRITE,
+        max_age: Optional[float] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unrecognized cache mode: {mode}")
+        self.api = api
+        self.store = store
+        self.read = mode != CACHE_MODE_NONE
+        self.write = mode == CACHE_MODE_READWRITE
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Responses read ahead of time by the last prefetch() of each kind, until they are
+        # claimed. Each prefetch() replaces those of its kind, so that responses the batch didn't
+        # claim aren't served later, past max_age.
+        self._prefetched: Dict[str, Dict[str, dict]] = {}
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        response = self._prefetched.get(kind, {}).pop(value, None)
+        if response is None and self.read:
+            response = self.store.get(kind, value, max_age=self.max_age, raw=True)
+        if response is not None:
+            with self._lock:
+                self.hits += 1
+            return response
+        with self._lock:
+            self.misses += 1
+        response = self.api.get_enrichment_data(kind, value)
+        if self.write and not is_negative_response(response):
+            self.store.put(kind, value, response)
+        return response
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        values = list(values)
+        if self.read:
+            stored = self.store.get_many(kind, values, max_age=self.max_age, raw=True)
+            self._prefetched[kind] = stored
+            values = [value for value in values if value not in stored]
+        self.api.prefetch(kind, values)
@@ -0,0 +1,310 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Batched enrichment of Splunk records."""
+
+import json
+import logging
+from concurrent.futures import Executor
+from logging import Logger
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from stairwelllib.budget import OutputBudget
+from stairwelllib.client import StairwellAPI
+from stairwelllib.concurrency import ordered_map
+from stairwelllib.fields import FieldReader
+from stairwelllib.indicators import AUTO_INDICATOR, IndicatorNormalizer, classify
+from stairwelllib.stairwellapi import DATA_SEARCHES, FieldSelection, wanted
+from stairwelllib.swlogging import LogSampler
+from stairwelllib.telemetry import Telemetry
+
+# Records are enriched in batches of up to this many records...
+DEFAULT_BATCH_SIZE = 1000
+# ...or fewer, if the batch reaches this many distinct indicators first.
+DEFAULT_MAX_DISTINCT = 500
+
+# Field telling which kind of indicator the values of `auto` lookups were looked up as.
+INDICATOR_TYPE_FIELD = "stairwell_indicator_type"
+
+
+class Lookup(NamedTuple):
+    """A type of enrichment to apply: values of `field` are looked up as indicators of `kind`,
+    and translated into record fields by `search`, one of the functions in stairwellapi.py. If
+    `namespace` is set, the fields are renamed from `stairwell_*` to `stairwell_<namespace>_*`, so
+    that several lookups can enrich the same record.
+
+    `field` may be a path into nested JSON (see FieldReader). Values of lookups of the `auto` kind
+    are classified, looked up with the search_stairwell_*_data function of their kind, and get a
+    stairwell_indicator_type field; `search` is unused."""
+
+    kind: str
+    field: str
+    search: Optional[Callable[..., dict]]
+    namespace: Optional[str] = None
+
+
+class Extracted(NamedTuple):
+    """The indicators read from a record's field for a lookup, as (kind, value), and whether the
+    field has several values."""
+
+    multivalue: bool
+    indicators: List[Optional[Tuple[str, str]]]
+
+
+def namespaced(fields: dict, namespace: Optional[str]) -> dict:
+    """Renames enrichment fields from `stairwell_*` to `stairwell_<namespace>_*`."""
+    if not namespace:
+        return fields
+    prefix = f"stairwell_{namespace}_"
+    return {
+        (
+            prefix + key[len("stairwell_") :] if key.startswith("stairwell_") else key
+        ): value
+        for key, value in fields.items()
+    }
+
+
+def _multivalue_item(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        # Nested values can't be multivalue items of their own without breaking the alignment.
+        return json.dumps(value, default=str)
+    return value
+
+
+def aligned(results: List[Optional[dict]]) -> dict:
+    """Combines the enrichment fields of each value of a multivalue field into multivalue fields,
+    whose n-th items belong to the n-th value. Values without a result (or a field) get empty
+    items."""
+    keys = dict.fromkeys(key for result in results if result for key in result)
+    return {
+        key: [_multivalue_item(result.get(key)) if result else "" for result in results]
+        for key in keys
+    }
+
+
+class BatchEnricher:
+    """BatchEnricher enriches records a batch at a time. For each batch it collects the distinct
+    indicator values of each lookup, resolves every distinct value once (through the API's caches,
+    then concurrently over the network), and then joins the results back onto every record that
+    carries the value. Records are yielded in their original order.
+
+    A batch is flushed when it holds batch_size records, or max_distinct distinct indicators,
+    whichever comes first; a batch_size of 0 only flushes at the end of the input. Each value of a
+    multivalue field is looked up, and the results are added as multivalue fields aligned with
+    it. If fields is given, only the selected enrichment fields are produced. If telemetry is
+    given, the records and batches enriched, and the time spent looking up (`stage.resolve`) and
+    joining (`stage.join`) are counted in it. At debug level, records are logged before and after
+    being enriched as chosen by debug_sampler (by default, the first few and then a small
+    sample).
+
+    If normalizer is given, indicators are looked up (and joined) in their canonical form, and
+    those it answers locally are not looked up at all. If budget is given, the fields added for
+    each indicator are kept within its bounds, the record's byte budget being shared by all the
+    indicators enriching the record."""
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        logger: Logger,
+        lookups: List[Lookup],
+        executor: Optional[Executor] = None,
+        workers: int = 1,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_distinct: int = DEFAULT_MAX_DISTINCT,
+        fields: Optional[FieldSelection] = None,
+        telemetry: Optional[Telemetry] = None,
+        debug_sampler: Optional[LogSampler] = None,
+        normalizer: Optional[IndicatorNormalizer] = None,
+        budget: Optional[OutputBudget] = None,
+    ):
+        self.api = api
+        self.logger = logger
+        self.lookups = lookups
+        self.executor = executor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_distinct = max_distinct
+        self.fields = fields
+        self.telemetry = telemetry
+        self.debug_sampler = debug_sampler or LogSampler()
+        self.normalizer = normalizer
+        self.budget = budget or None
+        self.reader = FieldReader()
+
+    def enrich(self, records: Iterable[dict]) -> Iterator[dict]:
+        # Records along with the indicators of each lookup, so fields are only read once.
+        batch: List[Tuple[dict, List[Extracted]]] = []
+        distinct = set()
+        for record in records:
+            extracted = [self._extract(record, lookup) for lookup in self.lookups]
+            batch.append((record, extracted))
+            for _, indicators in extracted:
+                distinct.update(indicators)
+            distinct.discard(None)
+            if (self.batch_size > 0 and len(batch) >= self.batch_size) or (
+                self.max_distinct > 0 and len(distinct) >= self.max_distinct
+            ):
+                yield from self._flush(batch)
+                batch = []
+                distinct = set()
+        if batch:
+            yield from self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[dict, List[Extracted]]]) -> Iterator[dict]:
+        # Indicators are keyed by kind, so that a value appearing in several fields of the same
+        # kind is still only looked up once.
+        searches: Dict[str, Callable] = {
+            lookup.kind: lookup.search
+            for lookup in self.lookups
+            if lookup.kind != AUTO_INDICATOR
+        }
+        distinct: Dict[str, set] = {}
+        for _, extracted in batch:
+            for _, indicators in extracted:
+                for indicator in indicators:
+                    if indicator is not None:
+                        distinct.setdefault(indicator[0], set()).add(indicator[1])
+        for kind in distinct:
+            # Kinds only found by classifying values.
+            searches.setdefault(kind, DATA_SEARCHES[kind])
+
+        telemetry = self.telemetry
+        if telemetry:
+            started = telemetry.clock()
+        resolved: Dict[Tuple[str, str], dict] = {}
+        if self.normalizer is not None:
+            for kind, values in distinct.items():
+                for value in values:
+                    answer = self.normalizer.local_answer(kind, value)
+                    if answer is not None:
+                        resolved[(kind, value)] = answer
+            if telemetry and resolved:
+                telemetry.count("local_answers", len(resolved))
+        indicators = [
+            (kind, value)
+            for kind, values in distinct.items()
+            for value in values
+            if (kind, value) not in resolved
+        ]
+
+        # Announce every lookup of the batch before making any, so they can all be scheduled
+        # together.
+        for kind in distinct:
+            self.api.prefetch(kind, [v for k, v in indicators if k == kind])
+        resolved.update(self._resolve(indicators, searches))
+        if telemetry:
+            resolved_at = telemetry.clock()
+            telemetry.count("stage.resolve", resolved_at - started)
+            telemetry.count("batches")
+            telemetry.count("records", len(batch))
+
+        # Each lookup's record fields, by indicator (and the number of indicators sharing the
+        # record's byte budget), built on first use.
+        joins: List[Dict[tuple, dict]] = [{} for _ in self.lookups]
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        for record, extracted in batch:
+            # Records are copied, as they are only formatted once the log is written.
+            sampled = debug and self.debug_sampler.sample()
+            if sampled:
+                self.logger.debug("record before = %s", dict(record))
+            shares = 1
+            if self.budget is not None:
+                shares = sum(
+                    indicator is not None
+                    for _, indicators in extracted
+                    for indicator in indicators
+                )
+            for lookup, join, (multivalue, indicators) in zip(
+                self.lookups, joins, extracted
+            ):
+                results = []
+                for indicator in indicators:
+                    fields = None
+                    if indicator is not None:
+                        fields = join.get((indicator, shares))
+                        if fields is None:
+                            fields = join[(indicator, shares)] = self._fields(
+                                lookup, indicator, resolved[indicator], shares
+                            )
+                    results.append(fields)
+                if multivalue:
+                    record.update(aligned(results))
+                elif results[0] is not None:
+                    record.update(results[0])
+            if sampled:
+                self.logger.debug("record after = %s", dict(record))
+            yield record
+        self.reader.clear()
+        if telemetry:
+            # Including the time spent by the consumer of the records.
+            telemetry.count("stage.join", telemetry.clock() - resolved_at)
+
+    def _fields(
+        self, lookup: Lookup, indicator: Tuple[str, str], result: dict, shares: int
+    ) -> dict:
+        """The record fields a lookup adds for an indicator's result."""
+        if self.budget is not None:
+            result = self.budget.apply(result, shares)
+        if lookup.kind == AUTO_INDICATOR and wanted(self.fields, INDICATOR_TYPE_FIELD):
+            result = dict(result)
+            result[INDICATOR_TYPE_FIELD] = indicator[0]
+        return namespaced(result, lookup.namespace)
+
+    def _resolve(
+        self, indicators: List[Tuple[str, str]], searches: Dict[str, Callable]
+    ) -> Dict[Tuple[str, str], dict]:
+        """Looks up each of the (kind, value) indicators, returning their translated record
+        fields."""
+
+        def search(indicator: Tuple[str, str]) -> dict:
+            kind, value = indicator
+            return searches[kind](self.api, self.logger, value, fields=self.fields)
+
+        if self.executor is not None and len(indicators) > 1:
+            results = ordered_map(
+                self.executor, search, indicators, max_pending=self.workers * 4
+            )
+        else:
+            results = map(search, indicators)
+        return dict(zip(indicators, results))
+
+    def _extract(self, record: dict, lookup: Lookup) -> Extracted:
+        """Reads the indicators of a record's field: one per value of a multivalue field, with
+        None in place of values that aren't looked up."""
+        value = self.reader.get(record, lookup.field)
+        if isinstance(value, list):
+            return Extracted(True, [self._indicator(lookup.kind, v) for v in value])
+        return Extracted(False, [self._indicator(lookup.kind, value)])
+
+    def _indicator(self, kind: str, value) -> Optional[Tuple[str, str]]:
+        if not isinstance(value, str) or value == "":
+            return None
+        if kind == AUTO_INDICATOR:
+            kind = classify(value)
+            if kind is None:
+                return None
+        if self.normalizer is not None:
+            value = self.normalizer.canonical(kind, value)
+        return (kind, value) if value else None
@@ -0,0 +1,401 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Rate limiting and retries for Stairwell enrichment requests, shared by all search processes on
+a search head."""
+
+from __future__ import annotations
+
+import os
+import random
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging import Logger
+from typing import Any, Callable, Iterable, Optional
+from stairwelllib.asyncclient import AsyncStairwellAPI, AsyncStairwellDataAPI
+from stairwelllib.client import StairwellAPI, StairwellDataAPI
+from stairwelllib.lazyimport import LazyModule, appapi
+
+# Used by the asyncio counterparts only, so the thread engine never imports it.
+asyncio = LazyModule("asyncio")
+
+try:
+    import fcntl
+except ImportError:  # Windows: the bucket is only shared between threads of a process.
+    fcntl = None
+
+# Requests per second allowed across all searches on the search head. After a quiet period, up to
+# BURST_SECONDS worth of requests may be made at once.
+DEFAULT_RATE = 20.0
+BURST_SECONDS = 2.0
+
+DEFAULT_MAX_RETRIES = 3
+# Retries back off exponentially from BACKOFF_BASE seconds, with full jitter, up to BACKOFF_MAX.
+# A Retry-After longer than BACKOFF_MAX fails the lookup rather than stalling the search.
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# How often a request waiting for a concurrency slot checks for one, in seconds.
+POLL_INTERVAL = 0.01
+# After a slow down, the concurrency limit isn't lowered again for this many seconds, so that a
+# burst of failures from requests that were already in flight only counts once.
+DECREASE_COOLDOWN = 1.0
+
+# The shared bucket's state: available tokens, time of the last refill and time until which
+# requests are paused, all as doubles.
+STATE_FORMAT = "ddd"
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+
+
+def default_ratelimit_path() -> Optional[str]:
+    """Returns the location of the shared rate limit state, or None outside of Splunk."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "var", "run", "stairwell", "ratelimit")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Reports whether a failed request may succeed if retried later: throttling, server errors and
+    requests that failed before a response was received."""
+    status = getattr(error, "status", None)
+    # The status is checked first, so that other errors don't need the generated client loaded.
+    if not isinstance(status, int) or not isinstance(error, appapi.ApiException):
+        return False
+    return status in (0, 429) or 500 <= status <= 599
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns the number of seconds the server asked to wait before retrying, if any."""
+    headers = getattr(error, "headers", None) or {}
+    for name, value in headers.items():
+        if name.lower() != "retry-after":
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    return None
+
+
+class TokenBucket:
+    """TokenBucket admits up to `rate` requests per second on average, and up to `burst` at once.
+    When given a path, its state lives in that file and is updated under an exclusive file lock,
+    so that all processes using the same file share one budget."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: Optional[float] = None,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = (self.burst, clock(), 0.0)
+        self._fd = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def reserve(self) -> float:
+        """Takes a token if one is available and returns 0, or returns the number of seconds to
+        wait before trying again."""
+        with self._lock:
+            return self._update(self._take)
+
+    def pause(self, seconds: float):
+        """Stops handing out tokens, to every process sharing the bucket, for the given time."""
+        with self._lock:
+            self._update(lambda now, state: (0.0, state[:2] + (now + seconds,)))
+
+    def _take(self, now: float, state: tuple):
+        tokens, updated, paused_until = state
+        if now < paused_until:
+            return paused_until - now, state
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        if tokens >= 1:
+            return 0.0, (tokens - 1, now, paused_until)
+        return (1 - tokens) / self.rate, (tokens, now, paused_until)
+
+    def _update(self, change: Callable[[float, tuple], Any]) -> Any:
+        if self._fd is None:
+            result, self._state = change(self.clock(), self._state)
+            return result
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            data = os.pread(self._fd, STATE_SIZE, 0)
+            now = self.clock()
+            state = (
+                struct.unpack(STATE_FORMAT, data)
+                if len(data) == STATE_SIZE
+                else (self.burst, now, 0.0)
+            )
+            result, state = change(now, state)
+            os.pwrite(self._fd, struct.pack(STATE_FORMAT, *state), 0)
+            return result
+        finally:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class AdaptiveConcurrency:
+    """AdaptiveConcurrency limits the number of requests in flight, adjusting the limit to the
+    API's response: the limit is halved when requests are throttled or fail, and grows back by
+    about one for every `limit` requests that succeed (additive increase, multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.clock = clock
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._last_decrease = None
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, congested: Optional[bool] = None):
+        """Frees a slot. `congested` reports how the request went: True if it was throttled or
+        failed in a way that suggests overload, False if not, and None if it wasn't made.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if congested:
+                now = self.clock()
+                if (
+                    self._last_decrease is None
+                    or now - self._last_decrease >= DECREASE_COOLDOWN
+                ):
+                    self.limit = max(float(self.minimum), self.limit / 2)
+                    self._last_decrease = now
+            elif congested is False:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+
+class RateGovernor:
+    """RateGovernor decides when requests may be made and whether failed requests are retried. It
+    combines a (possibly shared) TokenBucket with an AdaptiveConcurrency limit."""
+
+    def __init__(
+        self,
+        bucket: Optional[TokenBucket],
+        concurrency: AdaptiveConcurrency,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        logger: Optional[Logger] = None,
+        jitter: Callable[[], float] = random.random,
+        time_left: Optional[Callable[[], float]] = None,
+        circuit_open: Optional[Callable[[], bool]] = None,
+    ):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.logger = logger
+        self.jitter = jitter
+        # Returns the seconds left in the search's time budget; no retry waits beyond it.
+        self.time_left = time_left
+        # Reports whether the circuit breaker below is turning lookups away; none waits for or
+        # takes a share of the rate limit meanwhile.
+        self.circuit_open = circuit_open
+        self.retries = 0
+        self.throttled = 0
+
+    def admit(self) -> float:
+        """Returns 0 if a request may be made now, in which case finish() must be called once it
+        completes, or the number of seconds to wait before asking again."""
+        if not self.concurrency.try_acquire():
+            return POLL_INTERVAL
+        wait = self.bucket.reserve() if self.bucket else 0.0
+        if wait > 0:
+            self.concurrency.release()
+        return wait
+
+    def check_circuit(self):
+        """Raises LookupDeferred if the circuit breaker would turn the request away."""
+        if self.circuit_open is not None and self.circuit_open():
+            # Imported here, as the breaker module imports this one.
+            from stairwelllib.breaker import LookupDeferred
+
+            raise LookupDeferred("Stairwell API unavailable (circuit open)")
+
+    def check_wait(self, wait: float):
+        """Raises LookupDeferred if waiting the given number of seconds to be admitted would
+        overrun the search's time budget."""
+        if self.time_left is not None and wait >= self.time_left():
+            from stairwelllib.breaker import LookupDeferred
+
+            raise LookupDeferred("search time budget spent waiting for the rate limit")
+
+    def finish(self, error: Optional[Exception] = None):
+        from stairwelllib.breaker import LookupDeferred
+
+        if isinstance(error, LookupDeferred):
+            # Turned away below without a request being made.
+            self.concurrency.release(None)
+        else:
+            self.concurrency.release(error is not None and is_retryable(error))
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Returns how long to wait before retrying a request that failed with the given error on
+        the given (0-based) attempt, or None if it shouldn't be retried."""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = retry_after(error)
+        if error.status == 429:
+            self.throttled += 1
+        if delay is None:
+            delay = self.jitter() * min(
+                self.backoff_max, self.backoff_base * 2**attempt
+            )
+        elif self.bucket:
+            # The server's instruction applies to every search, not just this request, but a
+            # Retry-After the lookup gives up on mustn't stall them for longer than a backoff.
+            self.bucket.pause(min(delay, self.backoff_max))
+        if delay > self.backoff_max:
+            return None
+        if self.time_left is not None and delay >= self.time_left():
+            return None
+        self.retries += 1
+        if self.logger:
+            self.logger.debug(
+                "retrying after %.2fs (attempt %d): %s %s",
+                delay,
+                attempt + 1,
+                error.status,
+                error.reason,
+            )
+        return delay
+
+
+class RateLimitedStairwellAPI(StairwellDataAPI):
+    """RateLimitedStairwellAPI makes requests through another StairwellAPI as its RateGovernor
+    allows, retrying those that fail with throttling or server errors."""
+
+    api: StairwellAPI
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        governor: RateGovernor,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.api = api
+        self.governor = governor
+        self.sleep = sleep
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return self._call(self.api.get_enrichment_data, kind, value)
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        self.api.prefetch(kind, values)
+
+    def _call(self, fetch: Callable[[str, str], Any], kind: str, value: str) -> Any:
+        attempt = 0
+        while True:
+            self.governor.check_circuit()
+            wait = self.governor.admit()
+            while wait > 0:
+                self.governor.check_wait(wait)
+                self.sleep(wait)
+                wait = self.governor.admit()
+            try:
+                response = fetch(kind, value)
+            except Exception as e:
+                self.governor.finish(e)
+                delay = self.governor.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                attempt += 1
+                continue
+            self.governor.finish()
+            return response
+
+
+class RateLimitedAsyncStairwellAPI(AsyncStairwellDataAPI):
+    """RateLimitedAsyncStairwellAPI is the asyncio counterpart of RateLimitedStairwellAPI."""
+
+    api: AsyncStairwellAPI
+
+    def __init__(self, api: AsyncStairwellAPI, governor: RateGovernor):
+        self.api = api
+        self.governor = governor
+
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return await self._call(self.api.get_enrichment_data, kind, value)
+
+    async def close(self):
+        await self.api.close()
+
+    async def _call(
+        self, fetch: Callable[[str, str], Any], kind: str, value: str
+    ) -> Any:
+        attempt = 0
+        while True:
+            self.governor.check_circuit()
+            wait = self.governor.admit()
+            while wait > 0:
+                self.governor.check_wait(wait)
+                await asyncio.sleep(wait)
+                wait = self.governor.admit()
+            try:
+                response = await fetch(kind, value)
+            except Exception as e:
+                self.governor.finish(e)
+                delay = self.governor.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.governor.finish()
+            return response
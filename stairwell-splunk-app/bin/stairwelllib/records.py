@@ -0,0 +1,336 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Translation of Stairwell API JSON responses straight into Splunk records.
+
+The records are the same as those built from the response models by stairwellapi.py, without
+building the models: each record field is read from the JSON and checked or converted the way the
+model would have (reusing pydantic's own parsers for integers and datetimes). Responses that
+don't look as expected raise UnexpectedData, so that the caller can fall back to the models.
+"""
+
+from typing import Any, Callable, Optional, Tuple
+from stairwelllib.client import OBJECT_INDICATOR, HOSTNAME_INDICATOR, IP_INDICATOR
+from stairwelllib.lazyimport import LazyModule
+
+datetime_parse = LazyModule("pydantic.datetime_parse")
+validators = LazyModule("pydantic.validators")
+
+# The values accepted by the models' enum fields.
+OPINION_VERDICTS = frozenset(
+    (
+        "OPINION_VERDICT_UNSPECIFIED",
+        "NO_OPINION",
+        "TRUSTED",
+        "BENIGN",
+        "GRAYWARE",
+        "MALICIOUS",
+    )
+)
+MALICIOUS_PROBABILITIES = frozenset(
+    (
+        "MALICIOUS_PROBABILITY_UNSPECIFIED",
+        "MALICIOUS_PROBABILITY_VERY_HIGH",
+        "MALICIOUS_PROBABILITY_HIGH",
+        "MALICIOUS_PROBABILITY_MEDIUM",
+        "MALICIOUS_PROBABILITY_LOW",
+    )
+)
+PKCS7_VERIFICATION_RESULTS = frozenset(
+    ("PKCS7_VERIFICATION_RESULT_UNSPECIFIED", "VALID", "INVALID", "UNSUPPORTED")
+)
+DNS_LOOKUP_STATES = frozenset(
+    (
+        "STATE_UNSPECIFIED",
+        "NOERROR",
+        "ERROR",
+        "NXDOMAIN",
+        "REFUSED",
+        "SERVFAIL",
+        "TIMEOUT",
+    )
+)
+
+# Returned by converters to leave a field out of the record.
+OMIT = object()
+
+
+class UnexpectedData(Exception):
+    """Raised when a response holds something its model would reject or convert differently."""
+
+
+def _str(value: Any) -> Optional[str]:
+    if value is None or type(value) is str:
+        return value
+    raise UnexpectedData(value)
+
+
+def _bool(value: Any) -> Optional[bool]:
+    if value is None or value is True or value is False:
+        return value
+    raise UnexpectedData(value)
+
+
+def _number(value: Any) -> Any:
+    if value is None or type(value) in (int, float):
+        return value
+    raise UnexpectedData(value)
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or type(value) is int:
+        return value
+    # Such as the strings 64-bit integers are encoded as.
+    try:
+        return validators.int_validator(value)
+    except (TypeError, ValueError):
+        raise UnexpectedData(value)
+
+
+def _isoformat(value: Any) -> str:
+    try:
+        return datetime_parse.parse_datetime(value).isoformat()
+    except (TypeError, ValueError):
+        raise UnexpectedData(value)
+
+
+def _str_list(value: Any) -> Optional[list]:
+    if value is None:
+        return None
+    if type(value) is not list or any(type(item) is not str for item in value):
+        raise UnexpectedData(value)
+    return value
+
+
+def _enum(values: frozenset) -> Callable[[Any], Optional[str]]:
+    def convert(value: Any) -> Optional[str]:
+        if value is None or (type(value) is str and value in values):
+            return value
+        raise UnexpectedData(value)
+
+    return convert
+
+
+def _items(value: Any) -> list:
+    """Checks a list of nested objects, which the models require to all be present."""
+    if type(value) is not list or any(type(item) is not dict for item in value):
+        raise UnexpectedData(value)
+    return value
+
+
+def _required_str(value: Any) -> str:
+    if type(value) is not str:
+        raise UnexpectedData(value)
+    return value
+
+
+def _opinions(value: Any) -> list:
+    if value is None:
+        return []
+    opinions = []
+    for item in _items(value):
+        _str(item.get("email"))
+        if item.get("createTime") is not None:
+            _isoformat(item["createTime"])
+        verdict = _required_str(item.get("verdict"))
+        if verdict not in OPINION_VERDICTS:
+            raise UnexpectedData(verdict)
+        opinions.append(
+            {"verdict": verdict, "environment": _required_str(item.get("environment"))}
+        )
+    return opinions
+
+
+def _comments(value: Any) -> list:
+    if value is None:
+        return []
+    comments = []
+    for item in _items(value):
+        _str(item.get("email"))
+        if item.get("createTime") is not None:
+            _isoformat(item["createTime"])
+        comments.append(
+            {
+                "body": _required_str(item.get("body")),
+                "environment": _required_str(item.get("environment")),
+            }
+        )
+    return comments
+
+
+def _without_none(*pairs: Tuple[str, Any]) -> dict:
+    return {key: value for key, value in pairs if value is not None}
+
+
+def _first_seen(value: Any) -> Any:
+    return OMIT if value is None else _isoformat(value)
+
+
+def _signature(value: Any) -> Any:
+    if value is None:
+        return OMIT
+    if type(value) is not dict:
+        raise UnexpectedData(value)
+    certificates = value.get("x509Certificates")
+    if certificates is not None:
+        certificates = [_certificate(item) for item in _items(certificates)]
+    return _without_none(
+        ("x509Certificates", certificates),
+        (
+            "pkcs7VerificationResult",
+            _enum(PKCS7_VERIFICATION_RESULTS)(value.get("pkcs7VerificationResult")),
+        ),
+    )
+
+
+def _certificate(item: dict) -> dict:
+    earliest = item.get("earliestValidTime")
+    latest = item.get("latestValidTime")
+    if latest is None:
+        # The model-based translation fails on these; leave it to report the error.
+        raise UnexpectedData(item)
+    return _without_none(
+        ("signature", _str(item.get("signature"))),
+        ("issuer", _str(item.get("issuer"))),
+        ("subject", _str(item.get("subject"))),
+        ("earliestValidTime", None if earliest is None else _isoformat(earliest)),
+        ("latestValidTime", _isoformat(latest)),
+    )
+
+
+def _prevalence(value: Any) -> Any:
+    if value is None:
+        return OMIT
+    return [
+        _without_none(
+            ("assetCount", _int(item.get("assetCount"))),
+            ("prevalence", _number(item.get("prevalence"))),
+            ("environmentId", _str(item.get("environmentId"))),
+        )
+        for item in _items(value)
+    ]
+
+
+def _dns_records(value: Any) -> Any:
+    if value is None:
+        return OMIT
+    records = []
+    for item in _items(value):
+        _enum(DNS_LOOKUP_STATES)(item.get("state"))
+        lookup_time = item.get("lookupTime")
+        if lookup_time is None:
+            # The model-based translation fails on these; leave it to report the error.
+            raise UnexpectedData(item)
+        records.append(
+            _without_none(
+                ("address", _str(item.get("address"))),
+                ("lookupTime", _isoformat(lookup_time)),
+            )
+        )
+    return records
+
+
+# Record fields of each kind of lookup, in the order stairwellapi.py produces them, as
+# (record field, JSON field, converter) entries.
+COMMON_FIELDS = (
+    ("stairwell_opinions_most_recent", "opinionsMostRecent", _opinions),
+    ("stairwell_comments_most_recent", "commentsMostRecent", _comments),
+)
+RECORD_FIELDS = {
+    IP_INDICATOR: COMMON_FIELDS
+    + (("stairwell_uninteresting_addr", "uninterestingAddr", _bool),),
+    OBJECT_INDICATOR: COMMON_FIELDS
+    + (
+        ("stairwell_object_md5", "fileHashMd5", _str),
+        ("stairwell_object_sha1", "fileHashSha1", _str),
+        ("stairwell_object_sha256", "fileHashSha256", _str),
+        ("stairwell_object_size", "fileSize", _int),
+        ("stairwell_object_first_seen_time", "sightingsFirst", _first_seen),
+        ("stairwell_object_mal_eval", "verdictMalevalLabels", _str_list),
+        (
+            "stairwell_object_mal_eval_probability",
+            "verdictMalevalMaliciousProbability",
+            _enum(MALICIOUS_PROBABILITIES),
+        ),
+        ("stairwell_object_yara_rule_matches", "verdictYaraRuleMatches", _str_list),
+        (
+            "stairwell_object_network_indicators_ip_addresses",
+            "indicatorsIpsLikely",
+            _str_list,
+        ),
+        (
+            "stairwell_object_network_indicators_hostnames",
+            "indicatorsHostnamesLikely",
+            _str_list,
+        ),
+        (
+            "stairwell_object_network_indicators_hostnames_private",
+            "indicatorsHostnamesPrivate",
+            _str_list,
+        ),
+        ("stairwell_object_magic", "fileMagic", _str),
+        ("stairwell_object_mime_type", "fileMimeType", _str),
+        ("stairwell_object_entropy", "fileEntropy", _number),
+        ("stairwell_object_imp_hash", "fileHashImphash", _str),
+        ("stairwell_object_sorted_imp_hash", "fileHashSortedImphash", _str),
+        ("stairwell_object_tlsh", "fileHashTlsh", _str),
+        ("stairwell_object_signature", "signature", _signature),
+        ("stairwell_object_prevalence", "sightingsPrevalence", _prevalence),
+        ("stairwell_object_is_well_known", "verdictIsWellKnown", _bool),
+        ("stairwell_object_variants", "variants", _str_list),
+        ("stairwell_ai_assessment", "summaryAi", _str),
+        ("stairwell_object_run_to_ground", "summaryRtg", _str),
+    ),
+    HOSTNAME_INDICATOR: COMMON_FIELDS
+    + (
+        ("stairwell_hostname_a_records", "lookupARecords", _dns_records),
+        ("stairwell_hostname_aaaa_records", "lookupAaaaRecords", _dns_records),
+        ("stairwell_hostname_mx_records", "lookupMxRecords", _dns_records),
+    ),
+}
+
+# The event and resource types recorded for each kind of lookup.
+EVENT_TYPES = {
+    IP_INDICATOR: "ipaddress",
+    OBJECT_INDICATOR: "object",
+    HOSTNAME_INDICATOR: "hostname",
+}
+
+
+def data_to_record(kind: str, value: str, data: Any, fields=None) -> dict:
+    """Translates the JSON response to a lookup into record fields. If fields (a FieldSelection)
+    is given, only the selected record fields are read and produced. Raises UnexpectedData if the
+    response doesn't look as expected."""
+    if type(data) is not dict:
+        raise UnexpectedData(data)
+    event_type = EVENT_TYPES[kind]
+    record = {}
+    for key, field_value in (
+        ("stairwell_event_type", event_type),
+        ("stairwell_resource_type", event_type),
+        ("stairwell_resource_id", value),
+    ):
+        if fields is None or key in fields:
+            record[key] = field_value
+    for key, name, convert in RECORD_FIELDS[kind]:
+        if fields is None or key in fields:
+            field_value = convert(data.get(name))
+            if field_value is not OMIT:
+                record[key] = field_value
+    if kind == HOSTNAME_INDICATOR and (
+        fields is None or "stairwell_hostname" in fields
+    ):
+        record["stairwell_hostname"] = value
+    return record
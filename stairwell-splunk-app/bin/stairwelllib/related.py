@@ -0,0 +1,170 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Background lookups of the network indicators related to enriched objects, so that the searches
+pivoting to them find them in the caches."""
+
+import queue
+import threading
+import time
+from logging import Logger
+from typing import Callable, Iterable, List, Optional, Tuple
+from stairwelllib.client import (
+    StairwellAPI,
+    StairwellDataAPI,
+    OBJECT_INDICATOR,
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+)
+from stairwelllib.indicators import normalize_hostname, normalize_ip
+
+# JSON fields of an object enrichment listing its related indicators, by kind.
+RELATED_FIELDS = (
+    (IP_INDICATOR, "indicatorsIpsLikely", normalize_ip),
+    (HOSTNAME_INDICATOR, "indicatorsHostnamesLikely", normalize_hostname),
+)
+
+# Related indicators waiting to be looked up; more are dropped.
+MAX_QUEUED = 10000
+
+# Seconds between checks of whether the search's own lookups have finished.
+IDLE_POLL_INTERVAL = 0.05
+
+# Seconds given to queued lookups to finish once the search is done.
+DEFAULT_DRAIN_TIMEOUT = 5.0
+
+
+def related_indicators(response: dict) -> List[Tuple[str, str]]:
+    """Returns the public IP addresses and hostnames an object enrichment (as JSON) relates the
+    object to, as canonical (kind, value) indicators."""
+    indicators = []
+    for kind, field, normalize in RELATED_FIELDS:
+        values = response.get(field) if isinstance(response, dict) else None
+        for value in values or ():
+            if not isinstance(value, str):
+                continue
+            normalized = normalize(value)
+            if normalized.category is None:
+                indicators.append((kind, normalized.value))
+    return indicators
+
+
+class RelatedPrefetcher:
+    """RelatedPrefetcher looks up indicators in the background, one at a time on its own thread,
+    through `api` (so that the responses land in its caches). Lookups wait while `busy` reports
+    that the search is making lookups of its own, so they only use capacity the search leaves
+    idle, and go through the same rate limit. At most `limit` distinct indicators are looked up;
+    the rest, and any submitted while MAX_QUEUED are waiting, are dropped."""
+
+    api: StairwellAPI
+
+    def __init__(
+        self,
+        api: StairwellAPI,
+        limit: int,
+        busy: Optional[Callable[[], bool]] = None,
+        logger: Optional[Logger] = None,
+    ):
+        self.api = api
+        self.limit = limit
+        self.busy = busy
+        self.logger = logger
+        self.queued = 0
+        self.looked_up = 0
+        self.dropped = 0
+        self._seen = set()
+        self._queue: "queue.Queue[Optional[Tuple[str, str]]]" = queue.Queue(MAX_QUEUED)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, indicators: Iterable[Tuple[str, str]]):
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            for indicator in indicators:
+                if indicator in self._seen:
+                    continue
+                if len(self._seen) >= self.limit:
+                    self.dropped += 1
+                    continue
+                try:
+                    self._queue.put_nowait(indicator)
+                except queue.Full:
+                    self.dropped += 1
+                    continue
+                self._seen.add(indicator)
+                self.queued += 1
+            if self._thread is None and self.queued:
+                self._thread = threading.Thread(
+                    target=self._run, name="stairwell-related", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            indicator = self._queue.get()
+            if indicator is None:
+                return
+            while self.busy is not None and self.busy():
+                if self._stopped.wait(IDLE_POLL_INTERVAL):
+                    return
+            kind, value = indicator
+            try:
+                self.api.get_enrichment_data(kind, value)
+            except Exception as e:
+                # Errors are cached like any other answer; there's no record to report them on.
+                if self.logger:
+                    self.logger.debug(
+                        "related lookup of %s %s failed: %s", kind, value, e
+                    )
+            self.looked_up += 1
+
+    def close(self, timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Waits up to timeout seconds for the queued lookups to be made, then drops the rest."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            deadline = time.monotonic() + timeout
+            while self.looked_up < self.queued and time.monotonic() < deadline:
+                time.sleep(IDLE_POLL_INTERVAL)
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.dropped += self.queued - self.looked_up
+        if thread is not None:
+            thread.join(IDLE_POLL_INTERVAL)
+
+
+class RelatedPrefetchingStairwellAPI(StairwellDataAPI):
+    """RelatedPrefetchingStairwellAPI passes lookups on to another StairwellAPI, and hands the
+    indicators related to each object it returns to a RelatedPrefetcher."""
+
+    api: StairwellAPI
+
+    def __init__(self, api: StairwellAPI, prefetcher: RelatedPrefetcher):
+        self.api = api
+        self.prefetcher = prefetcher
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        response = self.api.get_enrichment_data(kind, value)
+        if kind == OBJECT_INDICATOR:
+            self.prefetcher.submit(related_indicators(response))
+        return response
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        self.api.prefetch(kind, values)
@@ -0,0 +1,328 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local enrichment service shared by the searches running on a search head.
+
+A long-lived process (the stairwell_sidecar modular input) holds the API client, its connections
+and caches, and serves lookups over a Unix socket. Searches make their lookups through a
+SidecarStairwellAPI instead of a client of their own, so that concurrent searches share warm
+connections and cached responses, and an indicator being looked up for one search isn't looked
+up again for another at the same time.
+
+The protocol is one JSON object per line in each direction: a request {"kind", "value"} is
+answered by {"data": <enrichment>} or {"error": {"status", "reason"}}, with "deferred" set in
+the error if the lookup was deferred rather than answered by the API."""
+
+import errno
+import json
+import os
+import socket
+import socketserver
+import threading
+from logging import Logger
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.client import StairwellAPI, StairwellDataAPI, api_exception, conf_bool
+from stairwelllib.lazyimport import appapi
+
+# Stanza of stairwell.conf configuring the service.
+SIDECAR_STANZA = "sidecar"
+
+# Seconds a search waits on a lookup made through the service. Lookups wait on the service's rate
+# limit and retries, so this is well above the client's own timeouts.
+DEFAULT_TIMEOUT = 120.0
+
+# Longest request or response line accepted, in bytes.
+MAX_LINE = 64 * 1024 * 1024
+
+
+def default_socket_path() -> Optional[str]:
+    """Returns the location of the service's socket, or None outside of Splunk."""
+    splunk_home = os.environ.get("SPLUNK_HOME")
+    if not splunk_home:
+        return None
+    return os.path.join(splunk_home, "var", "run", "stairwell", "enrichment.sock")
+
+
+class SidecarSettings(NamedTuple):
+    """Settings of the [sidecar] stanza of stairwell.conf."""
+
+    # Whether searches make their lookups through the service (when it's running).
+    enabled: bool = False
+    # Location of the service's socket; if None, the default location is used.
+    socket_path: Optional[str] = None
+    # Seconds a search waits on each lookup.
+    timeout: float = DEFAULT_TIMEOUT
+
+    @classmethod
+    def from_conf(cls, stanza: dict) -> "SidecarSettings":
+        """Reads settings from a conf stanza, falling back to the defaults for missing keys."""
+        defaults = cls()
+        return cls(
+            enabled=conf_bool(stanza.get("enabled", defaults.enabled)),
+            socket_path=stanza.get("socket_path") or None,
+            timeout=float(stanza.get("timeout") or defaults.timeout),
+        )
+
+
+class SingleFlight:
+    """SingleFlight runs at most one call per key at a time: callers asking for a key that is
+    already being computed wait for that call, and share its result or exception."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    # Calls that waited on another caller's call rather than making their own.
+    shared: int
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "SingleFlight._Call"] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error.with_traceback(None)
+        return call.result
+
+
+class CoalescingStairwellAPI(StairwellDataAPI):
+    """CoalescingStairwellAPI passes lookups on to another StairwellAPI, making identical lookups
+    that are in flight at the same time only once."""
+
+    api: StairwellAPI
+
+    def __init__(self, api: StairwellAPI):
+        self.api = api
+        self.flights = SingleFlight()
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        return self.flights.do(
+            (kind, value), lambda: self.api.get_enrichment_data(kind, value)
+        )
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        self.api.prefetch(kind, values)
+
+
+def encode_error(error: Exception) -> dict:
+    return {
+        "error": {
+            "status": getattr(error, "status", None),
+            "reason": str(getattr(error, "reason", None) or error),
+            "deferred": isinstance(error, LookupDeferred),
+        }
+    }
+
+
+def decode_error(error: dict) -> Exception:
+    reason = error.get("reason") or "enrichment service error"
+    if error.get("deferred"):
+        return LookupDeferred(reason)
+    status = error.get("status")
+    if isinstance(status, int):
+        return api_exception(status, reason)
+    return appapi.ApiException(status=0, reason=reason)
+
+
+class _SidecarHandler(socketserver.StreamRequestHandler):
+    server: "SidecarServer"
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_LINE)
+            if not line:
+                return
+            self.wfile.write(self.server.answer(line))
+            self.wfile.flush()
+
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """SidecarServer answers lookups made over a Unix socket at `path` through `api`, on a thread
+    per connection. The socket is only accessible to the user running the service (and so
+    Splunk). A stale socket left by a previous service is replaced, but one that is still served
+    isn't: the constructor raises OSError (EADDRINUSE) instead."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, api: StairwellAPI, logger: Optional[Logger] = None):
+        self.api = api
+        self.logger = logger
+        self.requests = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            if is_serving(path):
+                raise OSError(
+                    errno.EADDRINUSE, "enrichment service already running", path
+                )
+            os.unlink(path)
+        previous = os.umask(0o077)
+        try:
+            super().__init__(path, _SidecarHandler)
+        finally:
+            os.umask(previous)
+
+    def answer(self, line: bytes) -> bytes:
+        """Answers a request line with a response line."""
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            response = {
+                "data": self.api.get_enrichment_data(request["kind"], request["value"])
+            }
+        except (LookupDeferred, appapi.ApiException) as e:
+            response = encode_error(e)
+        except (ValueError, KeyError, TypeError) as e:
+            response = encode_error(ValueError(f"bad request: {e}"))
+        except Exception as e:
+            if self.logger:
+                self.logger.error("enrichment service lookup failed: %s", e)
+            response = encode_error(e)
+        return json.dumps(response, default=str).encode() + b"\n"
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def is_serving(path: str) -> bool:
+    """Returns whether an enrichment service accepts connections at path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1.0)
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+class SidecarStairwellAPI(StairwellDataAPI):
+    """SidecarStairwellAPI makes lookups through the enrichment service listening at `path`, over
+    a connection per thread. Errors are raised as the service's client raised them. If the service
+    can't be reached, lookups are deferred. Each lookup waits `timeout` seconds at most, or for
+    what `time_left` (if given) returns, if that's less."""
+
+    path: str
+
+    def __init__(
+        self,
+        path: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        time_left: Optional[Callable[[], float]] = None,
+    ):
+        self.path = path
+        self.timeout = timeout
+        self.time_left = time_left
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        request = json.dumps({"kind": kind, "value": value}).encode() + b"\n"
+        try:
+            try:
+                line = self._exchange(request)
+            except socket.timeout:
+                raise
+            except OSError:
+                # The service may have been restarted since the connection was opened: try again
+                # on a new connection before giving up on it.
+                self._disconnect()
+                line = self._exchange(request)
+        except OSError as e:
+            self._disconnect()
+            raise LookupDeferred(f"enrichment service unavailable: {e}")
+        response = json.loads(line)
+        if "error" in response:
+            raise decode_error(response["error"])
+        return response["data"]
+
+    def _exchange(self, request: bytes) -> bytes:
+        timeout = self.timeout
+        if self.time_left is not None:
+            timeout = min(timeout, self.time_left())
+            if timeout <= 0:
+                raise LookupDeferred("search time budget spent")
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            connection = self._local.connection = (sock, sock.makefile("rwb"))
+            with self._lock:
+                self._connections.append(connection)
+        else:
+            connection[0].settimeout(timeout)
+        _, stream = connection
+        stream.write(request)
+        stream.flush()
+        line = stream.readline(MAX_LINE)
+        if not line.endswith(b"\n"):
+            raise ConnectionError("connection closed by the enrichment service")
+        return line
+
+    def _disconnect(self):
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            _close(connection)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            _close(connection)
+
+
+def _close(connection):
+    sock, stream = connection
+    try:
+        stream.close()
+    except OSError:
+        pass
+    sock.close()
@@ -15,26 +15,66 @@
 
 """Functions for translating Stairwell API responses into Splunk records."""
 
+from __future__ import annotations
+
 from datetime import datetime
-from inspect import signature
+from fnmatch import fnmatchcase
 from logging import Logger
-from stairwelllib.client import StairwellAPI
-from stairwelllib.stairwell_appapi_client import (
-    ApiException,
-    IPEventEnrichment,
-    ObjectEventEnrichment,
-    HostnameEventEnrichment,
-    Opinion,
-    Comment,
-    ObjectSignature,
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.client import (
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+    OBJECT_INDICATOR,
+    StairwellAPI,
+    response_from_data,
 )
-from typing import Optional, List
+from stairwelllib.lazyimport import appapi
+from stairwelllib.records import UnexpectedData, data_to_record
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, List
+
+if TYPE_CHECKING:
+    from stairwell_appapi_client import (
+        IPEventEnrichment,
+        ObjectEventEnrichment,
+        HostnameEventEnrichment,
+        Opinion,
+        Comment,
+        ObjectSignature,
+    )
 
 SPLUNK_IP_ADDRESS_ATTRIBUTE = "ipaddress"
 SPLUNK_OBJECT_ATTRIBUTE = "object"
 SPLUNK_HOSTNAME_ATTRIBUTE = "hostname"
 
 
+class FieldSelection:
+    """The record fields to produce, given as names or wildcard patterns (for example
+    `stairwell_object_*`). Error fields are always produced."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = [p for p in patterns if p != ""]
+        self._matches: Dict[str, bool] = {}
+
+    def __contains__(self, key: str) -> bool:
+        match = self._matches.get(key)
+        if match is None:
+            match = any(fnmatchcase(key, p) for p in self.patterns)
+            self._matches[key] = match
+        return match
+
+
+def wanted(fields: Optional[FieldSelection], key: str) -> bool:
+    """Reports whether a record field is to be produced. All fields are, when fields is None."""
+    return fields is None or key in fields
+
+
+def project(record: dict, fields: Optional[FieldSelection]) -> dict:
+    """Drops the fields of a record that weren't selected."""
+    if fields is None:
+        return record
+    return {key: value for key, value in record.items() if key in fields}
+
+
 def opinions_to_dicts(opinions: Optional[List[Opinion]]) -> List[dict]:
     if opinions == None:
         return []
@@ -48,10 +88,27 @@ def comments_to_dicts(comments: Optional[List[Comment]]) -> List[dict]:
 
 
 def search_stairwell_ip_addresses_api(
-    client: StairwellAPI, logger: Logger, ip_value: str
+    client: StairwellAPI,
+    logger: Logger,
+    ip_value: str,
+    fields: Optional[FieldSelection] = None,
 ) -> dict:
-    """Calls Stairwell API with an IP Address lookup"""
+    """Calls Stairwell API with an IP Address lookup. If fields is given, only the selected record
+    fields are produced."""
     logger.debug("Entered search_stairwell_ip_addresses_api")
+    response: IPEventEnrichment
+    try:
+        response = client.get_ip_event_enrichment(ip_value)
+    except (LookupDeferred, appapi.ApiException) as e:
+        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
+    return ip_address_response_to_record(ip_value, response, fields)
+
+
+def ip_address_response_to_record(
+    ip_value: str,
+    response: IPEventEnrichment,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
     record = {}
 
     # Set non-response fields
@@ -59,24 +116,20 @@ def search_stairwell_ip_addresses_api(
     record["stairwell_resource_type"] = SPLUNK_IP_ADDRESS_ATTRIBUTE
     record["stairwell_resource_id"] = ip_value
 
-    response: IPEventEnrichment
-    try:
-        response = client.get_ip_event_enrichment(ip_value)
-    except ApiException as e:
-        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
-
     # Set common fields
-    record["stairwell_opinions_most_recent"] = opinions_to_dicts(
-        response.opinions_most_recent
-    )
-    record["stairwell_comments_most_recent"] = comments_to_dicts(
-        response.comments_most_recent
-    )
+    if wanted(fields, "stairwell_opinions_most_recent"):
+        record["stairwell_opinions_most_recent"] = opinions_to_dicts(
+            response.opinions_most_recent
+        )
+    if wanted(fields, "stairwell_comments_most_recent"):
+        record["stairwell_comments_most_recent"] = comments_to_dicts(
+            response.comments_most_recent
+        )
 
     # Set IP-specific fields
     record["stairwell_uninteresting_addr"] = response.uninteresting_addr
 
-    return record
+    return project(record, fields)
 
 
 def signature_to_dict(signature: ObjectSignature) -> dict:
@@ -97,10 +150,28 @@ def signature_to_dict(signature: ObjectSignature) -> dict:
 
 
 def search_stairwell_object_api(
-    client: StairwellAPI, logger: Logger, object_value: str
+    client: StairwellAPI,
+    logger: Logger,
+    object_value: str,
+    fields: Optional[FieldSelection] = None,
 ) -> dict:
-    """Calls Stairwell API with an Object lookup"""
+    """Calls Stairwell API with an Object lookup. If fields is given, only the selected record
+    fields are produced, and the conversion of fields that weren't selected is skipped.
+    """
     logger.debug("Entered search_stairwell_object_api")
+    response: ObjectEventEnrichment
+    try:
+        response = client.get_object_event_enrichment(object_value)
+    except (LookupDeferred, appapi.ApiException) as e:
+        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
+    return object_response_to_record(object_value, response, fields)
+
+
+def object_response_to_record(
+    object_value: str,
+    response: ObjectEventEnrichment,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
     record = {}
 
     # Set non-response resources
@@ -108,26 +179,24 @@ def search_stairwell_object_api(
     record["stairwell_resource_type"] = SPLUNK_OBJECT_ATTRIBUTE
     record["stairwell_resource_id"] = object_value
 
-    response: ObjectEventEnrichment
-    try:
-        response = client.get_object_event_enrichment(object_value)
-    except ApiException as e:
-        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
-
     # Set common fields
-    record["stairwell_opinions_most_recent"] = opinions_to_dicts(
-        response.opinions_most_recent
-    )
-    record["stairwell_comments_most_recent"] = comments_to_dicts(
-        response.comments_most_recent
-    )
+    if wanted(fields, "stairwell_opinions_most_recent"):
+        record["stairwell_opinions_most_recent"] = opinions_to_dicts(
+            response.opinions_most_recent
+        )
+    if wanted(fields, "stairwell_comments_most_recent"):
+        record["stairwell_comments_most_recent"] = comments_to_dicts(
+            response.comments_most_recent
+        )
 
     # Set object-specific fields
     record["stairwell_object_md5"] = response.file_hash_md5
     record["stairwell_object_sha1"] = response.file_hash_sha1
     record["stairwell_object_sha256"] = response.file_hash_sha256
     record["stairwell_object_size"] = response.file_size
-    if response.sightings_first != None:
+    if response.sightings_first != None and wanted(
+        fields, "stairwell_object_first_seen_time"
+    ):
         record["stairwell_object_first_seen_time"] = (
             response.sightings_first.isoformat()
         )
@@ -152,10 +221,12 @@ def search_stairwell_object_api(
     record["stairwell_object_sorted_imp_hash"] = response.file_hash_sorted_imphash
     record["stairwell_object_tlsh"] = response.file_hash_tlsh
 
-    if response.signature != None:
+    if response.signature != None and wanted(fields, "stairwell_object_signature"):
         record["stairwell_object_signature"] = signature_to_dict(response.signature)
 
-    if response.sightings_prevalence != None:
+    if response.sightings_prevalence != None and wanted(
+        fields, "stairwell_object_prevalence"
+    ):
         record["stairwell_object_prevalence"] = [
             p.to_dict() for p in response.sightings_prevalence
         ]
@@ -165,7 +236,7 @@ def search_stairwell_object_api(
     record["stairwell_ai_assessment"] = response.summary_ai
     record["stairwell_object_run_to_ground"] = response.summary_rtg
 
-    return record
+    return project(record, fields)
 
 
 def hostname_record_to_dict(record) -> dict:
@@ -180,10 +251,27 @@ def hostname_record_to_dict(record) -> dict:
 
 
 def search_stairwell_hostname_api(
-    client: StairwellAPI, logger: Logger, hostname_value: str
+    client: StairwellAPI,
+    logger: Logger,
+    hostname_value: str,
+    fields: Optional[FieldSelection] = None,
 ) -> dict:
-    """Calls Stairwell API with a hostname lookup"""
+    """Calls Stairwell API with a hostname lookup. If fields is given, only the selected record
+    fields are produced."""
     logger.debug("Entered search_stairwell_hostname_api")
+    response: HostnameEventEnrichment
+    try:
+        response = client.get_hostname_event_enrichment(hostname_value)
+    except (LookupDeferred, appapi.ApiException) as e:
+        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
+    return hostname_response_to_record(hostname_value, response, fields)
+
+
+def hostname_response_to_record(
+    hostname_value: str,
+    response: HostnameEventEnrichment,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
     record = {}
 
     # Set non-response resources
@@ -191,32 +279,99 @@ def search_stairwell_hostname_api(
     record["stairwell_resource_type"] = SPLUNK_HOSTNAME_ATTRIBUTE
     record["stairwell_resource_id"] = hostname_value
 
-    response: HostnameEventEnrichment
-    try:
-        response = client.get_hostname_event_enrichment(hostname_value)
-    except ApiException as e:
-        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
-
     # Set common fields
-    record["stairwell_opinions_most_recent"] = opinions_to_dicts(
-        response.opinions_most_recent
-    )
-    record["stairwell_comments_most_recent"] = comments_to_dicts(
-        response.comments_most_recent
-    )
+    if wanted(fields, "stairwell_opinions_most_recent"):
+        record["stairwell_opinions_most_recent"] = opinions_to_dicts(
+            response.opinions_most_recent
+        )
+    if wanted(fields, "stairwell_comments_most_recent"):
+        record["stairwell_comments_most_recent"] = comments_to_dicts(
+            response.comments_most_recent
+        )
     # Set hostname-specific fields
-    if response.lookup_a_records != None:
+    if response.lookup_a_records != None and wanted(
+        fields, "stairwell_hostname_a_records"
+    ):
         record["stairwell_hostname_a_records"] = [
             hostname_record_to_dict(r) for r in response.lookup_a_records
         ]
-    if response.lookup_aaaa_records != None:
+    if response.lookup_aaaa_records != None and wanted(
+        fields, "stairwell_hostname_aaaa_records"
+    ):
         record["stairwell_hostname_aaaa_records"] = [
             hostname_record_to_dict(r) for r in response.lookup_aaaa_records
         ]
-    if response.lookup_mx_records != None:
+    if response.lookup_mx_records != None and wanted(
+        fields, "stairwell_hostname_mx_records"
+    ):
         record["stairwell_hostname_mx_records"] = [
             hostname_record_to_dict(r) for r in response.lookup_mx_records
         ]
     record["stairwell_hostname"] = hostname_value
 
-    return record
+    return project(record, fields)
+
+
+RESPONSE_TO_RECORD = {
+    IP_INDICATOR: ip_address_response_to_record,
+    OBJECT_INDICATOR: object_response_to_record,
+    HOSTNAME_INDICATOR: hostname_response_to_record,
+}
+
+
+def search_stairwell_data(
+    client: StairwellAPI,
+    logger: Logger,
+    kind: str,
+    value: str,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
+    """Calls Stairwell API with a lookup of the given kind, translating the JSON response straight
+    into a record. Responses that can't be translated directly go through the response models,
+    producing the same record (or error) as the search_stairwell_*_api functions."""
+    try:
+        data = client.get_enrichment_data(kind, value)
+    except (LookupDeferred, appapi.ApiException) as e:
+        return {"stairwell_error": str(e), "stairwell_status": str(e.status)}
+    try:
+        return data_to_record(kind, value, data, fields)
+    except UnexpectedData:
+        logger.debug("translating %s %s through its model", kind, value)
+    return RESPONSE_TO_RECORD[kind](value, response_from_data(kind, data), fields)
+
+
+def search_stairwell_ip_addresses_data(
+    client: StairwellAPI,
+    logger: Logger,
+    ip_value: str,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
+    return search_stairwell_data(client, logger, IP_INDICATOR, ip_value, fields)
+
+
+def search_stairwell_object_data(
+    client: StairwellAPI,
+    logger: Logger,
+    object_value: str,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
+    return search_stairwell_data(client, logger, OBJECT_INDICATOR, object_value, fields)
+
+
+def search_stairwell_hostname_data(
+    client: StairwellAPI,
+    logger: Logger,
+    hostname_value: str,
+    fields: Optional[FieldSelection] = None,
+) -> dict:
+    return search_stairwell_data(
+        client, logger, HOSTNAME_INDICATOR, hostname_value, fields
+    )
+
+
+# The search_stairwell_*_data functions, by indicator kind.
+DATA_SEARCHES = {
+    IP_INDICATOR: search_stairwell_ip_addresses_data,
+    OBJECT_INDICATOR: search_stairwell_object_data,
+    HOSTNAME_INDICATOR: search_stairwell_hostname_data,
+}
@@ -1,13 +1,70 @@
 # Copyright (C) 2025 Stairwell Inc.
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import splunk
 
+LOGGER_NAME = "splunk.stairwell"
+
+# Messages waiting to be written by the background thread. Once the queue is full, further
+# messages are dropped rather than slowing down the search.
+LOG_QUEUE_SIZE = 10000
+
+# Per-record debug messages are logged for the first DEBUG_RECORD_LIMIT records of a search, and
+# then for one record in every DEBUG_RECORD_SAMPLE.
+DEBUG_RECORD_LIMIT = 100
+DEBUG_RECORD_SAMPLE = 1000
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """DeferredQueueHandler hands records to a background thread without formatting them first,
+    so that the cost of formatting (and of writing to disk) is not paid by the thread logging.
+    Arguments of log calls must therefore not be changed after they are logged. When the queue is
+    full, records are dropped and counted."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks refer to frames that may have changed by the time the record is written.
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """LogSampler picks which of a stream of similar messages to log: the first `limit`, and then
+    one in every `every` (none if every is 0)."""
+
+    def __init__(
+        self, limit: int = DEBUG_RECORD_LIMIT, every: int = DEBUG_RECORD_SAMPLE
+    ):
+        self.limit = limit
+        self.every = every
+        self.seen = 0
+
+    def sample(self) -> bool:
+        self.seen += 1
+        if self.seen <= self.limit:
+            return True
+        return self.every > 0 and (self.seen - self.limit) % self.every == 0
+
 
 def setup_logging():
-    logger = logging.getLogger("splunk.stairwell")
+    logger = logging.getLogger(LOGGER_NAME)
+    # The handler is only installed once per process, however many times this is called.
+    if any(isinstance(h, DeferredQueueHandler) for h in logger.handlers):
+        return logger
     SPLUNK_HOME = os.environ["SPLUNK_HOME"]
 
     LOGGING_DEFAULT_CONFIG_FILE = os.path.join(SPLUNK_HOME, "etc", "log.cfg")
@@ -20,7 +77,13 @@ def setup_logging():
         os.path.join(SPLUNK_HOME, BASE_LOG_PATH, LOGGING_FILE_NAME), mode="a"
     )
     splunk_log_handler.setFormatter(logging.Formatter(LOGGING_FORMAT))
-    logger.addHandler(splunk_log_handler)
+
+    # The file is written from a background thread, which is flushed when the process exits.
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, splunk_log_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(DeferredQueueHandler(log_queue))
     splunk.setupSplunkLogger(
         logger,
         LOGGING_DEFAULT_CONFIG_FILE,
@@ -0,0 +1,216 @@
+# Copyright (C) 2025 Stairwell Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License found in the LICENSE file in the root directory of
+# this source tree. Also found at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Per-search performance telemetry: counters, latency histograms and time spent in each stage of
+enrichment, summarized once the search is done."""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+from stairwelllib.asyncclient import AsyncStairwellAPI, AsyncStairwellDataAPI
+from stairwelllib.client import StairwellAPI, StairwellDataAPI, conf_bool
+
+# Stanza of stairwell.conf holding the telemetry settings.
+TELEMETRY_STANZA = "telemetry"
+
+# Upper bounds, in milliseconds, of the latency histograms' buckets. Slower calls are counted in
+# a last, unbounded bucket.
+LATENCY_BUCKETS_MS = (
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    2000,
+    5000,
+    10000,
+    30000,
+)
+
+# The sourcetype of metrics sent to a metrics index, which Splunk parses without configuration.
+METRICS_SOURCETYPE = "metrics_csv"
+METRIC_PREFIX = "stairwell."
+
+
+class TelemetrySettings(NamedTuple):
+    """Telemetry settings, configured in the [telemetry] stanza of stairwell.conf."""
+
+    # Whether a summary of each search is logged to stairwell.log.
+    log: bool = True
+    # Metrics index to also send the summary to, if any.
+    metrics_index: str = ""
+
+    @classmethod
+    def from_conf(cls, stanza: dict) -> "TelemetrySettings":
+        defaults = cls()
+        return cls(
+            log=conf_bool(stanza.get("log", defaults.log)),
+            metrics_index=str(stanza.get("metrics_index") or "").strip(),
+        )
+
+
+class Histogram:
+    """Histogram counts observations in fixed buckets, so that percentiles can be estimated
+    without keeping every observation. Estimates are the upper bound of the bucket the
+    percentile falls in (or the maximum, if that is lower)."""
+
+    def __init__(self, bounds: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = self.count * percentile / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self, name: str) -> Dict[str, float]:
+        return {
+            f"{name}.count": self.count,
+            f"{name}.avg": self.total / self.count if self.count else 0.0,
+            f"{name}.p50": self.percentile(50),
+            f"{name}.p90": self.percentile(90),
+            f"{name}.p99": self.percentile(99),
+            f"{name}.max": self.max,
+        }
+
+
+class Telemetry:
+    """Telemetry collects a search's counters (such as `lookups.object`), latency histograms (in
+    milliseconds, such as `request_ms`) and time spent in each stage (in seconds, such as
+    `stage.resolve`). It may be updated from several threads."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, milliseconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(milliseconds)
+
+    def summary(self) -> Dict[str, float]:
+        """Returns every measurement as a flat mapping of names to numbers."""
+        with self._lock:
+            summary = {"elapsed_seconds": self.clock() - self.started}
+            summary.update(self.counters)
+            for name, histogram in self.histograms.items():
+                summary.update(histogram.summary(name))
+        return {name: summary[name] for name in sorted(summary)}
+
+
+def format_summary(summary: Dict[str, float]) -> str:
+    """Formats a summary as space-separated key=value pairs, which Splunk extracts as fields."""
+    return " ".join(
+        f"{name}={round(value, 3) if isinstance(value, float) else value}"
+        for name, value in summary.items()
+    )
+
+
+def metrics_csv(summary: Dict[str, float], timestamp: Optional[float] = None) -> str:
+    """Formats a summary in the metrics_csv format, one metric per line."""
+    timestamp = time.time() if timestamp is None else timestamp
+    lines = ["metric_timestamp,metric_name,_value"]
+    for name, value in summary.items():
+        lines.append(f"{timestamp:.3f},{METRIC_PREFIX}{name},{value}")
+    return "\n".join(lines) + "\n"
+
+
+def _status(error: Exception) -> str:
+    status = getattr(error, "status", None)
+    return str(status) if status is not None else type(error).__name__
+
+
+class MeasuringStairwellAPI(StairwellDataAPI):
+    """MeasuringStairwellAPI makes lookups through another StairwellAPI, counting them by kind
+    (`<name>s.<kind>`) and failures by status (`<name>_errors.<status>`), and recording their
+    latency (`<name>_ms`)."""
+
+    api: StairwellAPI
+
+    def __init__(self, api: StairwellAPI, telemetry: Telemetry, name: str):
+        self.api = api
+        self.telemetry = telemetry
+        self.name = name
+
+    def get_enrichment_data(self, kind: str, value: str) -> dict:
+        telemetry = self.telemetry
+        started = telemetry.clock()
+        try:
+            return self.api.get_enrichment_data(kind, value)
+        except Exception as e:
+            telemetry.count(f"{self.name}_errors.{_status(e)}")
+            raise
+        finally:
+            telemetry.count(f"{self.name}s.{kind}")
+            telemetry.observe(f"{self.name}_ms", (telemetry.clock() - started) * 1000)
+
+    def prefetch(self, kind: str, values: Iterable[str]):
+        self.api.prefetch(kind, values)
+
+
+class MeasuringAsyncStairwellAPI(AsyncStairwellDataAPI):
+    """MeasuringAsyncStairwellAPI is the asyncio counterpart of MeasuringStairwellAPI."""
+
+    api: AsyncStairwellAPI
+
+    def __init__(self, api: AsyncStairwellAPI, telemetry: Telemetry, name: str):
+        self.api = api
+        self.telemetry = telemetry
+        self.name = name
+
+    async def get_enrichment_data(self, kind: str, value: str) -> dict:
+        telemetry = self.telemetry
+        started = telemetry.clock()
+        try:
+            return await self.api.get_enrichment_data(kind, value)
+        except Exception as e:
+            telemetry.count(f"{self.name}_errors.{_status(e)}")
+            raise
+        finally:
+            telemetry.count(f"{self.name}s.{kind}")
+            telemetry.observe(f"{self.name}_ms", (telemetry.clock() - started) * 1000)
+
+    async def close(self):
+        await self.api.close()
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from stairwell import Stairwell
+from stairwelllib.asyncclient import (
+    AsyncStairwellAPI,
+    AsyncStairwellAPIAdapter,
+    AsyncStairwellEnrichmentClient,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import FAILING_IP
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+class EnrichmentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    auth_headers = set()
+    compressed = 0
+
+    def setup(self):
+        super().setup()
+        EnrichmentHandler.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        EnrichmentHandler.auth_headers.add(self.headers["Authorization"])
+        if self.path.endswith("/missing"):
+            status, body = 404, b'{"code": 5, "message": "not found"}'
+        elif "/ip_event/" in self.path:
+            status, body = 200, json.dumps({"uninterestingAddr": True}).encode()
+        else:
+            status = 200
+            body = json.dumps({"fileHashSha256": self.path.split("/")[-1]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            EnrichmentHandler.compressed += 1
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EnrichmentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_async_client_prefetch_reuses_connections():
+    EnrichmentHandler.connections = 0
+    server = start_server()
+    try:
+        client = AsyncStairwellEnrichmentClient(
+            f"http://127.0.0.1:{server.server_port}/",
+            "token",
+            "org",
+            "user",
+            logger,
+            max_connections=4,
+        )
+        adapter = AsyncStairwellAPIAdapter(client, concurrency=16)
+        ips = [f"10.0.0.{i}" for i in range(50)]
+        adapter.prefetch("ip", ips)
+        for ip in ips:
+            assert adapter.get_ip_event_enrichment(ip).uninteresting_addr == True
+
+        # Not prefetched: made on demand, over the same pool.
+        res = adapter.get_object_event_enrichment("sha256")
+        assert res.file_hash_sha256 == "sha256"
+        try:
+            adapter.get_object_event_enrichment("missing")
+            assert False, "expected ApiException"
+        except ApiException as e:
+            assert e.status == 404
+        adapter.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert EnrichmentHandler.connections <= 4
+    assert EnrichmentHandler.auth_headers == {"token"}
+    stats = client.connection_stats()
+    assert stats.requests == 52
+    assert stats.reuse_rate >= 0.9
+
+
+class FakeAsyncStairwellClient(AsyncStairwellAPI):
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        return ObjectEventEnrichment(file_hash_sha256=hash)
+
+    async def get_hostname_event_enrichment(
+        self, hostname: str
+    ) -> HostnameEventEnrichment:
+        return HostnameEventEnrichment()
+
+    async def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if ip == FAILING_IP:
+            raise ApiException(status=500, reason="we messed up big time")
+        return IPEventEnrichment(uninteresting_addr=False)
+
+
+def test_stream_async_engine():
+    fake_client = FakeAsyncStairwellClient()
+    command = Stairwell(
+        client=AsyncStairwellAPIAdapter(fake_client, concurrency=100),
+        custom_logger=logger,
+    )
+    command.ip = "ip"
+    command.cache = "none"
+    command.engine = "async"
+
+    records = [{"ip": f"1.0.{i // 256}.{i % 256}", "n": i} for i in range(500)]
+    records.append({"ip": FAILING_IP, "n": 500})
+    res = list(command.stream(records))
+
+    assert [r["n"] for r in res] == list(range(501))
+    assert res[0]["stairwell_uninteresting_addr"] == False
+    assert res[500]["stairwell_status"] == "500"
+    assert fake_client.max_in_flight == 100
+
+
+def test_adapter_drops_unclaimed_prefetches():
+    fake_client = FakeAsyncStairwellClient()
+    adapter = AsyncStairwellAPIAdapter(fake_client)
+    adapter.prefetch("ip", ["1.1.1.1", FAILING_IP])
+    adapter.get_ip_event_enrichment("1.1.1.1")
+
+    # The next batch's lookups run: the failure nobody claimed isn't kept around.
+    adapter.prefetch("ip", ["2.2.2.2"])
+    adapter.get_ip_event_enrichment("2.2.2.2")
+    assert adapter._prefetched == {}
+    adapter.close()
@@ -0,0 +1,92 @@
+import json
+import urllib.error
+import urllib.request
+from benchmark import load_samples, run_benchmark, scale_events
+from mockapi import MockServer, MockSettings
+from stairwelllib.client import (
+    HOSTNAME_INDICATOR,
+    IP_INDICATOR,
+    OBJECT_INDICATOR,
+    response_from_data,
+)
+
+
+def get(url: str):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def test_mock_api_responses():
+    server = MockServer(MockSettings(payload_size=4096, not_found_rate=0.5)).start()
+    try:
+        base = server.base_url + "appapi/enrichment/v1/"
+        found = [f"{i:064x}" for i in range(20)]
+        statuses = [get(base + "object_event/" + name)[0] for name in found]
+        assert statuses.count(404) not in (0, 20)
+        # Whether an indicator is known doesn't change between requests.
+        assert [get(base + "object_event/" + name)[0] for name in found] == statuses
+
+        name = found[statuses.index(200)]
+        for kind, resource in (
+            (OBJECT_INDICATOR, "object_event/" + name),
+            (HOSTNAME_INDICATOR, "hostname_event/example.com"),
+            (IP_INDICATOR, "ip_event/10.0.0.1"),
+        ):
+            status, data = get(base + resource)
+            if status == 200:
+                assert len(json.dumps(data)) >= 4096
+                response_from_data(kind, data)
+        assert get(base + "unknown/x")[0] == 404
+    finally:
+        server.stop()
+
+
+def test_mock_api_errors():
+    server = MockServer(MockSettings(throttle_rate=0.5, error_rate=0.5)).start()
+    try:
+        statuses = {
+            get(server.base_url + f"appapi/enrichment/v1/ip_event/10.0.0.{i}")[0]
+            for i in range(20)
+        }
+        assert statuses == {429, 503}
+        assert get(server.base_url + "stats")[1]["requests"] == 20
+    finally:
+        server.stop()
+
+
+def test_scale_events():
+    samples = load_samples()
+    assert any("event.Process.SHA256" in event for event in samples)
+    assert any("hash_sha256" in event and "_raw" in event for event in samples)
+
+    events = scale_events(samples, 10 * len(samples), distinct=2 * len(samples))
+    assert len(events) == 10 * len(samples)
+    hashes = {event["hash_sha256"] for event in events if "hash_sha256" in event}
+    originals = {event["hash_sha256"] for event in samples if "hash_sha256" in event}
+    assert originals < hashes
+    assert len(hashes) == 2 * len(originals)
+
+
+def test_run_benchmark():
+    server = MockServer(MockSettings(throttle_rate=0.1, retry_after=0, seed=1)).start()
+    try:
+        events = scale_events(load_samples(), 200, distinct=50)
+        result, records = run_benchmark(
+            server.base_url, events, {"retries": "10"}, chunk_size=64
+        )
+    finally:
+        server.stop()
+
+    assert result.records == len(records) == 200
+    assert result.records_per_second > 0
+    assert 0 < result.p50_ms <= result.p99_ms
+    assert result.peak_rss_mb > 0
+    assert result.requests.get("429", 0) > 0
+    assert all("stairwell_status" not in record for record in records)
+    enriched = [r for r in records if "stairwell_hash_sha256_object_sha256" in r]
+    assert len(enriched) > 0
+    # The private addresses of the samples are looked up too.
+    assert any("stairwell_event.HostInfo.LocalIp_resource_id" in r for r in records)
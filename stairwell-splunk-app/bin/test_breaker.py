@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import pytest
+import socket
+from stairwell import Stairwell
+from stairwelllib.breaker import (
+    CircuitBreaker,
+    CircuitBreakingAsyncStairwellAPI,
+    CircuitBreakingStairwellAPI,
+    Deadline,
+    LookupDeferred,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+)
+from stairwelllib.client import ConnectionSettings, StairwellEnrichmentClient
+from stairwelllib.ratelimit import (
+    AdaptiveConcurrency,
+    RateGovernor,
+    RateLimitedStairwellAPI,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_asyncclient import FakeAsyncStairwellClient
+from test_cache import CountingStairwellClient, FakeClock, FAILING_IP
+from test_ratelimit import FlakyStairwellClient, throttled
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+def test_breaker_opens_and_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    assert breaker.allow()
+    breaker.record(0.1, ApiException(status=503))
+    breaker.record(0.1, ApiException(status=404))  # Not a failure: resets the count.
+    breaker.record(0.1, ApiException(status=503))
+    assert breaker.state == CLOSED
+    breaker.record(20.0)  # Slow.
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time.
+    breaker.record(0.1, ApiException(status=0))
+    assert breaker.state == OPEN
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.opened == 2
+
+
+def test_deadline():
+    clock = FakeClock()
+    deadline = Deadline(10, clock=clock)
+    assert deadline.remaining() == 10
+    clock.now = 12
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+    assert not Deadline(None).expired()
+
+
+def test_stream_defers_lookups_once_breaker_opens():
+    fake_client = CountingStairwellClient()
+    breaker = CircuitBreaker(failure_threshold=1)
+    command = Stairwell(
+        client=CircuitBreakingStairwellAPI(fake_client, breaker, Deadline()),
+        custom_logger=logger,
+    )
+    command.ip = "ip"
+    command.cache = "none"
+    command.cachesize = 0
+    command.concurrency = 1
+    command.batchsize = 1
+
+    records = [{"ip": FAILING_IP}, {"ip": "1.1.1.1"}, {"ip": FAILING_IP}]
+    res = list(command.stream(records))
+
+    assert fake_client.calls == {FAILING_IP: 1}
+    assert [r["stairwell_status"] for r in res] == ["500", "deferred", "deferred"]
+    assert "stairwell_resource_id" not in res[1]
+
+
+def test_throttled_lookups_do_not_open_breaker():
+    clock = FakeClock()
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    fake_client = FlakyStairwellClient([throttled("15")])
+    breaker = CircuitBreaker(failure_threshold=2, slow_call=10, clock=clock)
+    governor = RateGovernor(
+        None, AdaptiveConcurrency(4), circuit_open=breaker.rejecting
+    )
+    client = RateLimitedStairwellAPI(
+        CircuitBreakingStairwellAPI(fake_client, breaker, Deadline(), clock=clock),
+        governor,
+        sleep=sleep,
+    )
+
+    # Each lookup is throttled for 15s before succeeding, which only the attempts are timed by.
+    for ip in ["1.1.1.1", "2.2.2.2", "3.3.3.3"]:
+        client.get_ip_event_enrichment(ip)
+    assert clock.now == 45
+    assert breaker.state == CLOSED
+
+    # Lookups turned away by the breaker don't wait for the rate limit.
+    breaker.record(20.0)
+    breaker.record(20.0)
+    assert breaker.state == OPEN
+    with pytest.raises(LookupDeferred):
+        client.get_ip_event_enrichment("4.4.4.4")
+    assert "4.4.4.4" not in fake_client.calls
+    assert governor.concurrency.in_flight == 0
+
+
+def test_unreachable_api_opens_breaker():
+    # A port nothing listens on: connections are refused.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = StairwellEnrichmentClient(
+        f"http://127.0.0.1:{port}",
+        "token",
+        "organization",
+        logger=logger,
+        settings=ConnectionSettings(connect_timeout=1, read_timeout=1),
+    )
+    breaker = CircuitBreaker(failure_threshold=2)
+    command = Stairwell(
+        client=CircuitBreakingStairwellAPI(client, breaker, Deadline()),
+        custom_logger=logger,
+    )
+    command.ip = "ip"
+    command.cache = "none"
+    command.concurrency = 1
+    command.batchsize = 1
+
+    records = [{"ip": "8.8.8.8"}, {"ip": "1.1.1.1"}, {"ip": "9.9.9.9"}]
+    res = list(command.stream(records))
+
+    assert breaker.state == OPEN
+    assert [r["stairwell_status"] for r in res] == ["0", "0", "deferred"]
+
+
+def test_spent_budget_defers_without_caching():
+    fake_client = CountingStairwellClient()
+    clock = FakeClock()
+    deadline = Deadline(5, clock=clock)
+    command = Stairwell(
+        client=CircuitBreakingStairwellAPI(fake_client, CircuitBreaker(), deadline),
+        custom_logger=logger,
+    )
+    command.ip = "ip"
+    command.cache = "none"
+    command.concurrency = 1
+
+    assert (
+        list(command.stream([{"ip": "1.1.1.1"}]))[0]["stairwell_uninteresting_addr"]
+        == False
+    )
+    clock.now = 5
+    res = list(command.stream([{"ip": "1.1.1.1"}, {"ip": "2.2.2.2"}]))
+    # Cached lookups are still served.
+    assert res[0]["stairwell_uninteresting_addr"] == False
+    assert res[1]["stairwell_status"] == "deferred"
+    assert fake_client.calls == {"1.1.1.1": 1}
+
+    # The deferral wasn't cached: once lookups are allowed again, it is made.
+    deadline.budget = None
+    res = list(command.stream([{"ip": "2.2.2.2"}]))
+    assert res[0]["stairwell_uninteresting_addr"] == False
+    assert fake_client.calls == {"1.1.1.1": 1, "2.2.2.2": 1}
+
+
+def test_async_lookups_cancelled_when_budget_runs_out():
+    breaker = CircuitBreaker()
+    api = CircuitBreakingAsyncStairwellAPI(
+        FakeAsyncStairwellClient(), breaker, Deadline(0.001)
+    )
+    try:
+        asyncio.run(api.get_ip_event_enrichment("1.1.1.1"))
+        assert False, "expected LookupDeferred"
+    except LookupDeferred as e:
+        assert e.status == "deferred"
+    assert breaker.state == CLOSED
@@ -0,0 +1,63 @@
+import logging
+from stairwell import Stairwell
+from stairwelllib.budget import OutputBudget, compacted, field_size
+from test_cache import CountingStairwellClient, fake_hash
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+FIELDS = {
+    "stairwell_object_sha256": "abc",
+    "stairwell_object_variants": [
+        {"sha256": "v1", "similarity": 0.9},
+        {"sha256": "v2", "similarity": 0.8},
+        {"sha256": "v3"},
+    ],
+    "stairwell_object_signature": {"signer": "ACME", "chain": ["a", "b"]},
+    "stairwell_object_yara_rule_matches": ["r1", "r2", "r3"],
+}
+
+
+def test_compacted():
+    assert compacted(FIELDS) == {
+        "stairwell_object_sha256": "abc",
+        "stairwell_object_variants_sha256": ["v1", "v2", "v3"],
+        "stairwell_object_variants_similarity": [0.9, 0.8, ""],
+        "stairwell_object_signature_signer": ["ACME"],
+        "stairwell_object_signature_chain": ['["a","b"]'],
+        "stairwell_object_yara_rule_matches": ["r1", "r2", "r3"],
+    }
+
+
+def test_output_budget_items_and_bytes():
+    fields = OutputBudget(max_items=2).apply(FIELDS)
+    assert len(fields["stairwell_object_variants"]) == 2
+    assert fields["stairwell_object_yara_rule_matches"] == ["r1", "r2"]
+    assert fields["stairwell_truncated"] == [
+        "stairwell_object_variants",
+        "stairwell_object_yara_rule_matches",
+    ]
+
+    budget = OutputBudget(max_bytes=60)
+    fields = budget.apply(dict(FIELDS, stairwell_status="404"))
+    # The largest fields are left out first, and errors are always kept.
+    assert fields["stairwell_truncated"] == ["stairwell_object_variants"]
+    assert fields["stairwell_status"] == "404"
+    del fields["stairwell_truncated"]
+    assert sum(map(field_size, fields.values())) <= 60
+    # Shared between two indicators, each gets half of the budget.
+    assert (
+        "stairwell_object_signature" in budget.apply(FIELDS, 2)["stairwell_truncated"]
+    )
+    assert not OutputBudget()
+
+
+def test_stream_output_budget():
+    command = Stairwell(client=CountingStairwellClient(), custom_logger=logger)
+    command.object = "hash"
+    command.cache = "none"
+    command.maxbytes = 10
+    command.fields = ["stairwell_object_sha256", "stairwell_object_size"]
+
+    res = list(command.stream([{"hash": fake_hash("x")}]))
+    assert res[0]["stairwell_object_size"] == 64
+    assert res[0]["stairwell_truncated"] == ["stairwell_object_sha256"]
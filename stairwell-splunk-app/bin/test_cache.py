@@ -0,0 +1,151 @@
+import hashlib
+import logging
+from stairwell import Stairwell
+from stairwelllib.cache import CachingStairwellAPI, LookupCache
+from stairwelllib.client import StairwellAPI
+from stairwelllib.stairwell_appapi_client import *
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+def fake_hash(name: str) -> str:
+    """Returns a made-up SHA-256 standing for name, so that the indicators of the fake clients are
+    well-formed, and looked up under the command's default skip policy."""
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+# The object the fake client answers with 404, and the IP address its lookups fail for.
+MISSING = fake_hash("missing")
+FAILING_IP = "9.9.9.9"
+
+
+class CountingStairwellClient(StairwellAPI):
+    """Returns canned enrichments, counting the requests made for each indicator."""
+
+    def __init__(self):
+        self.calls: dict[str, int] = {}
+
+    def _count(self, value: str):
+        self.calls[value] = self.calls.get(value, 0) + 1
+
+    def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        self._count(hash)
+        if hash == MISSING:
+            raise ApiException(status=404, reason="not found")
+        return ObjectEventEnrichment(file_hash_sha256=hash, file_size=len(hash))
+
+    def get_hostname_event_enrichment(self, hostname: str) -> HostnameEventEnrichment:
+        self._count(hostname)
+        return HostnameEventEnrichment()
+
+    def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        self._count(ip)
+        if ip == FAILING_IP:
+            raise ApiException(status=500, reason="we messed up big time")
+        return IPEventEnrichment(uninteresting_addr=False)
+
+
+MD5 = "5d41402abc4b2a76b9719d911017c592"
+SHA1 = "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+SHA256 = "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+
+class HashingStairwellClient(CountingStairwellClient):
+    """Returns the same object, with all three of its hashes, for any of them."""
+
+    def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        self._count(hash)
+        return ObjectEventEnrichment(
+            file_hash_md5=MD5, file_hash_sha1=SHA1, file_hash_sha256=SHA256
+        )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lookup_cache_evicts_least_recently_used():
+    cache = LookupCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a").value == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") == None
+    assert cache.get("a").value == 1
+    assert cache.get("c").value == 3
+    assert cache.evictions == 1
+
+
+def test_lookup_cache_byte_cap():
+    cache = LookupCache(max_entries=100, max_bytes=1000)
+    for i in range(10):
+        cache.put(i, "x" * 200)
+    assert cache.size_bytes <= 1000
+    assert len(cache) < 10
+    assert cache.get(9) != None
+
+
+def test_caching_client_dedupes_and_expires_errors():
+    clock = FakeClock()
+    fake_client = CountingStairwellClient()
+    client = CachingStairwellAPI(
+        fake_client, LookupCache(clock=clock), negative_ttl=60, error_ttl=10
+    )
+
+    for _ in range(3):
+        assert client.get_object_event_enrichment("sha256").file_size == 6
+    assert fake_client.calls["sha256"] == 1
+
+    for _ in range(3):
+        try:
+            client.get_ip_event_enrichment(FAILING_IP)
+            assert False, "expected ApiException"
+        except ApiException as e:
+            assert e.status == 500
+    assert fake_client.calls[FAILING_IP] == 1
+
+    # Errors and "not found" results expire on their own, shorter, schedules.
+    client.get_hostname_event_enrichment("nothing.example")
+    clock.now = 30
+    try:
+        client.get_ip_event_enrichment(FAILING_IP)
+    except ApiException:
+        pass
+    client.get_hostname_event_enrichment("nothing.example")
+    assert fake_client.calls[FAILING_IP] == 2
+    assert fake_client.calls["nothing.example"] == 1
+    clock.now = 61
+    client.get_hostname_event_enrichment("nothing.example")
+    assert fake_client.calls["nothing.example"] == 2
+
+
+def test_caching_client_shares_entries_between_hashes():
+    fake_client = HashingStairwellClient()
+    client = CachingStairwellAPI(fake_client, LookupCache())
+
+    assert client.get_object_event_enrichment(SHA1).file_hash_sha256 == SHA256
+    for value in (MD5, SHA1, SHA256, MD5.upper()):
+        assert client.get_object_event_enrichment(value).file_hash_md5 == MD5
+    assert fake_client.calls == {SHA1: 1}
+    assert len(client.cache) == 1
+
+
+def test_stream_caches_across_chunks():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.object = "hash"
+    command.cache = "none"
+
+    for _ in range(2):
+        records = [{"hash": SHA256}, {"hash": MISSING}, {"hash": SHA256}]
+        res = list(command.stream(records))
+        assert res[0]["stairwell_object_sha256"] == SHA256
+        assert res[1]["stairwell_status"] == "404"
+        assert res[2]["stairwell_object_sha256"] == SHA256
+
+    assert fake_client.calls == {SHA256: 1, MISSING: 1}
@@ -0,0 +1,60 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from stairwelllib.client import (
+    ConnectionSettings,
+    ConnectionStats,
+    StairwellEnrichmentClient,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_asyncclient import EnrichmentHandler, start_server
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+def test_connection_settings_from_conf():
+    settings = ConnectionSettings.from_conf(
+        {"pool_size": "32", "read_timeout": "5.5", "gzip": "false", "measure": "1"}
+    )
+    assert settings == ConnectionSettings(
+        pool_size=32, read_timeout=5.5, gzip=False, measure=True
+    )
+    assert ConnectionSettings.from_conf({}) == ConnectionSettings()
+
+
+def test_connection_stats_reuse_rate():
+    assert ConnectionStats(0, 0).reuse_rate == 0
+    assert ConnectionStats(10, 2).reuse_rate == 0.8
+
+
+def test_client_reuses_pooled_connections():
+    EnrichmentHandler.connections = 0
+    EnrichmentHandler.compressed = 0
+    server = start_server()
+    try:
+        client = StairwellEnrichmentClient(
+            f"http://127.0.0.1:{server.server_port}",
+            "token",
+            "org",
+            "user",
+            logger,
+            settings=ConnectionSettings(pool_size=4),
+        )
+        # Nothing is set up until the first request.
+        assert client.connection_stats() == ConnectionStats()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            res = list(
+                executor.map(
+                    client.get_object_event_enrichment,
+                    [f"hash{i}" for i in range(40)],
+                )
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [r.file_hash_sha256 for r in res] == [f"hash{i}" for i in range(40)]
+    assert EnrichmentHandler.connections <= 4
+    assert EnrichmentHandler.compressed == 40
+    stats = client.connection_stats()
+    assert stats == ConnectionStats(requests=40, connections=stats.connections)
+    assert stats.reuse_rate >= 0.9
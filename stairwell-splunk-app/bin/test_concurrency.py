@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from stairwell import Stairwell
+from stairwelllib.concurrency import ordered_map
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import CountingStairwellClient
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+# The IP address the slow client's lookups crash on.
+EXPLODING_IP = "6.6.6.6"
+
+
+class SlowStairwellClient(CountingStairwellClient):
+    """Answers IP lookups after a delay that shrinks with each request, so that later requests
+    tend to complete first, and tracks the number of requests in flight."""
+
+    def __init__(self, delay: float = 0.02):
+        super().__init__()
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.delay *= 0.9
+            delay = self.delay
+        time.sleep(delay)
+        with self.lock:
+            self.in_flight -= 1
+        if ip == EXPLODING_IP:
+            raise RuntimeError("boom")
+        return super().get_ip_event_enrichment(ip)
+
+
+def test_ordered_map_preserves_order():
+    def slow_square(i: int) -> int:
+        time.sleep((10 - i % 10) / 1000)
+        return i * i
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        res = list(ordered_map(executor, slow_square, range(50), max_pending=8))
+    assert res == [i * i for i in range(50)]
+
+
+def test_ordered_map_propagates_exceptions():
+    def fail_on_three(i: int) -> int:
+        if i == 3:
+            raise KeyError(i)
+        return i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        res = []
+        try:
+            for value in ordered_map(executor, fail_on_three, range(10), 4):
+                res.append(value)
+            assert False, "expected KeyError"
+        except KeyError:
+            pass
+    assert res == [0, 1, 2]
+
+
+def test_stream_concurrent_lookups_keep_record_order():
+    fake_client = SlowStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.ip = "ip"
+    command.cache = "none"
+    command.concurrency = 4
+
+    records = [{"ip": f"1.0.0.{i}", "n": i} for i in range(40)]
+    res = list(command.stream(records))
+
+    assert [r["n"] for r in res] == list(range(40))
+    assert all(r["stairwell_resource_id"] == r["ip"] for r in res)
+    assert 1 < fake_client.max_in_flight <= 4
+
+
+def test_stream_concurrent_lookup_errors_propagate():
+    command = Stairwell(client=SlowStairwellClient(), custom_logger=logger)
+    command.ip = "ip"
+    command.cache = "none"
+    command.concurrency = 4
+
+    records = [{"ip": "1.1.1.1"}, {"ip": EXPLODING_IP}, {"ip": "2.2.2.2"}]
+    try:
+        list(command.stream(records))
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
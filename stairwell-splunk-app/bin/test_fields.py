@@ -0,0 +1,32 @@
+import json
+from stairwelllib.fields import FieldReader, parse_path, walk
+
+EVENT = {
+    "event": {
+        "Process": {"SHA256": "abc", "Pid": 42},
+        "Modules": [{"sha256": "m1"}, {"sha256": "m2"}, {"name": "unsigned"}],
+    }
+}
+
+
+def test_parse_path_and_walk():
+    assert parse_path("event.Modules{}.sha256") == ("event", "Modules", "sha256")
+    assert walk(EVENT, parse_path("event.Process.SHA256")) == "abc"
+    assert walk(EVENT, parse_path("event.Process.Pid")) == "42"
+    assert walk(EVENT, parse_path("event.Modules{}.sha256")) == ["m1", "m2"]
+    assert walk(EVENT, parse_path("event.Process")) == None
+    assert walk(EVENT, parse_path("event.Nothing")) == None
+
+
+def test_field_reader():
+    reader = FieldReader()
+    raw = json.dumps(EVENT)
+    record = {"_raw": raw, "event.Process.SHA256": "extracted", "host": "h"}
+    assert reader.get(record, "host") == "h"
+    # Fields Splunk already extracted are used as they are.
+    assert reader.get(record, "event.Process.SHA256") == "extracted"
+    assert reader.get(record, "event.Modules{}.sha256") == ["m1", "m2"]
+    assert reader.get(record, "_raw.event.Process.Pid") == "42"
+    assert reader.get({"event": raw}, "event.event.Process.SHA256") == "abc"
+    assert reader.get({"_raw": "not json"}, "event.Process.SHA256") == None
+    assert reader.get({"detail": EVENT}, "detail.event.Process.SHA256") == "abc"
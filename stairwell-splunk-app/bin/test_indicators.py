@@ -0,0 +1,100 @@
+import logging
+import pytest
+from stairwell import Stairwell
+from stairwelllib.indicators import (
+    IndicatorNormalizer,
+    Normalized,
+    classify,
+    normalize_hash,
+    normalize_hostname,
+    normalize_ip,
+)
+from test_cache import CountingStairwellClient
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+SHA256 = "d780134609e2b5c9ec6b75e35c5f6eefcb1527105a584c6fbcff5dee33cebd37"
+
+
+def test_normalize_hash():
+    assert normalize_hash(" " + SHA256.upper()) == Normalized(SHA256)
+    assert normalize_hash(SHA256[:40]) == Normalized(SHA256[:40])
+    assert normalize_hash(SHA256[:32]) == Normalized(SHA256[:32])
+    assert normalize_hash(SHA256[:50]).category == "invalid"
+    assert normalize_hash("z" * 64).category == "invalid"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("8.8.8.8", Normalized("8.8.8.8")),
+        ("2001:4860:4860:0000:0000:0000:0000:8888", Normalized("2001:4860:4860::8888")),
+        ("::ffff:8.8.8.8", Normalized("8.8.8.8")),
+        ("10.1.2.3", Normalized("10.1.2.3", "private", "not a public IP address")),
+        ("127.0.0.1", Normalized("127.0.0.1", "private", "not a public IP address")),
+        ("fe80::1", Normalized("fe80::1", "private", "not a public IP address")),
+        ("8.8.8", Normalized("8.8.8", "invalid", "not an IP address")),
+    ],
+)
+def test_normalize_ip(value, expected):
+    assert normalize_ip(value) == expected
+
+
+def test_normalize_hostname():
+    assert normalize_hostname("WWW.Example.COM.") == Normalized("www.example.com")
+    assert normalize_hostname("bücher.example") == Normalized("xn--bcher-kva.example")
+    assert normalize_hostname("printer.local").category == "private"
+    assert normalize_hostname("fileserver").category == "private"
+    assert normalize_hostname("bad..example.com").category == "invalid"
+    assert normalize_hostname("-bad.example.com").category == "invalid"
+    assert normalize_hostname("evil\n.com").category == "invalid"
+
+
+@pytest.mark.parametrize(
+    "value, kind",
+    [
+        (SHA256, "object"),
+        (SHA256[:32].upper(), "object"),
+        ("8.8.8.8", "ip"),
+        ("2001:db8::1", "ip"),
+        ("www.example.com", "hostname"),
+        ("deadbeef", None),
+        ("1.2.3", None),
+        ("victim-machine", None),
+        ("C:\\Windows\\cmd.exe", None),
+    ],
+)
+def test_classify(value, kind):
+    assert classify(value) == kind
+
+
+def test_normalizer_local_answers():
+    normalizer = IndicatorNormalizer(["invalid"])
+    assert normalizer.local_answer("object", "abc") == {
+        "stairwell_error": "not an MD5, SHA-1 or SHA-256 hash",
+        "stairwell_status": "invalid",
+    }
+    assert normalizer.local_answer("ip", "10.0.0.1") is None
+    assert IndicatorNormalizer(["none"]).local_answer("object", "abc") is None
+    with pytest.raises(ValueError):
+        IndicatorNormalizer(["public"])
+
+
+def test_stream_looks_up_canonical_indicators_once():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.object = "hash"
+    command.cache = "none"
+
+    records = [
+        {"hash": SHA256},
+        {"hash": SHA256.upper()},
+        {"hash": " " + SHA256},
+        {"hash": "not-a-hash"},
+    ]
+    res = list(command.stream(records))
+
+    assert fake_client.calls == {SHA256: 1}
+    assert [r.get("stairwell_object_sha256") for r in res[:3]] == [SHA256] * 3
+    assert res[3]["stairwell_status"] == "invalid"
+    assert res[3]["hash"] == "not-a-hash"
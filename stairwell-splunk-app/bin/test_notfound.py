@@ -0,0 +1,114 @@
+import os
+import pytest
+from stairwelllib.notfound import (
+    BloomFilter,
+    NotFoundFilter,
+    NotFoundFilteringStairwellAPI,
+    NotFoundSettings,
+    NOT_FOUND_REASON,
+    filter_size,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import CountingStairwellClient, FakeClock, FAILING_IP, MISSING
+
+
+def test_filter_size():
+    bits, hashes = filter_size(1000000, 0.001)
+    # About 1.8MB and 10 hashes for a million items at 0.1%.
+    assert 14000000 < bits < 15000000
+    assert hashes == 10
+    with pytest.raises(ValueError):
+        filter_size(1000, 0)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(*filter_size(1000, 0.01))
+    for i in range(1000):
+        bloom.add(f"known-{i}")
+    assert all(f"known-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"unknown-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_not_found_filter_is_shared(tmp_path):
+    clock = FakeClock()
+    NotFoundFilter(str(tmp_path), capacity=100, clock=clock).add("object", "a")
+
+    # A second filter stands in for another search process.
+    other = NotFoundFilter(str(tmp_path), capacity=100, clock=clock)
+    assert other.contains("object", "a")
+    assert not other.contains("ip", "a")
+    assert not other.contains("object", "b")
+
+    # Filters of other dimensions are kept apart.
+    assert not NotFoundFilter(str(tmp_path), capacity=1000, clock=clock).contains(
+        "object", "a"
+    )
+
+
+def test_not_found_filter_rotation(tmp_path):
+    clock = FakeClock()
+    store = NotFoundFilter(str(tmp_path), capacity=100, max_age=100, clock=clock)
+    store.add("object", "a")
+    clock.now = 60
+    assert store.contains("object", "a")
+    store.add("object", "b")
+
+    clock.now = 110
+    store.add("object", "c")
+    assert not store.contains("object", "a")
+    assert store.contains("object", "b")
+    assert store.contains("object", "c")
+    # Filters older than the previous generation are deleted.
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_not_found_filtering_client(tmp_path):
+    store = NotFoundFilter(str(tmp_path), capacity=100)
+    fake_client = CountingStairwellClient()
+    client = NotFoundFilteringStairwellAPI(fake_client, store)
+
+    for _ in range(2):
+        with pytest.raises(ApiException) as e:
+            client.get_object_event_enrichment(MISSING)
+        assert e.value.status == 404
+    assert NOT_FOUND_REASON in str(e.value)
+    for _ in range(2):
+        res = client.get_hostname_event_enrichment("nothing.example")
+        assert res.to_dict() == HostnameEventEnrichment().to_dict()
+    for _ in range(2):
+        client.get_object_event_enrichment("sha256")
+        with pytest.raises(ApiException):
+            client.get_ip_event_enrichment(FAILING_IP)
+
+    assert fake_client.calls == {
+        MISSING: 1,
+        "nothing.example": 1,
+        "sha256": 2,
+        FAILING_IP: 2,
+    }
+    assert (client.skipped, client.added) == (2, 2)
+
+
+def test_not_found_filtering_client_modes(tmp_path):
+    store = NotFoundFilter(str(tmp_path), capacity=100)
+    fake_client = CountingStairwellClient()
+
+    client = NotFoundFilteringStairwellAPI(fake_client, store, mode="read")
+    for _ in range(2):
+        with pytest.raises(ApiException):
+            client.get_object_event_enrichment(MISSING)
+    assert fake_client.calls[MISSING] == 2
+
+    NotFoundFilteringStairwellAPI(fake_client, store).get_hostname_event_enrichment(
+        "nothing.example"
+    )
+    client.get_hostname_event_enrichment("nothing.example")
+    assert fake_client.calls["nothing.example"] == 1
+
+
+def test_not_found_settings_from_conf():
+    settings = NotFoundSettings.from_conf(
+        {"enabled": "1", "fp_rate": "0.0001", "capacity": ""}
+    )
+    assert settings == NotFoundSettings(enabled=True, fp_rate=0.0001)
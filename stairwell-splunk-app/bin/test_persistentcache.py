@@ -0,0 +1,133 @@
+import threading
+from datetime import datetime
+from stairwelllib.persistentcache import (
+    PersistentCachingStairwellAPI,
+    PersistentLookupCache,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import (
+    CountingStairwellClient,
+    FakeClock,
+    HashingStairwellClient,
+    MD5,
+    SHA1,
+    SHA256,
+)
+
+
+def test_persistent_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    response = ObjectEventEnrichment(
+        file_hash_sha256="sha256",
+        sightings_first=datetime.fromisocalendar(2025, 1, 1),
+        signature=ObjectSignature(
+            x509_certificates=[
+                X509Certificate(
+                    subject="the_subject",
+                    earliest_valid_time=datetime.fromisocalendar(2025, 1, 1),
+                )
+            ]
+        ),
+    )
+    PersistentLookupCache(path).put("object", "sha256", response)
+
+    # A second connection stands in for another search process.
+    res = PersistentLookupCache(path).get("object", "sha256")
+    assert res.to_dict() == response.to_dict()
+    assert PersistentLookupCache(path).get("object", "md5") == None
+
+
+def test_persistent_cache_expiry(tmp_path):
+    clock = FakeClock()
+    store = PersistentLookupCache(
+        str(tmp_path / "cache.sqlite"), ttls={"ip": 100}, clock=clock
+    )
+    store.put("ip", "1.1.1.1", IPEventEnrichment(uninteresting_addr=True))
+
+    clock.now = 50
+    assert store.get("ip", "1.1.1.1") != None
+    assert store.get("ip", "1.1.1.1", max_age=30) == None
+    clock.now = 100
+    assert store.get("ip", "1.1.1.1") == None
+
+
+def test_persistent_cache_size_bound(tmp_path):
+    clock = FakeClock()
+    store = PersistentLookupCache(
+        str(tmp_path / "cache.sqlite"), max_bytes=1000, clock=clock
+    )
+    for i in range(20):
+        clock.now = i
+        store.put("object", str(i), ObjectEventEnrichment(file_magic="x" * 100))
+    store.evict()
+
+    assert store.get("object", "0") == None
+    assert store.get("object", "19") != None
+
+
+def test_persistent_caching_client_modes(tmp_path):
+    store = PersistentLookupCache(str(tmp_path / "cache.sqlite"))
+    fake_client = CountingStairwellClient()
+
+    client = PersistentCachingStairwellAPI(fake_client, store, mode="read")
+    client.get_object_event_enrichment("sha256")
+    client.get_object_event_enrichment("sha256")
+    assert fake_client.calls["sha256"] == 2
+
+    client = PersistentCachingStairwellAPI(fake_client, store, mode="readwrite")
+    client.get_object_event_enrichment("sha256")
+    client.get_object_event_enrichment("sha256")
+    # Empty responses are not worth storing.
+    client.get_hostname_event_enrichment("nothing.example")
+    client.get_hostname_event_enrichment("nothing.example")
+    assert fake_client.calls == {"sha256": 3, "nothing.example": 2}
+
+    client = PersistentCachingStairwellAPI(fake_client, store, mode="none")
+    assert client.get_object_event_enrichment("sha256").file_size == 6
+    assert fake_client.calls["sha256"] == 4
+
+
+def test_persistent_cache_hash_aliases(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    fake_client = HashingStairwellClient()
+    client = PersistentCachingStairwellAPI(fake_client, PersistentLookupCache(path))
+    client.get_object_event_enrichment(SHA256)
+
+    # Another search finds the object by any of its hashes.
+    store = PersistentLookupCache(path)
+    for value in (MD5, SHA1, SHA256):
+        assert store.get("object", value).file_hash_sha256 == SHA256
+    assert sorted(store.get_many("object", [MD5, SHA1, "other"])) == [MD5, SHA1]
+    client = PersistentCachingStairwellAPI(fake_client, store)
+    assert client.get_object_event_enrichment(MD5).file_hash_md5 == MD5
+    assert fake_client.calls == {SHA256: 1}
+
+
+def test_persistent_caching_client_drops_unclaimed_prefetches(tmp_path):
+    clock = FakeClock()
+    store = PersistentLookupCache(str(tmp_path / "cache.sqlite"), clock=clock)
+    fake_client = CountingStairwellClient()
+    client = PersistentCachingStairwellAPI(fake_client, store, max_age=100)
+    client.get_object_event_enrichment("sha256")
+
+    # Read ahead for a batch that didn't use it, then kept past max_age.
+    client.prefetch("object", ["sha256"])
+    clock.now = 200
+    client.prefetch("object", ["other"])
+    client.get_object_event_enrichment("sha256")
+    assert fake_client.calls["sha256"] == 2
+
+    # Lookups are counted from the worker threads without losing any.
+    threads = [
+        threading.Thread(
+            target=lambda: [
+                client.get_object_event_enrichment("sha256") for _ in range(200)
+            ]
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.hits + client.misses == 1602
@@ -0,0 +1,161 @@
+import json
+import logging
+from stairwell import Stairwell
+from stairwelllib.pipeline import BatchEnricher, Lookup
+from stairwelllib.stairwellapi import search_stairwell_object_api
+from test_cache import CountingStairwellClient, MISSING, fake_hash
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+def object_records(hashes):
+    return [{"hash": h, "n": i} for i, h in enumerate(hashes)]
+
+
+def test_batch_enricher_looks_up_distinct_values_once():
+    fake_client = CountingStairwellClient()
+    enricher = BatchEnricher(
+        fake_client,
+        logger,
+        [Lookup("object", "hash", search_stairwell_object_api)],
+        batch_size=0,
+    )
+
+    records = object_records(["a", "b", "a", "", "b", "a"])
+    records.append({"n": 6})
+    res = list(enricher.enrich(records))
+
+    assert [r["n"] for r in res] == list(range(7))
+    assert fake_client.calls == {"a": 1, "b": 1}
+    assert [r.get("stairwell_object_sha256") for r in res] == [
+        "a",
+        "b",
+        "a",
+        None,
+        "b",
+        "a",
+        None,
+    ]
+
+
+def test_batch_enricher_flush_policy():
+    fake_client = CountingStairwellClient()
+    lookups = [Lookup("object", "hash", search_stairwell_object_api)]
+
+    # Without a cache, each batch looks its values up again.
+    enricher = BatchEnricher(fake_client, logger, lookups, batch_size=2)
+    list(enricher.enrich(object_records(["a", "a", "a", "a", "a"])))
+    assert fake_client.calls == {"a": 3}
+
+    fake_client.calls.clear()
+    enricher = BatchEnricher(
+        fake_client, logger, lookups, batch_size=100, max_distinct=2
+    )
+    # Flushed as [a, a, b], [b, c], [c].
+    list(enricher.enrich(object_records(["a", "a", "b", "b", "c", "c"])))
+    assert fake_client.calls == {"a": 1, "b": 2, "c": 2}
+
+
+def test_stream_batches_whole_chunk():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.object = "hash"
+    command.cache = "none"
+    command.cachesize = 0
+    command.batchsize = 0
+    command.maxdistinct = 0
+
+    a, b = fake_hash("a"), fake_hash("b")
+    res = list(command.stream(object_records([a, b] * 50)))
+    assert len(res) == 100
+    assert fake_client.calls == {a: 1, b: 1}
+
+
+def test_stream_enriches_several_fields_in_one_pass():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.object = "sha256"
+    command.ip = "src_ip, dest_ip"
+    command.cache = "none"
+    command.cachesize = 0
+
+    sha256 = fake_hash("abc")
+    records = [
+        {"sha256": sha256, "src_ip": "1.1.1.1", "dest_ip": "2.2.2.2"},
+        {"sha256": sha256, "src_ip": "2.2.2.2", "dest_ip": ""},
+    ]
+    res = list(command.stream(records))
+
+    # Shared values are looked up once, even across fields.
+    assert fake_client.calls == {sha256: 1, "1.1.1.1": 1, "2.2.2.2": 1}
+    assert res[0]["stairwell_sha256_object_sha256"] == sha256
+    assert res[0]["stairwell_src_ip_resource_id"] == "1.1.1.1"
+    assert res[0]["stairwell_dest_ip_resource_id"] == "2.2.2.2"
+    assert res[0]["stairwell_dest_ip_event_type"] == "ipaddress"
+    assert res[1]["stairwell_src_ip_resource_id"] == "2.2.2.2"
+    assert "stairwell_dest_ip_resource_id" not in res[1]
+    assert "stairwell_resource_id" not in res[0]
+
+
+def test_stream_fields_option():
+    command = Stairwell(client=CountingStairwellClient(), custom_logger=logger)
+    command.ip = "src,dest"
+    command.fields = ["stairwell_uninteresting_addr"]
+    command.cache = "none"
+
+    res = list(command.stream([{"src": "1.1.1.1", "dest": "2.2.2.2"}]))
+    assert res == [
+        {
+            "src": "1.1.1.1",
+            "dest": "2.2.2.2",
+            "stairwell_src_uninteresting_addr": False,
+            "stairwell_dest_uninteresting_addr": False,
+        }
+    ]
+
+
+def test_stream_enriches_multivalue_fields():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.object = "hashes"
+    command.cache = "none"
+    command.fields = ["stairwell_object_s*", "stairwell_status"]
+
+    # A SHA-256 and an MD5, whose sizes the fake client gives as their lengths.
+    a, b = fake_hash("a"), fake_hash("b")[:32]
+    records = [{"hashes": [a, MISSING, "", b]}, {"hashes": a}]
+    res = list(command.stream(records))
+
+    # Each value is looked up once, and the results line up with the field's values.
+    assert fake_client.calls == {a: 1, MISSING: 1, b: 1}
+    assert res[0]["stairwell_object_sha256"] == [a, "", "", b]
+    assert res[0]["stairwell_object_size"] == [64, "", "", 32]
+    assert res[0]["stairwell_status"] == ["", "404", "", ""]
+    assert res[1]["stairwell_object_sha256"] == a
+
+
+def test_stream_reads_paths_and_classifies_values():
+    fake_client = CountingStairwellClient()
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.auto = "event.Process.SHA256, event.RemoteAddress, event.Domains{}"
+    command.fields = ["stairwell_object_size", "stairwell_indicator_type"]
+    command.cache = "none"
+    sha256 = "0385eeab00e946a302b24a91dea4187c1210597b8e17cd9e2230450f5ece21da"
+    event = {
+        "Process": {"SHA256": sha256.upper()},
+        "RemoteAddress": "8.8.8.8",
+        "Domains": ["example.com", "not a hostname", "10.0.0.1"],
+    }
+
+    res = list(command.stream([{"_raw": json.dumps({"event": event})}]))
+
+    assert fake_client.calls == {sha256: 1, "8.8.8.8": 1, "example.com": 1}
+    record = res[0]
+    assert record["stairwell_event.Process.SHA256_object_size"] == 64
+    assert record["stairwell_event.Process.SHA256_indicator_type"] == "object"
+    assert record["stairwell_event.RemoteAddress_indicator_type"] == "ip"
+    assert record["stairwell_event.Domains{}_indicator_type"] == [
+        "hostname",
+        "",
+        "ip",
+    ]
@@ -0,0 +1,146 @@
+import pytest
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.ratelimit import (
+    AdaptiveConcurrency,
+    RateGovernor,
+    RateLimitedStairwellAPI,
+    TokenBucket,
+    retry_after,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import CountingStairwellClient, FakeClock, MISSING
+
+
+class FlakyStairwellClient(CountingStairwellClient):
+    """Fails the first requests for each IP address with the given errors."""
+
+    def __init__(self, errors: list):
+        super().__init__()
+        self.errors = errors
+
+    def get_ip_event_enrichment(self, ip: str) -> IPEventEnrichment:
+        self._count(ip)
+        if self.calls[ip] <= len(self.errors):
+            raise self.errors[self.calls[ip] - 1]
+        return IPEventEnrichment(uninteresting_addr=False)
+
+
+def throttled(seconds: str) -> ApiException:
+    e = ApiException(status=429, reason="Too Many Requests")
+    e.headers = {"Retry-After": seconds}
+    return e
+
+
+def test_token_bucket_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.1
+
+    clock.now = 0.1
+    assert bucket.reserve() == 0
+    clock.now = 10
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.1]
+
+
+def test_token_bucket_shared_between_processes(tmp_path):
+    path = str(tmp_path / "ratelimit")
+    clock = FakeClock()
+    # Each bucket stands in for a different search process.
+    first = TokenBucket(rate=1, burst=2, path=path, clock=clock)
+    second = TokenBucket(rate=1, burst=2, path=path, clock=clock)
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert first.reserve() == 1
+    assert second.reserve() == 1
+
+    clock.now = 5
+    first.pause(3)
+    assert second.reserve() == 3
+    clock.now = 8
+    assert second.reserve() == 0
+
+
+def test_adaptive_concurrency():
+    clock = FakeClock()
+    limiter = AdaptiveConcurrency(maximum=8, clock=clock)
+    assert all(limiter.try_acquire() for _ in range(8))
+    assert not limiter.try_acquire()
+
+    limiter.release(congested=True)
+    limiter.release(congested=True)  # Within the cooldown: doesn't count again.
+    assert limiter.limit == 4
+    assert not limiter.try_acquire()
+
+    for _ in range(6):
+        limiter.release(congested=False)
+    assert 4 < limiter.limit < 6
+    assert limiter.in_flight == 0
+
+
+def test_retry_after():
+    assert retry_after(throttled("2")) == 2
+    assert retry_after(throttled("Wed, 21 Oct 2015 07:28:00 GMT")) == 0
+    assert retry_after(ApiException(status=429)) == None
+
+
+def test_retries_throttled_and_failed_requests():
+    sleeps = []
+    client = FlakyStairwellClient(
+        [throttled("1.5"), ApiException(status=503, reason="unavailable")]
+    )
+    governor = RateGovernor(None, AdaptiveConcurrency(4), jitter=lambda: 0.5)
+    api = RateLimitedStairwellAPI(client, governor, sleep=sleeps.append)
+
+    assert api.get_ip_event_enrichment("1.1.1.1").uninteresting_addr == False
+    assert client.calls["1.1.1.1"] == 3
+    # The server's Retry-After, then half of the second backoff step.
+    assert sleeps == [1.5, 0.5]
+    assert governor.retries == 2
+    assert governor.throttled == 1
+    assert governor.concurrency.in_flight == 0
+
+
+def test_gives_up_on_permanent_errors_and_after_max_retries():
+    client = FlakyStairwellClient([ApiException(status=500)] * 10)
+    governor = RateGovernor(None, AdaptiveConcurrency(4), max_retries=2)
+    api = RateLimitedStairwellAPI(client, governor, sleep=lambda _: None)
+    try:
+        api.get_ip_event_enrichment("1.1.1.1")
+        assert False, "expected ApiException"
+    except ApiException as e:
+        assert e.status == 500
+    assert client.calls["1.1.1.1"] == 3
+
+    try:
+        api.get_object_event_enrichment(MISSING)
+        assert False, "expected ApiException"
+    except ApiException as e:
+        assert e.status == 404
+    assert client.calls[MISSING] == 1
+    assert governor.concurrency.in_flight == 0
+
+
+def test_long_retry_after_gives_up_without_stalling_the_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock)
+    governor = RateGovernor(bucket, AdaptiveConcurrency(4), backoff_max=30)
+    assert governor.retry_delay(throttled("3600"), 0) == None
+    clock.now = 30
+    assert bucket.reserve() == 0
+
+
+def test_waiting_for_admission_is_bounded_by_time_budget():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock)
+    bucket.pause(60)
+    sleeps = []
+    governor = RateGovernor(bucket, AdaptiveConcurrency(4), time_left=lambda: 5.0)
+    api = RateLimitedStairwellAPI(
+        CountingStairwellClient(), governor, sleep=sleeps.append
+    )
+    with pytest.raises(LookupDeferred):
+        api.get_ip_event_enrichment("1.1.1.1")
+    assert sleeps == []
+    assert governor.concurrency.in_flight == 0
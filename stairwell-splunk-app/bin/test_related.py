@@ -0,0 +1,70 @@
+import logging
+from stairwell import Stairwell
+from stairwelllib.related import RelatedPrefetcher, related_indicators
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import CountingStairwellClient, fake_hash
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+class RelatedStairwellClient(CountingStairwellClient):
+    """Returns objects related to a few network indicators."""
+
+    def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+        self._count(hash)
+        return ObjectEventEnrichment(
+            file_hash_sha256=hash,
+            indicators_ips_likely=["8.8.8.8", "10.0.0.1"],
+            indicators_hostnames_likely=["C2.Example.COM.", "printer.local"],
+        )
+
+    def get_hostname_event_enrichment(self, hostname: str) -> HostnameEventEnrichment:
+        self._count(hostname)
+        return HostnameEventEnrichment(
+            comments_most_recent=[Comment(body="c2", environment="e")]
+        )
+
+
+def test_related_indicators():
+    response = {
+        "indicatorsIpsLikely": ["8.8.8.8", "::ffff:1.1.1.1", "10.0.0.1", "bad"],
+        "indicatorsHostnamesLikely": ["C2.Example.COM."],
+    }
+    assert related_indicators(response) == [
+        ("ip", "8.8.8.8"),
+        ("ip", "1.1.1.1"),
+        ("hostname", "c2.example.com"),
+    ]
+    assert related_indicators({}) == []
+
+
+def test_prefetcher_limit_and_dedup():
+    fake_client = CountingStairwellClient()
+    prefetcher = RelatedPrefetcher(fake_client, limit=2)
+    prefetcher.submit([("ip", "1.1.1.1"), ("ip", "1.1.1.1"), ("ip", "2.2.2.2")])
+    prefetcher.submit([("ip", "3.3.3.3")])
+    prefetcher.close()
+    assert fake_client.calls == {"1.1.1.1": 1, "2.2.2.2": 1}
+    assert (prefetcher.queued, prefetcher.looked_up, prefetcher.dropped) == (2, 2, 1)
+
+
+def test_pivot_search_is_served_from_cache(tmp_path):
+    fake_client = RelatedStairwellClient()
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    command = Stairwell(client=fake_client, custom_logger=logger)
+    command.cache_path = cache_path
+    command.object = "hash"
+    command.related = 10
+    a, b = fake_hash("a"), fake_hash("b")
+    list(command.stream([{"hash": a}, {"hash": b}]))
+    command.related_prefetcher.close()
+    assert fake_client.calls == {a: 1, b: 1, "8.8.8.8": 1, "c2.example.com": 1}
+
+    pivot = Stairwell(client=fake_client, custom_logger=logger)
+    pivot.cache_path = cache_path
+    pivot.ip = "dest"
+    pivot.hostname = "query"
+    res = list(pivot.stream([{"dest": "8.8.8.8", "query": "c2.example.com"}]))
+    assert res[0]["stairwell_dest_uninteresting_addr"] == False
+    assert fake_client.calls == {a: 1, b: 1, "8.8.8.8": 1, "c2.example.com": 1}
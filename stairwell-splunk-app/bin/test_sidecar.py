@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+import pytest
+from stairwell import Stairwell
+from stairwelllib.breaker import LookupDeferred
+from stairwelllib.client import StairwellDataAPI
+from stairwelllib.sidecar import (
+    CoalescingStairwellAPI,
+    SidecarServer,
+    SidecarStairwellAPI,
+)
+from stairwelllib.stairwell_appapi_client import *
+from test_cache import CountingStairwellClient, MISSING, SHA256
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+class BlockingStairwellAPI(StairwellDataAPI):
+    """Holds every lookup until released, counting them."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def get_enrichment_data(self, kind, value):
+        self.calls += 1
+        self.release.wait(5)
+        if value == "later":
+            raise LookupDeferred("circuit open")
+        return {"fileHashSha256": value}
+
+
+@pytest.fixture
+def serve(tmp_path):
+    servers = []
+
+    def serve(api):
+        path = str(tmp_path / "enrichment.sock")
+        server = SidecarServer(path, api, logger)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return path
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_coalescing_client_makes_concurrent_lookups_once():
+    blocking = BlockingStairwellAPI()
+    api = CoalescingStairwellAPI(blocking)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(api.get_enrichment_data("object", "a"))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    while api.flights.shared < 7:
+        threading.Event().wait(0.01)
+    blocking.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert blocking.calls == 1
+    assert results == [{"fileHashSha256": "a"}] * 8
+
+    # Later lookups are made again.
+    api.get_enrichment_data("object", "a")
+    assert blocking.calls == 2
+
+
+def test_sidecar_client_round_trip(serve):
+    fake_client = CountingStairwellClient()
+    client = SidecarStairwellAPI(serve(CoalescingStairwellAPI(fake_client)))
+
+    assert client.get_object_event_enrichment("bb").file_size == 2
+    with pytest.raises(ApiException) as e:
+        client.get_object_event_enrichment(MISSING)
+    assert e.value.status == 404
+    assert client.get_ip_event_enrichment("1.1.1.1").uninteresting_addr == False
+    assert fake_client.calls == {"bb": 1, MISSING: 1, "1.1.1.1": 1}
+    client.close()
+
+
+def test_sidecar_client_defers_lookups(serve, tmp_path):
+    blocking = BlockingStairwellAPI()
+    blocking.release.set()
+    client = SidecarStairwellAPI(serve(blocking))
+    with pytest.raises(LookupDeferred) as e:
+        client.get_enrichment_data("object", "later")
+    assert e.value.reason == "circuit open"
+
+    client = SidecarStairwellAPI(str(tmp_path / "nothing.sock"))
+    with pytest.raises(LookupDeferred):
+        client.get_enrichment_data("object", "a")
+
+
+def test_searches_share_the_sidecar(serve, tmp_path):
+    fake_client = CountingStairwellClient()
+    path = serve(CoalescingStairwellAPI(fake_client))
+
+    for _ in range(2):
+        command = Stairwell(custom_logger=logger)
+        command.sidecar_path = path
+        command.cache_path = str(tmp_path / "cache.sqlite")
+        command.object = "hash"
+        res = list(command.stream([{"hash": SHA256}, {"hash": MISSING}]))
+        assert res[0]["stairwell_object_size"] == 64
+        assert res[1]["stairwell_status"] == "404"
+        assert command.persistent_cache is None
+
+    # The service itself doesn't cache here, so each search looks the indicators up once.
+    assert fake_client.calls == {SHA256: 2, MISSING: 2}
+
+    command = Stairwell(custom_logger=logger)
+    command.sidecar_path = str(tmp_path / "nothing.sock")
+    assert command.connect_sidecar() is None
+
+
+def test_search_time_budget_bounds_sidecar_lookups(serve):
+    blocking = BlockingStairwellAPI()
+    command = Stairwell(custom_logger=logger)
+    command.sidecar_path = serve(blocking)
+    command.object = "hash"
+    command.cache = "none"
+    command.timeout = 0.2
+    command.engine = "async"
+    command.concurrency = 4
+
+    started = time.monotonic()
+    res = list(command.stream([{"hash": SHA256}]))
+    blocking.release.set()
+
+    assert time.monotonic() - started < 2
+    assert res[0]["stairwell_status"] == "deferred"
+    assert command.breaker is not None
+    # Lookups through the service are made from worker threads, whatever the engine.
+    assert command.executor is not None
+    command.executor.shutdown()
@@ -2,6 +2,7 @@ from datetime import datetime
 import logging
 from stairwell import Stairwell
 from stairwelllib.client import StairwellAPI
+import stairwelllib.records
 import stairwelllib.stairwellapi
 from stairwelllib.stairwell_appapi_client import *
 
@@ -302,3 +303,163 @@ def test_stairwell_api_exceptions():
     )
     assert res.get("stairwell_status") == "301"
     assert res.get("stairwell_error") != None
+
+
+def test_search_stairwell_object_api_fields(monkeypatch):
+    def fail(*args):
+        raise AssertionError("unselected field converted")
+
+    monkeypatch.setattr(stairwelllib.stairwellapi, "signature_to_dict", fail)
+    monkeypatch.setattr(stairwelllib.stairwellapi, "opinions_to_dicts", fail)
+    fake_client = FakeStairwellClient()
+    fake_client.hash_data["fields"] = ObjectEventEnrichment(
+        opinions_most_recent=[get_test_opinion()],
+        signature=ObjectSignature(pkcs7_verification_result="VALID"),
+        file_hash_md5="md5",
+        verdict_maleval_malicious_probability="MALICIOUS_PROBABILITY_LOW",
+        verdict_maleval_labels=["label_a"],
+    )
+
+    res = stairwelllib.stairwellapi.search_stairwell_object_api(
+        fake_client,
+        logger,
+        "fields",
+        stairwelllib.stairwellapi.FieldSelection(
+            ["stairwell_object_mal_eval*", "stairwell_resource_id"]
+        ),
+    )
+
+    assert res == {
+        "stairwell_resource_id": "fields",
+        "stairwell_object_mal_eval": ["label_a"],
+        "stairwell_object_mal_eval_probability": "MALICIOUS_PROBABILITY_LOW",
+    }
+
+
+def test_search_stairwell_data_matches_api():
+    fake_client = FakeStairwellClient()
+    fake_client.hash_data["data-sha256"] = ObjectEventEnrichment(
+        opinions_most_recent=[get_test_opinion()],
+        comments_most_recent=[get_test_comment()],
+        file_size=10,
+        file_hash_sha256="data-sha256",
+        signature=ObjectSignature(
+            x509_certificates=[
+                X509Certificate(
+                    issuer="some_issuer",
+                    earliest_valid_time=datetime.fromisocalendar(2025, 1, 1),
+                    latest_valid_time=datetime.fromisocalendar(2025, 2, 2),
+                ),
+            ],
+            pkcs7_verification_result="VALID",
+        ),
+        sightings_first=datetime.fromisocalendar(2025, 1, 1),
+        sightings_prevalence=[Prevalence(asset_count=2, prevalence=0.1)],
+        verdict_maleval_labels=["label_a", "label_b"],
+        indicators_ips_likely=["1.1.1.1", "2.2.2.2"],
+    )
+    fake_client.hostname_data["data.example"] = HostnameEventEnrichment(
+        opinions_most_recent=[get_test_opinion()],
+        lookup_a_records=[
+            DNSLookupResult(
+                state="NOERROR",
+                address="10.100.100.100",
+                lookup_time=datetime.fromisocalendar(2025, 1, 1),
+            )
+        ],
+    )
+    fake_client.ip_data["2.2.2.2"] = IPEventEnrichment(
+        comments_most_recent=[get_test_comment()],
+        uninteresting_addr=True,
+    )
+    api = stairwelllib.stairwellapi
+    for search_api, search_data, value in (
+        (
+            api.search_stairwell_object_api,
+            api.search_stairwell_object_data,
+            "data-sha256",
+        ),
+        (
+            api.search_stairwell_hostname_api,
+            api.search_stairwell_hostname_data,
+            "data.example",
+        ),
+        (
+            api.search_stairwell_ip_addresses_api,
+            api.search_stairwell_ip_addresses_data,
+            "2.2.2.2",
+        ),
+        (api.search_stairwell_object_api, api.search_stairwell_object_data, "empty"),
+    ):
+        expected = search_api(fake_client, logger, value)
+        res = search_data(fake_client, logger, value)
+        assert res == expected
+        assert list(res) == list(expected)
+
+
+def test_search_stairwell_data_wire_format():
+    data = {
+        "opinionsMostRecent": [
+            {
+                "verdict": "MALICIOUS",
+                "email": "john.malware@escalator.corp",
+                "createTime": "2025-01-07T00:00:00Z",
+                "environment": "OPINION_ENV_ID",
+            }
+        ],
+        "fileHashSha256": "sha256",
+        "fileSize": "12",
+        "fileEntropy": 6.5,
+        "sightingsFirst": "2025-01-01T10:00:00.123456789Z",
+        "signature": {
+            "x509Certificates": [
+                {
+                    "issuer": "some_issuer",
+                    "latestValidTime": "2026-01-01T00:00:00+01:00",
+                }
+            ],
+            "pkcs7VerificationResult": "VALID",
+        },
+        "sightingsPrevalence": [{"assetCount": "3", "prevalence": 0.5}],
+        "verdictMalevalLabels": ["label_a"],
+        "unknownField": {"ignored": True},
+    }
+
+    class DataClient(FakeStairwellClient):
+        def get_object_event_enrichment(self, hash: str) -> ObjectEventEnrichment:
+            return ObjectEventEnrichment.from_dict(data)
+
+        def get_enrichment_data(self, kind: str, value: str) -> dict:
+            return data
+
+    client = DataClient()
+    expected = stairwelllib.stairwellapi.search_stairwell_object_api(
+        client, logger, "sha256"
+    )
+    res = stairwelllib.stairwellapi.search_stairwell_object_data(
+        client, logger, "sha256"
+    )
+    assert res == expected
+    assert list(res) == list(expected)
+    assert res["stairwell_object_size"] == 12
+    assert res["stairwell_object_first_seen_time"] == "2025-01-01T10:00:00.123456+00:00"
+
+
+def test_search_stairwell_data_falls_back_to_models(monkeypatch):
+    def unexpected(*args):
+        raise stairwelllib.records.UnexpectedData(args)
+
+    monkeypatch.setattr(stairwelllib.stairwellapi, "data_to_record", unexpected)
+    fake_client = FakeStairwellClient()
+    fake_client.ip_data["3.3.3.3"] = IPEventEnrichment(uninteresting_addr=True)
+    res = stairwelllib.stairwellapi.search_stairwell_ip_addresses_data(
+        fake_client, logger, "3.3.3.3"
+    )
+    assert res == stairwelllib.stairwellapi.search_stairwell_ip_addresses_api(
+        fake_client, logger, "3.3.3.3"
+    )
+    assert res["stairwell_uninteresting_addr"] == True
+
+    client = ExceptionalStairwellClient()
+    res = stairwelllib.stairwellapi.search_stairwell_object_data(client, logger, "blah")
+    assert res.get("stairwell_status") == "500"
@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+from stairwell_enrichment import InputStairwell, StairwellEnrichmentInput
+from stairwelllib.materialize import collect_indicators, entry_key
+from test_cache import CountingStairwellClient, MISSING, fake_hash
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+class FakeCollectionData:
+    """Stands in for a KV store collection's data endpoint."""
+
+    def __init__(self):
+        self.entries = {}
+        self.saves = 0
+
+    def query(self, query, fields, limit, skip):
+        since = query["stairwell_updated"]["$gte"]
+        fresh = [
+            {"_key": key}
+            for key, entry in sorted(self.entries.items())
+            if entry["stairwell_updated"] >= since
+        ]
+        return fresh[skip : skip + limit]
+
+    def batch_save(self, *documents):
+        self.saves += 1
+        for document in documents:
+            self.entries[document["_key"]] = document
+
+
+class FakeService:
+    def __init__(self, results):
+        self.results = results
+        self.collection = FakeCollectionData()
+        self.kvstore = {"stairwell_enrichments": self}
+        self.data = self.collection
+        self.jobs = self
+        self.confs = {}
+
+    def oneshot(self, query, **params):
+        return io.BytesIO(json.dumps({"results": self.results}).encode())
+
+
+class FakeInput(StairwellEnrichmentInput):
+    def __init__(self, service, client, cache_path):
+        super().__init__()
+        self._service = service
+        self.client = client
+        self.cache_path = cache_path
+
+    def init_command(self, logger):
+        command = InputStairwell(self.service, logger)
+        command.client = self.client
+        command.cache_path = self.cache_path
+        return command
+
+
+def test_collect_indicators():
+    results = [
+        {"sha256": "a", "md5": ["b", "c"], "dest": "1.1.1.1"},
+        {"sha256": "a", "dest": ""},
+    ]
+    indicators = collect_indicators(results, {"object": ["sha256", "md5"], "ip": []})
+    assert indicators == {"object": {"a", "b", "c"}, "ip": set()}
+
+
+def test_input_enriches_stale_indicators_only(tmp_path):
+    # A SHA-256 and an MD5, whose sizes the fake client gives as their lengths.
+    a, b = fake_hash("a"), fake_hash("b")[:32]
+    service = FakeService([{"sha256": a}, {"sha256": b}, {"sha256": MISSING}])
+    client = CountingStairwellClient()
+    script = FakeInput(service, client, str(tmp_path / "cache.sqlite"))
+    parameters = {
+        "search": "index=edr | stats count by sha256",
+        "object_fields": "sha256",
+    }
+
+    script.materialize(parameters, logger)
+    entries = service.collection.entries
+    assert sorted(entries) == sorted(f"object:{h}" for h in (a, b, MISSING))
+    assert entries[entry_key("object", b)]["stairwell_object_size"] == 32
+    assert entries[entry_key("object", b)]["indicator_type"] == "object"
+    assert entries[entry_key("object", MISSING)]["stairwell_status"] == "404"
+
+    # The entries are fresh, so the next run has nothing to look up.
+    client.calls.clear()
+    c = fake_hash("c")
+    service.results.append({"sha256": c})
+    script.materialize(parameters, logger)
+    assert client.calls == {c: 1}
+    assert len(entries) == 4
+
+    # Stale entries aren't refreshed from cached responses older than max_age.
+    client.calls.clear()
+    script.materialize({**parameters, "max_age": "0"}, logger)
+    assert client.calls == {a: 1, b: 1, c: 1, MISSING: 1}
@@ -0,0 +1,77 @@
+import csv
+import io
+import logging
+from stairwell_lookup import StairwellLookup, csv_value
+from stairwelllib.persistentcache import PersistentLookupCache
+from test_cache import CountingStairwellClient, MISSING, fake_hash
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+COLUMNS = "object,stairwell_status,stairwell_object_sha256,stairwell_object_size\n"
+
+
+def run_lookup(lookup: StairwellLookup, text: str):
+    output = io.StringIO()
+    lookup.run(io.StringIO(text), output)
+    return list(csv.DictReader(io.StringIO(output.getvalue())))
+
+
+def test_lookup_resolves_each_distinct_value_once(tmp_path):
+    fake_client = CountingStairwellClient()
+    lookup = StairwellLookup(
+        "object",
+        "object",
+        logger,
+        api=fake_client,
+        concurrency=4,
+        cache_path=str(tmp_path / "cache.sqlite"),
+    )
+    a, b = fake_hash("a"), fake_hash("b")[:32]
+    rows = run_lookup(lookup, COLUMNS + f"{a},,,\n{b},,,\n{a},,,\n,,,\n{MISSING},,,\n")
+
+    assert fake_client.calls == {a: 1, b: 1, MISSING: 1}
+    assert [row["object"] for row in rows] == [a, b, a, "", MISSING]
+    assert [row["stairwell_object_size"] for row in rows] == ["64", "32", "64", "", ""]
+    assert rows[4]["stairwell_status"] == "404"
+    # Only the columns Splunk asked for are written.
+    assert list(rows[0]) == COLUMNS.strip().split(",")
+
+
+def test_lookup_answers_from_shared_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    PersistentLookupCache(path).put("object", "a", {"fileHashSha256": "a"})
+
+    rows = run_lookup(
+        StairwellLookup("object", "object", logger, cache_path=path),
+        COLUMNS + "a,,,\nb,,,\n",
+    )
+    assert rows[0]["stairwell_object_sha256"] == "a"
+    assert rows[1]["stairwell_status"] == "deferred"
+
+
+def test_lookup_leaves_missing_fields_empty(tmp_path):
+    # The fake client's objects have a SHA-256 and size, but no MD5 or file magic.
+    columns = (
+        "object,stairwell_object_sha256,stairwell_object_md5,stairwell_object_magic\n"
+    )
+    lookup = StairwellLookup(
+        "object",
+        "object",
+        logger,
+        api=CountingStairwellClient(),
+        cache_path=str(tmp_path / "cache.sqlite"),
+    )
+    rows = run_lookup(lookup, columns + "a,,,\n")
+    assert rows[0] == {
+        "object": "a",
+        "stairwell_object_sha256": "a",
+        "stairwell_object_md5": "",
+        "stairwell_object_magic": "",
+    }
+
+
+def test_csv_value():
+    assert csv_value(None) == ""
+    assert csv_value(True) == "True"
+    assert csv_value(["x", "y"]) == '["x", "y"]'
+    assert csv_value({"verdict": "BENIGN"}) == '{"verdict": "BENIGN"}'
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+# Modules that only load once a lookup is made, rather than when the command process starts.
+DEFERRED_MODULES = ("stairwell_appapi_client", "pydantic", "urllib3", "asyncio")
+
+# Budget for importing the command module, in milliseconds. Before the API client was loaded
+# lazily, importing it took over twice as long. Can be raised on slow machines.
+IMPORT_BUDGET_MS = float(os.environ.get("STAIRWELL_IMPORT_BUDGET_MS", "300"))
+
+
+def import_times(module: str = "stairwell") -> list:
+    """Imports a module in a fresh interpreter with `python -X importtime`, returning the
+    (self, cumulative) time in microseconds and name of every module loaded along the way.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times.append((int(self_us), int(cumulative_us), name.strip()))
+    return times
+
+
+def test_startup_defers_client_imports():
+    loaded = {name.split(".")[0] for _, _, name in import_times()}
+    assert loaded.isdisjoint(DEFERRED_MODULES)
+
+
+def test_startup_import_time_budget():
+    # The best of a few runs, to leave out noise from the rest of the machine.
+    best = min(
+        next(
+            cumulative for _, cumulative, name in import_times() if name == "stairwell"
+        )
+        for _ in range(3)
+    )
+    assert best / 1000 <= IMPORT_BUDGET_MS, f"importing took {best / 1000:.1f}ms"
+
+
+if __name__ == "__main__":
+    # Reports the slowest imports of the command module, `python -X importtime` style.
+    times = sorted(import_times(), key=lambda t: t[1], reverse=True)
+    print(f"{'self [us]':>10} | {'cumulative':>10} | module")
+    for self_us, cumulative_us, name in times[
+        : int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    ]:
+        print(f"{self_us:>10} | {cumulative_us:>10} | {name}")
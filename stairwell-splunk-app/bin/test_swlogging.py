@@ -0,0 +1,62 @@
+import logging
+import queue
+from stairwelllib import swlogging
+from stairwelllib.pipeline import BatchEnricher, Lookup
+from stairwelllib.stairwellapi import search_stairwell_object_api
+from stairwelllib.swlogging import DeferredQueueHandler, LogSampler
+from test_cache import CountingStairwellClient
+
+
+def test_setup_logging_installs_one_handler(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPLUNK_HOME", str(tmp_path))
+    (tmp_path / "var" / "log" / "splunk").mkdir(parents=True)
+    logger = logging.getLogger(swlogging.LOGGER_NAME)
+    monkeypatch.setattr(logger, "handlers", [])
+
+    assert swlogging.setup_logging() is swlogging.setup_logging()
+    assert len(logger.handlers) == 1
+    assert isinstance(logger.handlers[0], DeferredQueueHandler)
+
+
+def test_deferred_queue_handler_drops_when_full():
+    log_queue = queue.Queue(2)
+    handler = DeferredQueueHandler(log_queue)
+    logger = logging.getLogger("splunk.stairwell.test.queue")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for i in range(5):
+            logger.warning("message %d", i)
+    finally:
+        logger.removeHandler(handler)
+
+    assert handler.dropped == 3
+    record = log_queue.get_nowait()
+    # Formatting is left to the thread writing the log.
+    assert (record.msg, record.args) == ("message %d", (0,))
+
+
+def test_log_sampler():
+    sampler = LogSampler(limit=3, every=10)
+    sampled = [n for n in range(1, 31) if sampler.sample()]
+    assert sampled == [1, 2, 3, 13, 23]
+    assert not any(LogSampler(limit=0, every=0).sample() for _ in range(5))
+
+
+def test_batch_enricher_samples_record_debug(caplog):
+    logger = logging.getLogger("splunk.stairwell.test")
+    enricher = BatchEnricher(
+        CountingStairwellClient(),
+        logger,
+        [Lookup("object", "hash", search_stairwell_object_api)],
+        debug_sampler=LogSampler(limit=2, every=0),
+    )
+    records = [{"hash": "a"} for _ in range(10)]
+
+    with caplog.at_level(logging.DEBUG, logger=logger.name):
+        list(enricher.enrich(records))
+    logged = [r for r in caplog.records if r.msg.startswith("record ")]
+    assert len(logged) == 4
+    # Records are logged as they were at the time.
+    assert logged[0].args == {"hash": "a"}
+    assert "stairwell_object_sha256" in logged[1].args
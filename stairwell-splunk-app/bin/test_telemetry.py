@@ -0,0 +1,107 @@
+import logging
+import pytest
+from stairwell import Stairwell
+from stairwelllib.telemetry import (
+    Histogram,
+    MeasuringStairwellAPI,
+    Telemetry,
+    TelemetrySettings,
+    format_summary,
+    metrics_csv,
+)
+from test_cache import (
+    CountingStairwellClient,
+    FakeClock,
+    FAILING_IP,
+    MISSING,
+    fake_hash,
+)
+
+logger = logging.getLogger("splunk.stairwell.test")
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(bounds=(1, 10, 100))
+    for value in [0.5] * 90 + [5] * 9 + [250]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.percentile(50) == 1
+    assert histogram.percentile(90) == 1
+    assert histogram.percentile(99) == 10
+    assert histogram.percentile(100) == 250
+    assert histogram.summary("x")["x.avg"] == pytest.approx(3.4)
+    assert Histogram().percentile(99) == 0.0
+
+
+def test_measuring_api_counts_lookups_and_errors():
+    clock = FakeClock()
+    telemetry = Telemetry(clock=clock)
+    api = MeasuringStairwellAPI(CountingStairwellClient(), telemetry, "request")
+
+    api.get_enrichment_data("object", "a")
+    api.get_enrichment_data("object", "b")
+    with pytest.raises(Exception):
+        api.get_enrichment_data("object", MISSING)
+    with pytest.raises(Exception):
+        api.get_enrichment_data("ip", FAILING_IP)
+    clock.now = 2.0
+
+    summary = telemetry.summary()
+    assert summary["requests.object"] == 3
+    assert summary["requests.ip"] == 1
+    assert summary["request_errors.404"] == 1
+    assert summary["request_errors.500"] == 1
+    assert summary["request_ms.count"] == 4
+    assert summary["elapsed_seconds"] == 2.0
+
+
+def test_summary_formats():
+    summary = {"lookups.object": 3, "stage.resolve": 0.12345}
+    assert format_summary(summary) == "lookups.object=3 stage.resolve=0.123"
+    assert metrics_csv(summary, timestamp=1700000000).splitlines() == [
+        "metric_timestamp,metric_name,_value",
+        "1700000000.000,stairwell.lookups.object,3",
+        "1700000000.000,stairwell.stage.resolve,0.12345",
+    ]
+
+
+def test_telemetry_settings_from_conf():
+    assert TelemetrySettings.from_conf({}) == TelemetrySettings()
+    settings = TelemetrySettings.from_conf(
+        {"log": "0", "metrics_index": " stairwell_metrics "}
+    )
+    assert settings == TelemetrySettings(log=False, metrics_index="stairwell_metrics")
+
+
+class TelemetryStairwell(Stairwell):
+    def load_telemetry_settings(self) -> TelemetrySettings:
+        return TelemetrySettings()
+
+
+def test_stream_reports_telemetry_once(caplog):
+    fake_client = CountingStairwellClient()
+    command = TelemetryStairwell(client=fake_client, custom_logger=logger)
+    command.object = "hash"
+    command.cache = "none"
+    command.batchsize = 2
+
+    a, b = fake_hash("a"), fake_hash("b")
+    records = [{"hash": h} for h in [a, b, a, MISSING, a]]
+    assert len(list(command.stream(records))) == 5
+    summary = command.telemetry_summary()
+    assert summary["records"] == 5
+    assert summary["batches"] == 3
+    # Looked up once per batch, then served by the cache.
+    assert summary["lookups.object"] == 5
+    assert summary["lookup_errors.404"] == 1
+    assert summary["cache.misses"] == 3
+    assert summary["cache.hits"] == 2
+    assert summary["stage.stream"] >= summary["stage.resolve"]
+
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        command.report_telemetry()
+        command.report_telemetry()
+    reports = [r for r in caplog.records if "telemetry" in r.getMessage()]
+    assert len(reports) == 1
+    assert "records=5" in reports[0].getMessage()